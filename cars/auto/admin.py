@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Auto, Truck, Category, Engine, Transmission
+from .models import (Auto, Truck, Category, Engine, Transmission, ParseJob, FetchState, PriceRun, PriceAggregate,
+                     CatalogStat)
 
 # Register your models here.
 
@@ -7,4 +8,9 @@ admin.site.register(Auto)
 admin.site.register(Truck)
 admin.site.register(Category)
 admin.site.register(Engine)
-admin.site.register(Transmission)
\ No newline at end of file
+admin.site.register(Transmission)
+admin.site.register(ParseJob)
+admin.site.register(FetchState)
+admin.site.register(PriceRun)
+admin.site.register(PriceAggregate)
+admin.site.register(CatalogStat)
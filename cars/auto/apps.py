@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AutoConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auto'
+
+    def ready(self):
+        from . import signals  # noqa: F401
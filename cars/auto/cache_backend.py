@@ -0,0 +1,394 @@
+import logging
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+CLEAR_ALL = '*'
+
+# Состояние общее для всех потоков процесса (Django создаёт экземпляр бэкенда на поток)
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+class LocalTier:
+    """Ограниченный LRU с TTL в памяти процесса. Значения хранятся в pickle, как в LocMemCache."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return MISSING
+            pickled, expires = item
+            if expires is not None and expires <= time.monotonic():
+                del self.data[key]
+                return MISSING
+            self.data.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, timeout):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            self.data[key] = (pickled, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            return self.data.pop(key, None) is not None
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class CircuitBreaker:
+    """После N ошибок подряд перестаёт ходить в Redis на recovery_timeout секунд."""
+
+    def __init__(self, threshold, recovery_timeout):
+        self.threshold = threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            # по истечении паузы пропускаем пробные запросы (half-open)
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.recovery_timeout
+
+    def success(self):
+        with self.lock:
+            recovered = self.opened_at is not None
+            self.failures = 0
+            self.opened_at = None
+            return recovered
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning("Redis недоступен, кэш работает только в памяти процесса")
+                self.opened_at = time.monotonic()
+
+
+class RedisInvalidationBus:
+    """Рассылка ключей для сброса локального уровня между процессами через Redis pub/sub."""
+
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+
+    def publish(self, message):
+        self.client.publish(self.channel, message)
+
+    def listen(self, callback):
+        def run():
+            delay = 1
+            while True:
+                try:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.channel)
+                    delay = 1
+                    for message in pubsub.listen():
+                        if message.get('type') == 'message':
+                            data = message['data']
+                            callback(data.decode() if isinstance(data, bytes) else data)
+                except Exception as e:
+                    # повторные неудачи не спамим в лог
+                    (logger.warning if delay == 1 else logger.debug)("Подписка на сброс кэша прервана: %s", e)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 60)
+
+        threading.Thread(target=run, name=f'cache-invalidation-{self.channel}', daemon=True).start()
+
+
+class SharedState:
+    def __init__(self, options):
+        self.instance_id = uuid.uuid4().hex
+        self.local = LocalTier(options.get('LOCAL_MAX_ENTRIES', 5000))
+        self.breaker = CircuitBreaker(options.get('FAILURE_THRESHOLD', 3), options.get('RECOVERY_TIMEOUT', 30))
+        self.stats = dict.fromkeys(('local_hits', 'remote_hits', 'misses', 'remote_calls', 'remote_errors',
+                                    'short_circuited', 'invalidations_received'), 0)
+        self.remote_time = 0.0
+        self.stats_lock = threading.Lock()
+        # ключи, записанные только локально, пока Redis лежал — удалим их в Redis после восстановления
+        self.dirty = set()
+        self.max_dirty = options.get('MAX_DIRTY_KEYS', 10000)
+        self.bus = None
+        self.bus_lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.stats_lock:
+            self.stats[name] += value
+
+
+class TwoTierCache(BaseCache):
+    """
+    Кэш из двух уровней: LRU/TTL в памяти процесса перед удалённым бэкендом (Redis).
+
+    OPTIONS:
+        REMOTE             — настройки удалённого бэкенда в формате CACHES
+        LOCAL_MAX_ENTRIES  — размер локального уровня
+        LOCAL_TIMEOUT      — сколько секунд держать копию локально, пока Redis жив
+        FALLBACK_TIMEOUT   — сколько держать локально, когда Redis недоступен
+        FAILURE_THRESHOLD, RECOVERY_TIMEOUT — параметры предохранителя
+        CHANNEL            — канал pub/sub для сброса локальных копий в других процессах
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        remote = options['REMOTE']
+        self.remote = import_string(remote['BACKEND'])(remote.get('LOCATION', ''), remote)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.fallback_timeout = options.get('FALLBACK_TIMEOUT', 300)
+        self.channel = options.get('CHANNEL', f'cache-invalidation:{location or "default"}')
+        with _shared_lock:
+            self.shared = _shared.setdefault(location or 'default', SharedState(options))
+
+    # --- служебное ---
+
+    def start_bus(self):
+        """Подписка на канал сброса — при первом обращении к Redis, а не при импорте кэша."""
+        shared = self.shared
+        with shared.bus_lock:
+            if shared.bus is not None:
+                return
+            get_client = getattr(getattr(self.remote, 'client', None), 'get_client', None)
+            if get_client is None:
+                shared.bus = False  # удалённый бэкенд без pub/sub — работаем в одном процессе
+                return
+            shared.bus = RedisInvalidationBus(get_client(write=True), self.channel)
+            shared.bus.listen(self.on_invalidation)
+
+    def on_invalidation(self, message):
+        sender, _, keys = message.partition('\n')
+        if sender == self.shared.instance_id:
+            return
+        self.shared.count('invalidations_received')
+        for key in keys.split('\n'):
+            if key == CLEAR_ALL:
+                self.shared.local.clear()
+            else:
+                self.shared.local.delete(key)
+
+    def publish(self, local_keys):
+        if self.shared.bus and local_keys:
+            self.call_remote(lambda: self.shared.bus.publish('\n'.join([self.shared.instance_id, *local_keys])))
+
+    def call_remote(self, call):
+        """(True, результат) или (False, None), если Redis недоступен. ValueError (нет ключа для incr) пробрасываем."""
+        shared = self.shared
+        if not shared.breaker.allow():
+            shared.count('short_circuited')
+            return False, None
+        if shared.bus is None:
+            self.start_bus()
+        started = time.perf_counter()
+        try:
+            result = call()
+        except ValueError:
+            self.remote_ok()
+            raise
+        except Exception as e:
+            shared.count('remote_errors')
+            shared.breaker.failure()
+            logger.debug("Ошибка удалённого кэша: %s", e)
+            return False, None
+        finally:
+            with shared.stats_lock:
+                shared.stats['remote_calls'] += 1
+                shared.remote_time += time.perf_counter() - started
+        self.remote_ok()
+        return True, result
+
+    def remote_ok(self):
+        if self.shared.breaker.success() or self.shared.dirty:
+            self.flush_dirty()
+
+    def flush_dirty(self):
+        with self.shared.stats_lock:
+            dirty, self.shared.dirty = self.shared.dirty, set()
+        if not dirty:
+            return
+        by_version = {}
+        for key, version in dirty:
+            by_version.setdefault(version, []).append(key)
+        try:
+            for version, keys in by_version.items():
+                self.remote.delete_many(keys, version=version)
+        except Exception:
+            with self.shared.stats_lock:
+                self.shared.dirty |= dirty
+            self.shared.breaker.failure()
+
+    def mark_dirty(self, key, version):
+        with self.shared.stats_lock:
+            if len(self.shared.dirty) < self.shared.max_dirty:
+                self.shared.dirty.add((key, version))
+            else:
+                logger.warning("Слишком много ключей, записанных без Redis; %s не будет сброшен", key)
+
+    def local_ttl(self, timeout, remote_ok):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        limit = self.local_timeout if remote_ok else self.fallback_timeout
+        return limit if timeout is None else min(timeout, limit)
+
+    def stats(self):
+        """Счётчики попаданий/промахов и средняя задержка удалённого уровня в мс."""
+        with self.shared.stats_lock:
+            stats = dict(self.shared.stats)
+            calls = stats['remote_calls']
+            stats['remote_avg_ms'] = round(self.shared.remote_time / calls * 1000, 3) if calls else 0.0
+        stats['circuit_open'] = self.shared.breaker.is_open
+        stats['local_entries'] = len(self.shared.local.data)
+        return stats
+
+    # --- API кэша Django ---
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        value = self.shared.local.get(local_key)
+        if value is not MISSING:
+            self.shared.count('local_hits')
+            return value
+        ok, value = self.call_remote(lambda: self.remote.get(key, MISSING, version=version))
+        if ok and value is not MISSING:
+            self.shared.count('remote_hits')
+            self.shared.local.set(local_key, value, self.local_timeout)
+            return value
+        self.shared.count('misses')
+        return default
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.shared.local.get(self.make_and_validate_key(key, version))
+            if value is MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        self.shared.count('local_hits', len(found))
+        if missing:
+            ok, remote = self.call_remote(lambda: self.remote.get_many(missing, version=version))
+            remote = remote if ok else {}
+            for key, value in remote.items():
+                self.shared.local.set(self.make_and_validate_key(key, version), value, self.local_timeout)
+            found.update(remote)
+            self.shared.count('remote_hits', len(remote))
+            self.shared.count('misses', len(missing) - len(remote))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        ok, _ = self.call_remote(lambda: self.remote.set(key, value, timeout, version=version))
+        if timeout is not None and timeout is not DEFAULT_TIMEOUT and timeout <= 0:
+            self.shared.local.delete(local_key)
+        else:
+            self.shared.local.set(local_key, value, self.local_ttl(timeout, ok))
+        if ok:
+            self.publish([local_key])
+        else:
+            self.mark_dirty(key, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        ok, _ = self.call_remote(lambda: self.remote.set_many(data, timeout, version=version))
+        local_keys = []
+        for key, value in data.items():
+            local_key = self.make_and_validate_key(key, version)
+            self.shared.local.set(local_key, value, self.local_ttl(timeout, ok))
+            local_keys.append(local_key)
+            if not ok:
+                self.mark_dirty(key, version)
+        if ok:
+            self.publish(local_keys)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        ok, added = self.call_remote(lambda: self.remote.add(key, value, timeout, version=version))
+        if not ok:
+            if self.shared.local.get(local_key) is not MISSING:
+                return False
+            self.shared.local.set(local_key, value, self.local_ttl(timeout, False))
+            self.mark_dirty(key, version)
+            return True
+        if added:
+            self.shared.local.set(local_key, value, self.local_ttl(timeout, True))
+            self.publish([local_key])
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        ok, value = self.call_remote(lambda: self.remote.incr(key, delta, version=version))
+        if not ok:
+            value = self.shared.local.get(local_key)
+            if value is MISSING:
+                raise ValueError("Key '%s' not found" % key)
+            value += delta
+            self.mark_dirty(key, version)
+        self.shared.local.set(local_key, value, self.local_ttl(None, ok))
+        if ok:
+            self.publish([local_key])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.local.delete(self.make_and_validate_key(key, version))
+        ok, touched = self.call_remote(lambda: self.remote.touch(key, timeout, version=version))
+        return bool(ok and touched)
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version)
+        deleted = self.shared.local.delete(local_key)
+        ok, remote_deleted = self.call_remote(lambda: self.remote.delete(key, version=version))
+        if ok:
+            self.publish([local_key])
+        else:
+            self.mark_dirty(key, version)
+        return bool(remote_deleted) or deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        local_keys = [self.make_and_validate_key(key, version) for key in keys]
+        for local_key in local_keys:
+            self.shared.local.delete(local_key)
+        ok, _ = self.call_remote(lambda: self.remote.delete_many(keys, version=version))
+        if ok:
+            self.publish(local_keys)
+        else:
+            for key in keys:
+                self.mark_dirty(key, version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def clear(self):
+        self.shared.local.clear()
+        ok, _ = self.call_remote(self.remote.clear)
+        if ok:
+            self.publish([CLEAR_ALL])
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
@@ -0,0 +1,229 @@
+"""
+Потоковые импорт и экспорт каталога в CSV/JSONL (команды import_autos и export_autos).
+
+Экспорт читает авто через .iterator(chunk_size) — память не зависит от размера каталога.
+Импорт пишет пачками bulk_create, каждая в своей транзакции; двигатели, коробки и категории
+ищутся по справочникам в памяти, недостающие создаются один раз.
+"""
+import csv
+import gzip
+import io
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .catalog_stats import StatsDelta
+from .models import Auto, Category, Engine, Transmission
+from .page_cache import bump_catalog
+from .parse_from_drom import unique_slugs
+from .price_history import record_observations
+from .search import index_autos
+from .similar import autos_changed
+
+COLUMNS = ['slug', 'title', 'category', 'engine', 'engine_power', 'transmission', 'transmission_title', 'drive',
+           'fuel_type', 'production_year', 'price', 'mileage', 'color', 'weight', 'trunk_capacity', 'wheel_size',
+           'numbers_of_seats', 'safety_rating', 'url', 'image']
+# Колонки из связанных моделей: колонка → путь для values_list
+RELATED = {
+    'category': 'category__slug',
+    'engine': 'engine__title',
+    'engine_power': 'engine__power',
+    'transmission': 'transmission__transmission_type',
+    'transmission_title': 'transmission__title',
+}
+MODEL_COLUMNS = [column for column in COLUMNS if column not in RELATED]
+# default у этих полей в модели — кортеж choices, при bulk_create подставляем значение сами
+IMPORT_DEFAULTS = {
+    'drive': Auto.drive_choices[0][0],
+    'fuel_type': Auto.fuel_types[0][0],
+    'safety_rating': Auto.safety_ratings[0][0],
+}
+FORMATS = ('csv', 'jsonl')
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    name = path.removesuffix('.gz')
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ValueError(f"Не удалось определить формат {path!r}, укажите --format")
+
+
+@contextmanager
+def open_stream(path, mode):
+    """'-' — stdin/stdout, *.gz — сжатие на лету."""
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        wrapper = io.TextIOWrapper(stream.buffer, encoding='utf-8', newline='')
+        try:
+            yield wrapper
+        finally:
+            # detach() дописывает буфер и отпускает stdin/stdout, не закрывая их
+            wrapper.detach()
+        return
+    if path.endswith('.gz'):
+        stream = gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    else:
+        stream = open(path, mode, encoding='utf-8', newline='')
+    with stream:
+        yield stream
+
+
+class Throughput:
+    """Счётчик строк и строк в секунду; callback(self) вызывается каждые every строк."""
+
+    def __init__(self, callback=None, every=10000):
+        self.callback = callback
+        self.every = every
+        self.rows = 0
+        self.started = time.monotonic()
+        self.reported = 0
+
+    @property
+    def elapsed(self):
+        return max(time.monotonic() - self.started, 1e-6)
+
+    @property
+    def rate(self):
+        return self.rows / self.elapsed
+
+    def add(self, rows=1):
+        self.rows += rows
+        if self.callback and self.rows - self.reported >= self.every:
+            self.reported = self.rows
+            self.callback(self)
+
+
+def export_rows(chunk_size=2000):
+    autos = Auto.objects.order_by('pk').values_list(*[RELATED.get(column, column) for column in COLUMNS])
+    for values in autos.iterator(chunk_size=chunk_size):
+        yield dict(zip(COLUMNS, values))
+
+
+def write_rows(rows, stream, fmt, throughput=None):
+    throughput = throughput or Throughput()
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            throughput.add()
+    else:
+        for row in rows:
+            stream.write(json.dumps(row, ensure_ascii=False))
+            stream.write('\n')
+            throughput.add()
+    return throughput
+
+
+def read_rows(stream, fmt):
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def blank(value):
+    return value is None or value == ''
+
+
+class CatalogImporter:
+    """
+    Загружает строки экспорта пачками. Строка со слагом, который уже есть в каталоге, пропускается —
+    повторный импорт того же файла ничего не дублирует. Без слага он выдаётся как у выгрузки Drom.
+    Валидаторы модели не запускаются: значения только приводятся к типам полей.
+    """
+
+    def __init__(self, batch_size=2000, throughput=None, on_error=None):
+        self.batch_size = batch_size
+        self.throughput = throughput or Throughput()
+        self.on_error = on_error
+        self.created = self.skipped = self.rejected = 0
+        # при дублях в справочнике берём запись с меньшим pk, как bulk_get_or_create
+        self.engines = dict(Engine.objects.order_by('-pk').values_list('title', 'pk'))
+        self.transmissions = dict(Transmission.objects.order_by('-pk').values_list('transmission_type', 'pk'))
+        self.categories = dict(Category.objects.order_by('-pk').values_list('slug', 'pk'))
+
+    def run(self, rows):
+        batch = []
+        for line, row in enumerate(rows, 1):
+            try:
+                batch.append(self.build(row))
+            except (ValueError, ValidationError) as e:
+                self.rejected += 1
+                if self.on_error:
+                    self.on_error(line, e)
+            if len(batch) >= self.batch_size:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        if self.created:
+            # bulk_create не шлёт post_save — кэш списков сбрасываем сами
+            bump_catalog()
+        return self
+
+    def build(self, row):
+        values = dict(IMPORT_DEFAULTS)
+        for column in MODEL_COLUMNS:
+            if not blank(row.get(column)):
+                values[column] = Auto._meta.get_field(column).to_python(row[column])
+        if not values.get('title'):
+            raise ValueError('title is required')
+        values['engine_id'] = self.engine(row)
+        values['transmission_id'] = self.transmission(row)
+        values['category_id'] = self.category(row)
+        return Auto(**values)
+
+    def engine(self, row):
+        title = row.get('engine') or 'Unknown'
+        if title not in self.engines:
+            power = 0 if blank(row.get('engine_power')) else int(row['engine_power'])
+            self.engines[title] = Engine.objects.create(title=title, power=power).pk
+        return self.engines[title]
+
+    def transmission(self, row):
+        transmission_type = str(row.get('transmission') or Transmission.transmission_choices[0][0])
+        if transmission_type not in self.transmissions:
+            self.transmissions[transmission_type] = Transmission.objects.create(
+                transmission_type=transmission_type, title=row.get('transmission_title') or 'Unknown').pk
+        return self.transmissions[transmission_type]
+
+    def category(self, row):
+        slug = row.get('category')
+        if blank(slug):
+            return None
+        if slug not in self.categories:
+            self.categories[slug] = Category.objects.create(title=slug, slug=slug).pk
+        return self.categories[slug]
+
+    def flush(self, batch):
+        if not batch:
+            return
+        with transaction.atomic():
+            unslugged = [auto for auto in batch if not auto.slug]
+            for auto, slug in zip(unslugged, unique_slugs([(auto.title, auto.production_year) for auto in unslugged])):
+                auto.slug = slug
+            taken = set(Auto.objects.filter(slug__in=[auto.slug for auto in batch]).values_list('slug', flat=True))
+            fresh = []
+            for auto in batch:
+                if auto.slug in taken:
+                    self.skipped += 1
+                    continue
+                taken.add(auto.slug)
+                fresh.append(auto)
+            Auto.objects.bulk_create(fresh)
+            index_autos([auto.pk for auto in fresh])
+            record_observations(fresh, created=True)
+            StatsDelta().add_autos(fresh).apply()
+            autos_changed()
+        self.created += len(fresh)
+        self.throughput.add(len(batch))
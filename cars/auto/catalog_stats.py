@@ -0,0 +1,174 @@
+"""
+Сводная статистика каталога: число авто, медианы цены и пробега по категории, топливу, приводу
+и году выпуска. Таблица CatalogStat поддерживается инкрементально — сигналы Auto, пакетная
+запись выгрузки и импорта передают сюда дельты, — а reconcile_stats пересчитывает её целиком.
+Медианы берутся из QuantileSketch: скетчи складываются и вычитаются, так что правка
+или удаление авто уменьшает ровно его вклад.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Auto, CatalogStat, Category
+from .sketch import QuantileSketch
+
+STAT_FIELDS = ('category_id', 'fuel_type', 'drive', 'production_year', 'price', 'mileage')
+DIMENSIONS = [dimension for dimension, _ in CatalogStat.dimension_choices]
+
+
+def stat_values(auto):
+    return {field: getattr(auto, field) for field in STAT_FIELDS}
+
+
+def current_values(pk):
+    """Значения в БД до сохранения — чтобы вычесть старый вклад авто."""
+    rows = Auto.objects.filter(pk=pk).order_by().values(*STAT_FIELDS)[:1]
+    return rows[0] if rows else None
+
+
+def slices(values):
+    key = lambda value: '' if value is None else str(value)[:100]
+    return [
+        (CatalogStat.ALL, ''),
+        (CatalogStat.CATEGORY, key(values['category_id'])),
+        (CatalogStat.FUEL, key(values['fuel_type'])),
+        (CatalogStat.DRIVE, key(values['drive'])),
+        (CatalogStat.YEAR, key(values['production_year'])),
+    ]
+
+
+class StatsDelta:
+    """Накопленные изменения сводки; apply() записывает их за фиксированное число запросов."""
+
+    def __init__(self):
+        self.entries = {}
+
+    def add(self, values, sign=1):
+        for stat_slice in slices(values):
+            entry = self.entries.setdefault(stat_slice, [0, QuantileSketch(), QuantileSketch()])
+            entry[0] += sign
+            # нулевая цена — «не указана», в медиану не идёт; нулевой пробег — новое авто
+            if values['price'] and values['price'] > 0:
+                entry[1].add(values['price'], sign)
+            entry[2].add(values['mileage'], sign)
+
+    def remove(self, values):
+        self.add(values, -1)
+
+    def add_autos(self, autos):
+        for auto in autos:
+            self.add(stat_values(auto))
+        return self
+
+    def apply(self):
+        """Вызывать в транзакции изменения: откатится вместе с ним."""
+        changed = {stat_slice: (count, price, mileage) for stat_slice, (count, price, mileage) in self.entries.items()
+                   if count or price.zeros or price.buckets or mileage.zeros or mileage.buckets}
+        self.entries = {}
+        if not changed:
+            return
+        now = timezone.now()
+        with transaction.atomic(savepoint=False):
+            stats = CatalogStat.objects.select_for_update().filter(
+                dimension__in={dimension for dimension, _ in changed}, key__in={key for _, key in changed}).order_by()
+            existing = {(stat.dimension, stat.key): stat for stat in stats}
+            created, updated, emptied = [], [], []
+            for (dimension, key), (count, price, mileage) in changed.items():
+                stat = existing.get((dimension, key))
+                if stat is None:
+                    stat = CatalogStat(dimension=dimension, key=key)
+                    created.append(stat)
+                elif stat.count + count > 0:
+                    updated.append(stat)
+                else:
+                    emptied.append(stat.pk)
+                    continue
+                stat.count += count
+                stat.price_sketch = merged(stat.price_sketch, price)
+                stat.mileage_sketch = merged(stat.mileage_sketch, mileage)
+                stat.time_update = now
+            CatalogStat.objects.bulk_create([stat for stat in created if stat.count > 0])
+            CatalogStat.objects.bulk_update(updated, ['count', 'price_sketch', 'mileage_sketch', 'time_update'])
+            if emptied:
+                CatalogStat.objects.filter(pk__in=emptied).delete()
+
+
+def merged(data, delta):
+    sketch = QuantileSketch.from_json(data)
+    sketch.merge(delta)
+    return sketch.to_json()
+
+
+def category_removed(category_id):
+    """Категорию удалили: её авто остались без категории (SET_NULL идёт мимо сигналов Auto)."""
+    with transaction.atomic():
+        stat = CatalogStat.objects.select_for_update().filter(
+            dimension=CatalogStat.CATEGORY, key=str(category_id)).first()
+        if stat is None:
+            return
+        target, _ = CatalogStat.objects.select_for_update().get_or_create(dimension=CatalogStat.CATEGORY, key='')
+        target.count += stat.count
+        target.price_sketch = merged(target.price_sketch, QuantileSketch.from_json(stat.price_sketch))
+        target.mileage_sketch = merged(target.mileage_sketch, QuantileSketch.from_json(stat.mileage_sketch))
+        target.save()
+        stat.delete()
+
+
+def reconcile_stats(chunk_size=5000):
+    """
+    Полный пересчёт сводки одним проходом по каталогу. Возвращает (срезов, разошедшихся срезов):
+    расхождение — признак изменений мимо сигналов (bulk update, правки в обход ORM).
+    """
+    full = StatsDelta()
+    for values in Auto.objects.order_by().values(*STAT_FIELDS).iterator(chunk_size=chunk_size):
+        full.add(values)
+    fresh = {
+        stat_slice: CatalogStat(dimension=stat_slice[0], key=stat_slice[1], count=count,
+                                price_sketch=price.to_json(), mileage_sketch=mileage.to_json())
+        for stat_slice, (count, price, mileage) in full.entries.items() if count > 0
+    }
+    with transaction.atomic():
+        old = {(stat.dimension, stat.key): stat for stat in CatalogStat.objects.select_for_update()}
+        drifted = sum(
+            1 for stat_slice in fresh.keys() | old.keys()
+            if stat_slice not in fresh or stat_slice not in old
+            or (old[stat_slice].count, old[stat_slice].price_sketch, old[stat_slice].mileage_sketch)
+            != (fresh[stat_slice].count, fresh[stat_slice].price_sketch, fresh[stat_slice].mileage_sketch)
+        )
+        CatalogStat.objects.all().delete()
+        CatalogStat.objects.bulk_create(fresh.values())
+    return len(fresh), drifted
+
+
+def stats_table(dimensions=None):
+    """{срез: [строки]} только из CatalogStat; названия категорий — одним запросом."""
+    stats = CatalogStat.objects.all()
+    if dimensions:
+        stats = stats.filter(dimension__in=dimensions)
+    stats = list(stats)
+    category_ids = [int(stat.key) for stat in stats if stat.dimension == CatalogStat.CATEGORY and stat.key]
+    categories = dict(Category.objects.filter(pk__in=category_ids).values_list('pk', 'title')) if category_ids else {}
+    labels = {
+        CatalogStat.FUEL: dict(Auto.fuel_types),
+        CatalogStat.DRIVE: dict(Auto.drive_choices),
+    }
+
+    table = {dimension: [] for dimension in (dimensions or DIMENSIONS)}
+    for stat in stats:
+        price = QuantileSketch.from_json(stat.price_sketch)
+        mileage = QuantileSketch.from_json(stat.mileage_sketch)
+        if stat.dimension == CatalogStat.CATEGORY:
+            label = categories.get(int(stat.key), stat.key) if stat.key else 'Без категории'
+        else:
+            label = labels.get(stat.dimension, {}).get(stat.key, stat.key)
+        table[stat.dimension].append({
+            'key': stat.key,
+            'label': label,
+            'count': stat.count,
+            'median_price': price.quantile(0.5),
+            'p25_price': price.quantile(0.25),
+            'p75_price': price.quantile(0.75),
+            'median_mileage': mileage.quantile(0.5),
+        })
+    if CatalogStat.YEAR in table:
+        table[CatalogStat.YEAR].sort(key=lambda row: row['key'], reverse=True)
+    return table
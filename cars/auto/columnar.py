@@ -0,0 +1,190 @@
+"""
+Колоночная выгрузка каталога для аналитики (эндпоинт api/cars/export/ и команда export_columnar).
+
+Строки читаются чанками из values_list().iterator() и транспонируются в колонки; категориальные
+поля кодируются словарём (в колонке — номер значения). Форматы:
+
+* arrow  — Arrow IPC stream, по record batch на чанк (нужен pyarrow), буферы сжаты zstd;
+* ndjson — gzip'нутый NDJSON: первая строка — схема, дальше по строке на чанк
+  {"rows": n, "columns": {...}, "dictionaries": {...}}; в dictionaries только новые значения
+  словарей, их дописывают в конец уже известных.
+"""
+import json
+import zlib
+
+from .models import Auto, Transmission
+
+try:
+    import pyarrow as pa
+except ImportError:  # необязательная зависимость
+    pa = None
+
+INT, FLOAT, STR, DICT, TIMESTAMP = 'int', 'float', 'str', 'dict', 'timestamp'
+# (колонка, путь для values_list, тип)
+COLUMNS = [
+    ('id', 'pk', INT),
+    ('slug', 'slug', STR),
+    ('title', 'title', STR),
+    ('category', 'category__slug', DICT),
+    ('engine', 'engine__title', DICT),
+    ('engine_power', 'engine__power', INT),
+    ('transmission_type', 'transmission__transmission_type', DICT),
+    ('drive', 'drive', DICT),
+    ('fuel_type', 'fuel_type', DICT),
+    ('production_year', 'production_year', INT),
+    ('price', 'price', INT),
+    ('mileage', 'mileage', INT),
+    ('weight', 'weight', INT),
+    ('trunk_capacity', 'trunk_capacity', INT),
+    ('wheel_size', 'wheel_size', INT),
+    ('numbers_of_seats', 'numbers_of_seats', INT),
+    ('safety_rating', 'safety_rating', INT),
+    ('fuel_tank_capacity', 'fuel_tank_capacity', INT),
+    ('review_count', 'review_count', INT),
+    ('avg_score', 'avg_score', FLOAT),
+    ('time_create', 'time_create', TIMESTAMP),
+]
+# Словари с известными значениями заранее: номера самых частых значений стабильны между выгрузками
+KNOWN_VALUES = {
+    'transmission_type': [value for value, _ in Transmission.transmission_choices],
+    'drive': [value for value, _ in Auto.drive_choices],
+    'fuel_type': [value for value, _ in Auto.fuel_types],
+}
+FORMATS = {'arrow': 'application/vnd.apache.arrow.stream', 'ndjson': 'application/x-ndjson'}
+
+
+def available_formats():
+    return [fmt for fmt in FORMATS if fmt != 'arrow' or pa is not None]
+
+
+class Dictionary:
+    """Словарь категориального поля: только растёт, номер значения не меняется."""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.index = {}
+        self.sent = 0
+        for value in values:
+            self.encode(value)
+
+    def encode(self, value):
+        if value is None:
+            return None
+        number = self.index.get(value)
+        if number is None:
+            number = self.index[value] = len(self.values)
+            self.values.append(value)
+        return number
+
+    def take_new(self):
+        new = self.values[self.sent:]
+        self.sent = len(self.values)
+        return new
+
+
+def column_batches(chunk_size=10000, dictionaries=None):
+    """Чанки каталога колонками: (число строк, {колонка: список}); DICT-колонки — номера в dictionaries."""
+    if dictionaries is None:
+        dictionaries = new_dictionaries()
+    rows = Auto.objects.order_by('pk').values_list(*[lookup for _, lookup, _ in COLUMNS]).iterator(
+        chunk_size=chunk_size)
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield len(chunk), transpose(chunk, dictionaries)
+            chunk = []
+    if chunk:
+        yield len(chunk), transpose(chunk, dictionaries)
+
+
+def new_dictionaries():
+    return {name: Dictionary(KNOWN_VALUES.get(name, ())) for name, _, kind in COLUMNS if kind == DICT}
+
+
+def transpose(chunk, dictionaries):
+    columns = {}
+    for (name, _, kind), values in zip(COLUMNS, zip(*chunk)):
+        if kind == DICT:
+            encode = dictionaries[name].encode
+            values = [encode(value) for value in values]
+        elif kind == TIMESTAMP:
+            # микросекунды от эпохи, UTC
+            values = [None if value is None else int(value.timestamp() * 1_000_000) for value in values]
+        columns[name] = list(values)
+    return columns
+
+
+def ndjson_stream(chunk_size=10000, on_batch=None):
+    """gzip-поток байтов; on_batch(число строк) — после каждого чанка."""
+    gzip = zlib.compressobj(6, zlib.DEFLATED, 31)
+    dictionaries = new_dictionaries()
+    schema = {'schema': [{'name': name, 'type': kind} for name, _, kind in COLUMNS]}
+    yield gzip.compress((json.dumps(schema) + '\n').encode())
+    for rows, columns in column_batches(chunk_size, dictionaries):
+        new = {name: values for name, dictionary in dictionaries.items() if (values := dictionary.take_new())}
+        line = json.dumps({'rows': rows, 'columns': columns, 'dictionaries': new},
+                          ensure_ascii=False, separators=(',', ':'))
+        yield gzip.compress((line + '\n').encode())
+        if on_batch:
+            on_batch(rows)
+    yield gzip.flush()
+
+
+class ChunkSink:
+    """Файл для pyarrow, накапливающий записанное до следующей выдачи потоку."""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_schema():
+    types = {INT: pa.int64(), FLOAT: pa.float64(), STR: pa.string(),
+             DICT: pa.dictionary(pa.int32(), pa.string()), TIMESTAMP: pa.timestamp('us', tz='UTC')}
+    return pa.schema([(name, types[kind]) for name, _, kind in COLUMNS])
+
+
+def arrow_stream(chunk_size=10000, on_batch=None):
+    """Arrow IPC stream; словари дописываются дельтами, номера в уже отданных батчах не меняются."""
+    if pa is None:
+        raise RuntimeError('Arrow export needs pyarrow')
+    schema = arrow_schema()
+    dictionaries = new_dictionaries()
+    compression = 'zstd' if pa.Codec.is_available('zstd') else None
+    options = pa.ipc.IpcWriteOptions(compression=compression, emit_dictionary_deltas=True)
+    sink = ChunkSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema, options=options) as writer:
+        for rows, columns in column_batches(chunk_size, dictionaries):
+            arrays = []
+            for field, (name, _, kind) in zip(schema, COLUMNS):
+                if kind == DICT:
+                    arrays.append(pa.DictionaryArray.from_arrays(
+                        pa.array(columns[name], pa.int32()), pa.array(dictionaries[name].values, pa.string())))
+                else:
+                    arrays.append(pa.array(columns[name], field.type))
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            yield sink.drain()
+            if on_batch:
+                on_batch(rows)
+    yield sink.drain()
+
+
+def export_stream(fmt, chunk_size=10000, on_batch=None):
+    stream = arrow_stream if fmt == 'arrow' else ndjson_stream
+    return stream(chunk_size, on_batch)
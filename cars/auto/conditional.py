@@ -0,0 +1,50 @@
+import hashlib
+
+from .fragments import get_versions, version_key
+from .models import Auto
+from .page_cache import CATALOG_VERSION
+from .similar import SIMILAR_VERSION
+
+# Поднять при изменении вёрстки страниц или формата API, чтобы клиенты не получили 304 на старое
+ETAG_VERSION = 2
+
+
+def make_etag(*parts):
+    # слабый: тело может сжиматься или отдаваться потоком, важна только смысловая равнозначность
+    digest = hashlib.md5(':'.join(str(part) for part in (ETAG_VERSION, *parts)).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def viewer(request):
+    """HTML зависит от пользователя (шапка, кнопки правки) и CSRF-токена в формах."""
+    return request.user.pk, request.META.get('CSRF_COOKIE', '')
+
+
+def catalog_generation():
+    # поколение каталога сдвигается любым изменением авто, справочников и отзывов (см. signals)
+    return get_versions([CATALOG_VERSION])[CATALOG_VERSION]
+
+
+def catalog_etag(request, *args, **kwargs):
+    """Списки и поиск: без запросов к БД, только поколение каталога из кэша."""
+    return make_etag('catalog', catalog_generation(), *viewer(request))
+
+
+def api_catalog_etag(request, *args, **kwargs):
+    return make_etag('api', catalog_generation())
+
+
+def auto_etag(request, auto_slug, **kwargs):
+    """
+    Страница авто: один запрос по индексу слага и версии авто, двигателя, коробки, категории
+    и индекса похожих авто (панель соседей меняется вместе с каталогом).
+    """
+    rows = Auto.objects.filter(slug=auto_slug).order_by().values_list(
+        'pk', 'engine_id', 'transmission_id', 'category_id')[:1]
+    if not rows:
+        return None
+    pk, engine_id, transmission_id, category_id = rows[0]
+    keys = [version_key('auto', pk), version_key('engine', engine_id),
+            version_key('transmission', transmission_id), version_key('category', category_id), SIMILAR_VERSION]
+    versions = get_versions(keys)
+    return make_etag('auto', pk, *[versions[key] for key in keys], *viewer(request))
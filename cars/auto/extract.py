@@ -0,0 +1,185 @@
+"""
+Извлечение объявлений из HTML выдачи Drom.
+
+Разбираются только карточки div[data-ftid="bulls-list_bull"], остальная страница (скрипты,
+меню, фильтры) в дерево не попадает или сразу отбрасывается. Бэкенд выбирается при запуске:
+selectolax или lxml, если установлены, иначе BeautifulSoup с SoupStrainer;
+settings.DROM_HTML_PARSER задаёт его явно.
+"""
+from dataclasses import asdict, dataclass
+
+from bs4 import BeautifulSoup, SoupStrainer
+from django.conf import settings
+
+try:
+    import lxml.html
+except ImportError:  # необязательная зависимость
+    lxml = None
+
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:  # необязательная зависимость
+    HTMLParser = None
+
+CARD = 'bulls-list_bull'
+
+# Маппинг значений Дром → Django
+transmission_map = {"АКПП": "0", "механика": "1"}
+fuel_map = {"бензин": "бензин", "дизель": "дизель", "электро": "электро"}
+
+
+@dataclass
+class Listing:
+    """Объявление со страницы выдачи, уже приведённое к значениям полей Auto."""
+    title: str
+    year: int
+    url: str
+    img_url: str | None
+    engine_title: str
+    engine_power: int
+    fuel_type: str
+    transmission_type: str
+    transmission_title: str
+    drive: str
+    mileage: int
+    price: int
+
+    def as_dict(self):
+        return asdict(self)
+
+
+def safe_int(value):
+    value = ''.join(filter(str.isdigit, value))
+    return int(value) if value else 0
+
+
+def parse_drive(value):
+    value = value.lower()
+    if "передн" in value:
+        return "0"
+    if "задн" in value:
+        return "1"
+    if "полн" in value or "4wd" in value or "awd" in value:
+        return "2"
+    return "0"  # дефолт
+
+
+def build_listing(url, title_text, img_url, specs, price_text):
+    """Общая для всех бэкендов часть: сырые строки карточки → Listing."""
+    if ',' in title_text:
+        title, year = title_text.rsplit(',', 1)
+        year = safe_int(year)
+    else:
+        title, year = title_text, 2000
+
+    # Характеристики: объём (мощность), топливо, коробка, привод, пробег
+    engine_title = specs[0].split('(')[0].strip() if specs else "Unknown"
+    engine_power = 0
+    if specs and '(' in specs[0]:
+        engine_power = safe_int(specs[0].split('(')[1].split('л.с.)')[0])
+
+    return Listing(
+        title=title,
+        year=year,
+        url=url,
+        img_url=img_url or None,
+        engine_title=engine_title,
+        engine_power=engine_power,
+        fuel_type=fuel_map.get(specs[1], "бензин") if len(specs) > 1 else "бензин",
+        transmission_type=transmission_map.get(specs[2], "0") if len(specs) > 2 else "0",
+        transmission_title=specs[2] if len(specs) > 2 else "Unknown",
+        drive=parse_drive(specs[3]) if len(specs) > 3 else "0",
+        mileage=safe_int(specs[4]) if len(specs) > 4 else 0,
+        price=safe_int(price_text) if price_text else 0,
+    )
+
+
+class SoupExtractor:
+    """BeautifulSoup + SoupStrainer: в дерево попадают только карточки объявлений."""
+    name = 'bs4'
+    available = True
+
+    def __init__(self):
+        self.strainer = SoupStrainer('div', attrs={'data-ftid': CARD})
+
+    def extract(self, html):
+        soup = BeautifulSoup(html, 'html.parser', parse_only=self.strainer)
+        listings = []
+        for card in soup.find_all('div', attrs={'data-ftid': CARD}):
+            link = card.find('a', attrs={'data-ftid': 'bull_title'})
+            if link is None or not link.get('href'):
+                continue
+            img = card.find('img')
+            price = card.find('span', attrs={'data-ftid': 'bull_price'})
+            specs = [span.get_text().strip()
+                     for span in card.find_all('span', attrs={'data-ftid': 'bull_description-item'})]
+            listings.append(build_listing(link['href'], link.get_text().strip(), img.get('src') if img else None,
+                                          specs, price.get_text() if price else None))
+        return listings
+
+
+class LxmlExtractor:
+    """lxml: дерево строит libxml2, карточки выбираются одним XPath."""
+    name = 'lxml'
+    available = lxml is not None
+
+    def extract(self, html):
+        root = lxml.html.fromstring(html)
+        listings = []
+        for card in root.xpath(f'//div[@data-ftid="{CARD}"]'):
+            link = card.xpath('.//a[@data-ftid="bull_title"][1]')
+            if not link or not link[0].get('href'):
+                continue
+            img = card.xpath('(.//img)[1]/@src')
+            price = card.xpath('(.//span[@data-ftid="bull_price"])[1]')
+            specs = [span.text_content().strip()
+                     for span in card.xpath('.//span[@data-ftid="bull_description-item"]')]
+            listings.append(build_listing(link[0].get('href'), link[0].text_content().strip(),
+                                          img[0] if img else None, specs,
+                                          price[0].text_content() if price else None))
+        return listings
+
+
+class SelectolaxExtractor:
+    """selectolax: самый быстрый разбор, CSS-селекторы по готовому дереву."""
+    name = 'selectolax'
+    available = HTMLParser is not None
+
+    def extract(self, html):
+        tree = HTMLParser(html)
+        listings = []
+        for card in tree.css(f'div[data-ftid="{CARD}"]'):
+            link = card.css_first('a[data-ftid="bull_title"]')
+            href = link.attributes.get('href') if link is not None else None
+            if not href:
+                continue
+            img = card.css_first('img')
+            price = card.css_first('span[data-ftid="bull_price"]')
+            specs = [span.text(deep=True).strip() for span in card.css('span[data-ftid="bull_description-item"]')]
+            listings.append(build_listing(href, link.text(deep=True).strip(),
+                                          img.attributes.get('src') if img is not None else None, specs,
+                                          price.text(deep=True) if price is not None else None))
+        return listings
+
+
+# В порядке предпочтения
+EXTRACTORS = {extractor.name: extractor for extractor in (SelectolaxExtractor, LxmlExtractor, SoupExtractor)}
+
+
+def available_extractors():
+    return [name for name, extractor in EXTRACTORS.items() if extractor.available]
+
+
+def get_extractor(name=None):
+    name = name or getattr(settings, 'DROM_HTML_PARSER', 'auto')
+    if name == 'auto':
+        name = available_extractors()[0]
+    extractor = EXTRACTORS.get(name)
+    if extractor is None or not extractor.available:
+        raise ValueError(f"HTML-бэкенд {name!r} недоступен, есть: {', '.join(available_extractors())}")
+    return extractor()
+
+
+def extract_listings(html, backend=None):
+    """Все объявления со страницы выдачи Drom списком Listing."""
+    return get_extractor(backend).extract(html)
@@ -0,0 +1,117 @@
+from django.db.models import Count, Q
+
+from .models import Auto, Engine, Transmission
+
+
+# Ключ сортировки из запроса → поля для order_by
+SORT_KEYS = {
+    'new': ('-time_create', '-pk'),
+    'tank': ('-trunk_capacity', '-time_create', '-pk'),
+    'year': ('-production_year', '-time_create', '-pk'),
+    'score': ('-max_score', '-time_create', '-pk'),
+    'rating': ('-avg_score', '-time_create', '-pk'),
+    'cheap': ('price', '-time_create', '-pk'),
+    'expensive': ('-price', '-time_create', '-pk'),
+    'mileage': ('mileage', '-time_create', '-pk'),
+}
+
+# Диапазонные фильтры: ?price_min=...&price_max=... → поле модели
+RANGES = {
+    'price': 'price',
+    'mileage': 'mileage',
+    'year': 'production_year',
+    'power': 'engine__power',
+}
+
+
+def parse_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+SAFE_Q = Q(wheel_size__gte=18) | Q(safety_rating__gte=5)
+
+
+class AutoFilter:
+    """
+    Фильтр списка авто по параметрам запроса (drive, transmission, fuel, safe, category, sort)
+    и диапазонам price/mileage/year/power с суффиксами _min и _max.
+    """
+
+    def __init__(self, params):
+        drives = dict(Auto.drive_choices)
+        transmissions = dict(Transmission.transmission_choices)
+        fuels = dict(Auto.fuel_types)
+
+        # Неизвестные значения просто игнорируем
+        self.drive = params.get('drive') if params.get('drive') in drives else None
+        self.transmission = params.get('transmission') if params.get('transmission') in transmissions else None
+        self.fuel = params.get('fuel') if params.get('fuel') in fuels else None
+        self.safe = params.get('safe') == '1'
+        self.category = params.get('category') or None
+        self.sort = params.get('sort') if params.get('sort') in SORT_KEYS else 'new'
+        self.ranges = {}
+        for name in RANGES:
+            low, high = parse_int(params.get(f'{name}_min')), parse_int(params.get(f'{name}_max'))
+            if low is not None or high is not None:
+                self.ranges[name] = (low, high)
+
+    @staticmethod
+    def range_params():
+        return [f'{name}_{edge}' for name in RANGES for edge in ('min', 'max')]
+
+    def range_q(self, field, low, high):
+        condition = Q()
+        if low is not None:
+            condition &= Q(**{f'{field}__gte': low})
+        if high is not None:
+            condition &= Q(**{f'{field}__lte': high})
+        return condition
+
+    def apply(self, queryset):
+        for name, (low, high) in self.ranges.items():
+            if name == 'power':
+                # Мощность — в Engine: двигателей мало, поэтому берём их id подзапросом
+                # и идём в индекс (engine, price), а не в JOIN по всему каталогу
+                engines = Engine.objects.filter(self.range_q('power', low, high)).values('pk')
+                queryset = queryset.filter(engine_id__in=engines)
+            else:
+                queryset = queryset.filter(self.range_q(RANGES[name], low, high))
+        if self.drive is not None:
+            queryset = queryset.filter(drive=self.drive)
+        if self.transmission is not None:
+            queryset = queryset.filter(transmission__transmission_type=self.transmission)
+        if self.fuel is not None:
+            queryset = queryset.filter(fuel_type=self.fuel)
+        if self.safe:
+            queryset = queryset.filter(SAFE_Q)
+        if self.category is not None:
+            queryset = queryset.filter(category__slug=self.category)
+        return queryset
+
+    def sorted(self, queryset):
+        return queryset.order_by(*SORT_KEYS[self.sort])
+
+    def facets(self, queryset, categories):
+        """Счётчики для всех фасетов одним агрегирующим запросом."""
+        aggregates = {'total': Count('pk'), 'safe': Count('pk', filter=SAFE_Q)}
+        for value, _ in Auto.drive_choices:
+            aggregates[f'drive_{value}'] = Count('pk', filter=Q(drive=value))
+        for value, _ in Transmission.transmission_choices:
+            aggregates[f'transmission_{value}'] = Count('pk', filter=Q(transmission__transmission_type=value))
+        for value, _ in Auto.fuel_types:
+            aggregates[f'fuel_{value}'] = Count('pk', filter=Q(fuel_type=value))
+        for cat in categories:
+            aggregates[f'category_{cat.pk}'] = Count('pk', filter=Q(category_id=cat.pk))
+
+        counts = queryset.order_by().aggregate(**aggregates)
+        return {
+            'total': counts['total'],
+            'safe': counts['safe'],
+            'drive': {value: counts[f'drive_{value}'] for value, _ in Auto.drive_choices},
+            'transmission': {value: counts[f'transmission_{value}']
+                             for value, _ in Transmission.transmission_choices},
+            'fuel': {value: counts[f'fuel_{value}'] for value, _ in Auto.fuel_types},
+            'category': {cat.slug: counts[f'category_{cat.pk}'] for cat in categories},
+        }
@@ -0,0 +1,71 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+# Поднять при изменении auto_card.html, чтобы не отдавать фрагменты старой вёрстки
+CARD_TEMPLATE_VERSION = 1
+CARD_TIMEOUT = 60 * 60 * 24
+
+
+def version_key(kind, pk):
+    return f'v:{kind}:{pk}'
+
+
+def bump_version(kind, pk):
+    """Сдвигает версию после коммита: иначе параллельный запрос закэширует ещё не изменённые данные."""
+    def bump():
+        key = version_key(kind, pk)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+    transaction.on_commit(bump)
+
+
+def get_versions(keys):
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # Потерянная версия начинается с текущего времени, а не с нуля — старые фрагменты не оживут
+        for key in missing:
+            cache.add(key, time.time_ns(), None)
+        versions.update(cache.get_many(missing))
+    return versions
+
+
+def card_key(auto, versions, authenticated):
+    return 'card:{}:{}:{}:{}:{}:{}'.format(
+        CARD_TEMPLATE_VERSION, auto.pk,
+        versions.get(version_key('auto', auto.pk)),
+        versions.get(version_key('engine', auto.engine_id)),
+        versions.get(version_key('transmission', auto.transmission_id)),
+        int(authenticated),
+    )
+
+
+def render_auto_cards(autos, request):
+    """Карточки списка: две выборки из кэша на страницу, рендерятся только промахи."""
+    autos = list(autos)
+    if not autos:
+        return ''
+    version_keys = set()
+    for auto in autos:
+        version_keys.update((version_key('auto', auto.pk),
+                             version_key('engine', auto.engine_id),
+                             version_key('transmission', auto.transmission_id)))
+    versions = get_versions(list(version_keys))
+
+    authenticated = request.user.is_authenticated
+    keys = [card_key(auto, versions, authenticated) for auto in autos]
+    cached = cache.get_many(keys)
+    rendered = {}
+    for auto, key in zip(autos, keys):
+        if key not in cached:
+            rendered[key] = render_to_string('auto/auto_card.html', {'auto': auto, 'request': request})
+    if rendered:
+        cache.set_many(rendered, CARD_TIMEOUT)
+        cached.update(rendered)
+    return mark_safe(''.join(cached[key] for key in keys))
@@ -0,0 +1,158 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Переопределяются в settings.DROM_HTTP
+DEFAULTS = {
+    'POOL_HOSTS': 10,           # сколько хостов держат пул соединений
+    'PER_HOST': 8,              # не больше стольких соединений к одному хосту
+    'RATE': 20.0,               # общий бюджет, запросов в секунду на процесс
+    'BURST': 20,
+    'RETRIES': 4,
+    'BACKOFF': 0.5,             # первая пауза, дальше удваивается
+    'BACKOFF_MAX': 30.0,
+    'TIMEOUT': 10,
+    'USER_AGENT': 'Mozilla/5.0 (compatible; AutoProjectBot/1.0)',
+}
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+LATENCY_WINDOW = 1000
+
+
+class RateBudget:
+    """Токен-бакет на все исходящие запросы процесса: rate в секунду, до burst подряд."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.errors = defaultdict(int)
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+        percentile = lambda p: round(latencies[min(len(latencies) - 1, int(len(latencies) * p))], 1) if latencies else 0
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'errors': dict(self.errors),
+            'p50_ms': percentile(0.5),
+            'p95_ms': percentile(0.95),
+            'max_ms': round(latencies[-1], 1) if latencies else 0,
+        }
+
+
+class HttpClient:
+    """
+    Общий HTTP-клиент для всех исходящих запросов выгрузки: keep-alive пул с лимитом соединений
+    на хост, повторы с экспоненциальной паузой и джиттером на 429/5xx и сетевые ошибки,
+    общий бюджет запросов в секунду и метрики задержек и ошибок по хостам.
+    Потокобезопасен: ингестер зовёт его из asyncio.to_thread.
+    """
+
+    def __init__(self, **options):
+        self.options = {**DEFAULTS, **options}
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = self.options['USER_AGENT']
+        # pool_block: лишние потоки ждут свободное соединение вместо открытия нового
+        adapter = HTTPAdapter(pool_connections=self.options['POOL_HOSTS'], pool_maxsize=self.options['PER_HOST'],
+                              pool_block=True, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.budget = RateBudget(self.options['RATE'], self.options['BURST'])
+        self.hosts = defaultdict(HostStats)
+        self.lock = threading.Lock()
+
+    def backoff(self, attempt, response=None):
+        retry_after = response is not None and response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.options['BACKOFF_MAX'])
+        # «full jitter»: параллельные повторы не приходят на сервер одной волной
+        return random.uniform(0, min(self.options['BACKOFF_MAX'], self.options['BACKOFF'] * 2 ** attempt))
+
+    def record(self, host, started, error=None, retry=False):
+        with self.lock:
+            stats = self.hosts[host]
+            stats.requests += 1
+            stats.latencies.append((time.monotonic() - started) * 1000)
+            if error is not None:
+                stats.errors[error] += 1
+            if retry:
+                stats.retries += 1
+
+    def get(self, url, headers=None, timeout=None):
+        """GET с повторами; после исчерпания попыток — последний ответ или исключение requests."""
+        host = urlsplit(url).netloc
+        attempts = self.options['RETRIES'] + 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            self.budget.acquire()
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, headers=headers, timeout=timeout or self.options['TIMEOUT'])
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.record(host, started, error=type(e).__name__, retry=not last)
+                if last:
+                    raise
+                pause = self.backoff(attempt)
+                logger.info("Повтор %s через %.1f с: %s", url, pause, e)
+                time.sleep(pause)
+                continue
+
+            retry = response.status_code in RETRY_STATUSES and not last
+            self.record(host, started, error=response.status_code if response.status_code >= 400 else None,
+                        retry=retry)
+            if not retry:
+                return response
+            pause = self.backoff(attempt, response)
+            logger.info("Повтор %s через %.1f с: HTTP %s", url, pause, response.status_code)
+            response.close()
+            time.sleep(pause)
+
+    def stats(self):
+        with self.lock:
+            return {host: stats.as_dict() for host, stats in self.hosts.items()}
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Клиент процесса: один пул соединений на всех."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient(**getattr(settings, 'DROM_HTTP', {}))
+        return _client
@@ -0,0 +1,295 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+
+import requests
+from asgiref.sync import async_to_sync, sync_to_async
+
+from .http_client import get_client
+from .models import Auto, FetchState
+from .parse_from_drom import listing_hash, parse_listings, save_autos, update_autos
+from .price_history import mark_seen
+
+logger = logging.getLogger(__name__)
+
+# Что лежит в очереди записи
+NEW, UPDATE, PAGE, CHECKPOINT = 'new', 'update', 'page', 'checkpoint'
+DROM_BASE_URL = 'https://auto.drom.ru'
+
+
+class HostLimiter:
+    """Вежливость к одному хосту: не больше N запросов одновременно и пауза между стартами."""
+
+    def __init__(self, per_host, delay):
+        self.semaphore = asyncio.Semaphore(per_host)
+        self.delay = delay
+        self.lock = asyncio.Lock()
+        self.last_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self.lock:
+            wait = self.last_start + self.delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_start = time.monotonic()
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class DromIngester:
+    """
+    Асинхронная выгрузка с Drom: страницы, разбор HTML и фото качаются параллельно,
+    готовые объявления пачками уходят в БД.
+
+    В режиме sync известные объявления не пропускаются, а сверяются по хэшу: изменившиеся
+    обновляются, фото качается заново только при смене его адреса. Страницы выдачи
+    запрашиваются условно (If-None-Match / If-Modified-Since), 304 — страница не менялась.
+
+    run_brands обходит выдачу марок постранично с контрольными точками (см. crawl_brand).
+
+    Запросы идут через общий HttpClient: пул соединений, повторы на 429/5xx и общий бюджет
+    запросов; HostLimiter поверх него держит вежливость этого обхода к хосту.
+    """
+
+    def __init__(self, concurrency=8, per_host=4, host_delay=0.2, batch_size=20, timeout=10, on_progress=None,
+                 sync=False, base_url=None, client=None):
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.host_delay = host_delay
+        self.batch_size = batch_size
+        self.timeout = timeout
+        # on_progress(progress()) и on_checkpoint(brand, state) вызываются в потоке, который пишет в БД
+        self.on_progress = on_progress
+        self.on_checkpoint = None
+        self.sync = sync
+        self.base_url = (base_url or DROM_BASE_URL).rstrip('/')
+        self.client = client or get_client()
+
+    def run(self, urls):
+        """Синхронная точка входа; запись в БД идёт в вызывающем потоке."""
+        return async_to_sync(self.crawl)(list(urls))
+
+    def run_brands(self, brands, checkpoint=None, max_pages=0, on_checkpoint=None):
+        """
+        Обходит выдачу марок; checkpoint — {марка: {"page": следующая страница, "done": bool}}
+        из прошлого запуска, с него обход продолжается.
+        """
+        self.on_checkpoint = on_checkpoint
+        return async_to_sync(self.crawl_brands)(list(brands), dict(checkpoint or {}), max_pages)
+
+    async def crawl(self, urls):
+        return await self.start([self.ingest_page(url) for url in urls])
+
+    async def crawl_brands(self, brands, checkpoint, max_pages):
+        return await self.start([self.crawl_brand(brand, checkpoint.get(brand, {}), max_pages)
+                                 for brand in brands])
+
+    async def start(self, tasks):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.hosts = {}
+        self.queue = asyncio.Queue()
+        self.saved = []
+        self.updated = []
+        self.pages_done = 0
+        self.listings_seen = 0
+        self.unfinished = []
+        self.started = time.monotonic()
+        self.stats = {'not_modified': 0, 'unchanged': 0, 'images': 0}
+
+        writer = asyncio.create_task(self.write_batches())
+        crawl = asyncio.gather(*tasks)
+        # задачи марок ждут записи своих страниц: упавший писатель их не разбудит — снимаем обход
+        done, _ = await asyncio.wait([writer, crawl], return_when=asyncio.FIRST_COMPLETED)
+        if writer in done:
+            crawl.cancel()
+            await asyncio.gather(crawl, return_exceptions=True)
+            writer.result()
+        try:
+            await crawl
+        except BaseException:
+            writer.cancel()
+            raise
+        await self.queue.put(None)
+        await writer
+        progress = self.progress()
+        logger.info("Drom: новых %s, обновлено %s, без изменений %s, страниц 304: %s, скачано фото %s, "
+                    "%.2f стр/с, %.2f объявл/с", len(self.saved), len(self.updated), self.stats['unchanged'],
+                    self.stats['not_modified'], self.stats['images'],
+                    progress['pages_per_sec'], progress['listings_per_sec'])
+        for host, stats in self.client.stats().items():
+            logger.info("HTTP %s: %s", host, stats)
+        return self.saved + self.updated
+
+    def progress(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return {
+            'pages_done': self.pages_done,
+            'listings_seen': self.listings_seen,
+            'saved': len(self.saved) + len(self.updated),
+            'pages_per_sec': round(self.pages_done / elapsed, 2),
+            'listings_per_sec': round(self.listings_seen / elapsed, 2),
+        }
+
+    def page_url(self, brand, page):
+        return f'{self.base_url}/{brand}/' if page == 1 else f'{self.base_url}/{brand}/page{page}/'
+
+    async def crawl_brand(self, brand, state, max_pages):
+        """
+        Страницы выдачи марки по порядку: до пустой страницы, до страницы без новых объявлений
+        (выдача идёт от свежих, вне режима sync дальше только известные) или до max_pages.
+        Контрольная точка пишется после того, как объявления страницы сохранены.
+        """
+        page = state.get('page', 1)
+        done = state.get('done', False)
+        while not done:
+            result = await self.process_page(self.page_url(brand, page))
+            if result is None:
+                # сбой сети: точка — на этой странице, задача завершится FAILED, --resume начнёт с неё
+                self.unfinished.append(brand)
+                written = asyncio.Event()
+                await self.queue.put((CHECKPOINT, brand, {'page': page, 'done': False}, written))
+                await written.wait()
+                return
+            self.pages_done += 1
+            done = (result['listings'] == 0 or (not self.sync and result['new'] == 0)
+                    or (max_pages and page >= max_pages))
+            page += 1
+            # ждём записи страницы: следующая сверяется с уже сохранёнными объявлениями
+            written = asyncio.Event()
+            await self.queue.put((CHECKPOINT, brand, {'page': page, 'done': bool(done)}, written))
+            await written.wait()
+
+    async def fetch(self, url, headers=None):
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(self.per_host, self.host_delay)
+        async with self.semaphore, self.hosts[host]:
+            return await asyncio.to_thread(self.client.get, url, headers=headers, timeout=self.timeout)
+
+    async def report_progress(self):
+        if self.on_progress:
+            await sync_to_async(self.on_progress)(self.progress())
+
+    async def ingest_page(self, url):
+        await self.process_page(url)
+        self.pages_done += 1
+        await self.report_progress()
+
+    async def process_page(self, url):
+        """Возвращает {"listings": объявлений на странице (None при 304), "new": новых} или None при сбое."""
+        headers = await sync_to_async(self.conditional_headers)(url) if self.sync else None
+        try:
+            response = await self.fetch(url, headers)
+            if response.status_code == 304:
+                self.stats['not_modified'] += 1
+                return {'listings': None, 'new': 0}
+            if response.status_code == 404:
+                # за последней страницей выдачи
+                return {'listings': 0, 'new': 0}
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("Не удалось скачать страницу %s: %s", url, e)
+            return None
+
+        records = await asyncio.to_thread(parse_listings, response.text)
+        self.listings_seen += len(records)
+        known = await sync_to_async(self.known_listings)([r.url for r in records])
+        downloads, seen = [], []
+        new = sum(record.url not in known for record in records if record.img_url)
+        for record in records:
+            if not record.img_url:
+                continue
+            if record.url not in known:
+                downloads.append(self.ingest_listing(NEW, record))
+            elif self.sync:
+                pk, content_hash, image_url = known[record.url]
+                if content_hash == listing_hash(record):
+                    self.stats['unchanged'] += 1
+                    seen.append(pk)
+                elif image_url is None or image_url == record.img_url:
+                    # фото то же (или ещё не знаем его адрес) — обновляем поля без скачивания
+                    await self.queue.put((UPDATE, record, None))
+                else:
+                    downloads.append(self.ingest_listing(UPDATE, record))
+        results = await asyncio.gather(*downloads)
+        if seen:
+            # цена не менялась — только продлеваем серии в истории цен
+            await sync_to_async(mark_seen)(seen)
+
+        # Валидаторы запоминаем, только если всё со страницы дошло до БД, иначе 304 спрячет пропущенное
+        if self.sync and all(results):
+            validators = (response.headers.get("ETag", ""), response.headers.get("Last-Modified", ""))
+            if any(validators):
+                await self.queue.put((PAGE, url, validators))
+        return {'listings': len(records), 'new': new}
+
+    async def ingest_listing(self, kind, record):
+        try:
+            response = await self.fetch(record.img_url)
+        except requests.RequestException as e:
+            logger.warning("Не удалось скачать изображение: %s, ошибка: %s", record.img_url, e)
+            return False
+        if response.status_code != 200:
+            return False
+        self.stats['images'] += 1
+        await self.queue.put((kind, record, response.content))
+        return True
+
+    async def write_batches(self):
+        batches = {NEW: [], UPDATE: []}
+        pages, checkpoints = [], []
+        while True:
+            item = await self.queue.get()
+            kind = item[0] if item is not None else None
+            if kind == PAGE:
+                pages.append(item[1:])
+            elif kind == CHECKPOINT:
+                checkpoints.append(item[1:])
+            elif kind is not None:
+                batches[kind].append(item[1:])
+            # контрольная точка сохраняется сразу, вместе с объявлениями своей страницы
+            full = kind == CHECKPOINT or any(len(batch) >= self.batch_size for batch in batches.values())
+            if (full or item is None) and (batches[NEW] or batches[UPDATE] or pages or checkpoints):
+                await self.flush(batches, pages, checkpoints)
+                batches = {NEW: [], UPDATE: []}
+                pages, checkpoints = [], []
+            if item is None:
+                return
+
+    async def flush(self, batches, pages, checkpoints=()):
+        if batches[NEW]:
+            self.saved.extend(await sync_to_async(save_autos)(batches[NEW]))
+        if batches[UPDATE]:
+            self.updated.extend(await sync_to_async(update_autos)(batches[UPDATE]))
+        # Очередь FIFO: объявления страницы записаны раньше её валидаторов
+        if pages:
+            await sync_to_async(self.store_validators)(pages)
+        for brand, state, written in checkpoints:
+            if self.on_checkpoint:
+                await sync_to_async(self.on_checkpoint)(brand, state)
+            written.set()
+        await self.report_progress()
+
+    @staticmethod
+    def known_listings(urls):
+        """{url: (id, content_hash, image_url)} для уже сохранённых объявлений."""
+        return {url: (pk, content_hash, image_url) for url, pk, content_hash, image_url in
+                Auto.objects.filter(url__in=urls).values_list('url', 'pk', 'content_hash', 'image_url')}
+
+    @staticmethod
+    def conditional_headers(url):
+        state = FetchState.objects.filter(url=url).first()
+        headers = {}
+        if state and state.etag:
+            headers['If-None-Match'] = state.etag
+        if state and state.last_modified:
+            headers['If-Modified-Since'] = state.last_modified
+        return headers
+
+    @staticmethod
+    def store_validators(pages):
+        for url, (etag, last_modified) in pages:
+            FetchState.objects.update_or_create(url=url, defaults={'etag': etag, 'last_modified': last_modified})
@@ -0,0 +1,126 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ParseJob
+from .price_history import refresh_price_aggregates
+
+logger = logging.getLogger(__name__)
+
+DROM_URLS = ["https://auto.drom.ru/lexus/"]
+DROM_BRANDS = ["lexus", "mercedes-benz"]
+# Задача RUNNING без контрольных точек дольше этого — воркер умер, её забирает другой
+STALE_AFTER = timedelta(minutes=10)
+
+
+def enqueue_parse(urls=None, sync=False):
+    """
+    Ставит выгрузку с Drom в очередь; выполнит её процесс `manage.py parse_worker`.
+    sync=True — ещё и обновить изменившиеся известные объявления.
+    """
+    urls = list(urls or DROM_URLS)
+    return ParseJob.objects.create(urls=urls, pages_total=len(urls), sync=sync)
+
+
+def enqueue_crawl(brands=None, sync=False, max_pages=0):
+    """Ставит в очередь постраничный обход выдачи марок с контрольными точками."""
+    return ParseJob.objects.create(brands=list(brands or DROM_BRANDS), sync=sync, max_pages=max_pages)
+
+
+def start_crawl(brands=None, sync=False, max_pages=0):
+    """Обход в текущем процессе (crawl_drom): задача создаётся сразу RUNNING, воркеры её не заберут."""
+    now = timezone.now()
+    return ParseJob.objects.create(brands=list(brands or DROM_BRANDS), sync=sync, max_pages=max_pages,
+                                   status=ParseJob.RUNNING, time_start=now, time_heartbeat=now)
+
+
+def is_stale(job):
+    """RUNNING без heartbeat дольше STALE_AFTER — процесс, который её выполнял, умер."""
+    return job.time_heartbeat is None or job.time_heartbeat < timezone.now() - STALE_AFTER
+
+
+def claim_job(job):
+    """Забирает прочитанную задачу, если её прежние status и heartbeat не изменились — иначе её уже взял другой."""
+    now = timezone.now()
+    claimed = ParseJob.objects.filter(pk=job.pk, status=job.status, time_heartbeat=job.time_heartbeat).update(
+        status=ParseJob.RUNNING, time_start=job.time_start or now, time_heartbeat=now)
+    if claimed:
+        job.refresh_from_db()
+    return bool(claimed)
+
+
+def claim_next_job():
+    """
+    Атомарно забирает самую старую задачу из очереди (несколько воркеров не возьмут одну и ту же).
+    Задачи упавшего воркера (RUNNING без heartbeat дольше STALE_AFTER) забираются снова
+    и продолжаются с контрольной точки.
+    """
+    while True:
+        now = timezone.now()
+        stale = Q(status=ParseJob.RUNNING, time_heartbeat__lt=now - STALE_AFTER)
+        job = ParseJob.objects.filter(Q(status=ParseJob.QUEUED) | stale).order_by('pk').first()
+        if job is None:
+            return None
+        # условие на прежние status и heartbeat — чтобы задачу забрал только один воркер
+        if claim_job(job):
+            return job
+
+
+def run_job(job):
+    from .ingest import DromIngester
+
+    # продолженный обход марок досчитывает счётчики прошлых запусков
+    base = (job.pages_done, job.result_count, job.listings_seen) if job.brands else (0, 0, 0)
+
+    def on_progress(progress):
+        ParseJob.objects.filter(pk=job.pk).update(
+            pages_done=base[0] + progress['pages_done'], result_count=base[1] + progress['saved'],
+            listings_seen=base[2] + progress['listings_seen'], pages_per_sec=progress['pages_per_sec'],
+            listings_per_sec=progress['listings_per_sec'], time_heartbeat=timezone.now())
+
+    def on_checkpoint(brand, state):
+        job.checkpoint[brand] = state
+        ParseJob.objects.filter(pk=job.pk).update(checkpoint=job.checkpoint, time_heartbeat=timezone.now())
+
+    try:
+        ingester = DromIngester(on_progress=on_progress, sync=job.sync)
+        if job.brands:
+            autos = ingester.run_brands(job.brands, job.checkpoint, job.max_pages, on_checkpoint=on_checkpoint)
+        else:
+            autos = ingester.run(job.urls)
+    except Exception as e:
+        logger.exception("Parse job #%s failed", job.pk)
+        ParseJob.objects.filter(pk=job.pk).update(status=ParseJob.FAILED, error=str(e),
+                                                  time_finish=timezone.now())
+    else:
+        progress = ingester.progress()
+        # марка, оборванная сбоем сети, не дочитана: FAILED, чтобы crawl_drom --resume принял задачу
+        unfinished = ingester.unfinished
+        ParseJob.objects.filter(pk=job.pk).update(
+            status=ParseJob.FAILED if unfinished else ParseJob.DONE,
+            error=f"Network failure, unfinished brands: {', '.join(unfinished)}" if unfinished else '',
+            result_count=base[1] + len(autos),
+            pages_done=base[0] + progress['pages_done'] if job.brands else len(job.urls),
+            listings_seen=base[2] + progress['listings_seen'], pages_per_sec=progress['pages_per_sec'],
+            listings_per_sec=progress['listings_per_sec'], time_finish=timezone.now())
+        # медианы цен за сегодня и текущую неделю учитывают свежие наблюдения
+        refresh_price_aggregates()
+    job.refresh_from_db()
+    return job
+
+
+def run_worker(poll_interval=2.0, once=False):
+    """Цикл воркера: берёт задачи из таблицы ParseJob, пока очередь не опустеет (once) или вечно."""
+    while True:
+        close_old_connections()
+        job = claim_next_job()
+        if job is not None:
+            run_job(job)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
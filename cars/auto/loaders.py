@@ -0,0 +1,25 @@
+from django.core.paginator import Paginator
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+
+from .models import Auto, Review, Comment
+
+REVIEWS_PER_PAGE = 20
+
+
+def load_auto(slug):
+    """Авто вместе с двигателем, коробкой и категорией — один запрос."""
+    return get_object_or_404(Auto.objects.select_related('engine', 'transmission', 'category'), slug=slug)
+
+
+def load_reviews(auto, page_number=None, per_page=REVIEWS_PER_PAGE):
+    """
+    Страница отзывов с авторами и комментариями (с их авторами) за фиксированное число запросов:
+    COUNT, отзывы + пользователи, комментарии + пользователи.
+    """
+    reviews = (Review.objects.filter(auto=auto)
+               .select_related('user')
+               .prefetch_related(Prefetch('comments',
+                                          queryset=Comment.objects.select_related('user').order_by('pub_date', 'pk')))
+               .order_by('pub_date', 'pk'))
+    return Paginator(reviews, per_page).get_page(page_number)
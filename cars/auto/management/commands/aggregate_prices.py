@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from auto.price_history import refresh_price_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recomputes daily and weekly median prices per category and model'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1,
+                            help='How many days back to recompute, together with the weeks they fall into')
+
+    def handle(self, *args, **options):
+        refresh_price_aggregates(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f"Price aggregates refreshed for {options['days']} day(s)"))
@@ -0,0 +1,60 @@
+import json
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand
+
+from auto.extract import CARD, EXTRACTORS, available_extractors
+
+TESTDATA = Path(__file__).resolve().parents[2] / 'testdata'
+
+
+def full_tree(html):
+    # прежний способ: полное дерево страницы, карточки ищутся в нём
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.find_all('div', attrs={'data-ftid': CARD})
+
+
+class Command(BaseCommand):
+    help = ('Compares HTML extraction backends on saved Drom pages: median parse time and peak Python '
+            'heap per page (allocations inside libxml2/lexbor are not visible to tracemalloc)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', nargs='*', help='HTML files; default: all saved Drom pages in auto/testdata')
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--output', help='Write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        fixtures = [Path(name) for name in options['fixtures']] or sorted(TESTDATA.glob('drom_*.html'))
+        backends = {'bs4-full-tree': full_tree}
+        backends.update({name: EXTRACTORS[name]().extract for name in available_extractors()})
+
+        results = {}
+        for fixture in fixtures:
+            html = fixture.read_text(encoding='utf-8')
+            results[fixture.name] = {'bytes': len(html.encode()), 'backends': {}}
+            self.stdout.write(f"{fixture.name} ({len(html.encode()) // 1024} КБ)")
+            for name, extract in backends.items():
+                parse_ms = self.timed(extract, html, options['repeat'])
+                tracemalloc.start()
+                listings = extract(html)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                results[fixture.name]['backends'][name] = {
+                    'listings': len(listings), 'parse_ms': round(parse_ms, 3), 'peak_kb': round(peak / 1024, 1)}
+                self.stdout.write(f"    {name:<15} {parse_ms:>8.2f} ms  {peak / 1024:>9.1f} КБ  "
+                                  f"объявлений {len(listings)}")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    def timed(self, func, html, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(html)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
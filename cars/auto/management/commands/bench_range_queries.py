@@ -0,0 +1,104 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+
+from auto.filters import AutoFilter
+from auto.models import Auto, Engine, Transmission
+from auto.pagination import fetch_by_ids
+
+# Типичные запросы пользователей: диапазоны + сортировка, первая страница списка
+SCENARIOS = {
+    'price_range': 'price_min=500000&price_max=800000',
+    'price_mileage': 'price_max=700000&mileage_max=50000',
+    'year_price': 'year_min=2018&price_max=1500000',
+    'power': 'power_min=400',
+    'power_price_cheap': 'power_min=250&price_max=2000000&sort=cheap',
+    'year_mileage_cheap': 'year_min=2015&mileage_max=80000&sort=cheap',
+}
+RANGE_INDEXES = ['price_indx', 'mileage_indx', 'year_price_indx', 'engine_time_indx', 'engine_price_indx']
+
+
+class Command(BaseCommand):
+    help = ('Seeds a scratch test database and records query plans and latencies of range filters, '
+            'with and without the range indexes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', help='Write results as JSON to this file')
+
+    def handle(self, *args, **options):
+        # Отдельная тестовая БД: рабочие данные не трогаем
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.seed(options['rows'])
+            results = {'rows': options['rows'], 'vendor': connection.vendor,
+                       'indexed': self.measure(options['repeat'])}
+            self.drop_range_indexes()
+            results['no_indexes'] = self.measure(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for name in SCENARIOS:
+            with_idx, without = results['indexed'][name], results['no_indexes'][name]
+            self.stdout.write(f"{name:<20} {with_idx['page_ms']:>8.2f} ms  {with_idx['count_ms']:>8.2f} ms"
+                              f"   (без индексов {without['page_ms']:.2f} / {without['count_ms']:.2f} ms)")
+            self.stdout.write(f"    {with_idx['plan']}")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+
+    def seed(self, rows, batch_size=5000):
+        rng = random.Random(42)
+        engines = Engine.objects.bulk_create(
+            [Engine(title=f'engine-{i}', power=rng.randint(70, 600)) for i in range(300)])
+        transmissions = Transmission.objects.bulk_create(
+            [Transmission(title=title, transmission_type=value) for value, title in Transmission.transmission_choices])
+        fuels = [value for value, _ in Auto.fuel_types]
+        for start in range(0, rows, batch_size):
+            Auto.objects.bulk_create([
+                Auto(title=f'Bench {i}', slug=f'bench-{i}', engine=rng.choice(engines),
+                     transmission=rng.choice(transmissions), drive=rng.choice('012'), safety_rating=1,
+                     fuel_type=rng.choice(fuels), production_year=rng.randint(1990, 2025),
+                     price=rng.randint(50, 5000) * 1000, mileage=rng.randint(0, 400) * 1000)
+                for i in range(start, min(start + batch_size, rows))
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def drop_range_indexes(self):
+        with connection.schema_editor() as editor:
+            for index in Auto._meta.indexes:
+                if index.name in RANGE_INDEXES:
+                    editor.remove_index(Auto, index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def timed(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def measure(self, repeat):
+        results = {}
+        for name, query in SCENARIOS.items():
+            auto_filter = AutoFilter(QueryDict(query))
+            autos = auto_filter.sorted(auto_filter.apply(Auto.objects.select_related('engine', 'transmission')))
+            ids = autos.values_list('pk', flat=True)
+            # страница так же, как в IdFirstPaginationMixin: id по индексу, затем строки по pk
+            results[name] = {
+                'query': query,
+                'plan': ' | '.join(ids[:10].explain().splitlines()),
+                'page_ms': self.timed(lambda: fetch_by_ids(autos, list(ids[:10])), repeat),
+                'count_ms': self.timed(lambda: ids.count(), repeat),
+            }
+        return results
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from auto.fragments import bump_version
+from auto.models import Auto
+from auto.page_cache import bump_catalog
+from auto.renditions import make_renditions
+
+
+class Command(BaseCommand):
+    help = 'Generates resized JPEG/WebP renditions for existing auto images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Parallel image workers')
+        parser.add_argument('--batch-size', type=int, default=200, help='Rows per bulk_update')
+        parser.add_argument('--force', action='store_true', help='Rebuild renditions that already exist')
+
+    def handle(self, *args, **options):
+        autos = Auto.objects.exclude(image='').exclude(image=None).only('pk', 'image', 'renditions')
+        done = failed = 0
+
+        def build(auto):
+            try:
+                auto.renditions = make_renditions(auto.image.name, storage=auto.image.storage)
+                return auto
+            except OSError as e:
+                self.stderr.write(f'{auto.image.name}: {e}')
+                return None
+
+        # Pillow отпускает GIL при декодировании и ресайзе, так что потоков достаточно
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            batch = []
+            for auto in autos.iterator(chunk_size=options['batch_size']):
+                if options['force'] or not auto.has_renditions():
+                    batch.append(auto)
+                if len(batch) >= options['batch_size']:
+                    done, failed = self.flush(pool, build, batch, done, failed)
+                    batch = []
+            done, failed = self.flush(pool, build, batch, done, failed)
+
+        self.stdout.write(self.style.SUCCESS(f'Built renditions for {done} images, {failed} failed'))
+
+    def flush(self, pool, build, batch, done, failed):
+        built = [auto for auto in pool.map(build, batch) if auto is not None]
+        if built:
+            Auto.objects.bulk_update(built, ['renditions'])
+            # bulk_update не шлёт post_save — карточки и списки со srcset сбрасываем сами
+            for auto in built:
+                bump_version('auto', auto.pk)
+            bump_catalog()
+        return done + len(built), failed + len(batch) - len(built)
@@ -0,0 +1,44 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from auto.similar import SimilarIndex, np
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the similar cars index and writes its memory-mapped snapshot (run after deploys and from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.SIMILAR_INDEX_PATH, help='Snapshot directory')
+        parser.add_argument('--bench', type=int, default=0, metavar='N',
+                            help='Time N single-auto lookups against the loaded snapshot')
+        parser.add_argument('-k', type=int, default=6, help='Neighbours per lookup for --bench')
+
+    def handle(self, *args, **options):
+        if np is None:
+            raise CommandError('The similar cars index needs numpy')
+        started = time.perf_counter()
+        index = SimilarIndex.build()
+        index.save(options['path'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index)} autos in {time.perf_counter() - started:.2f}s -> {options['path']}"))
+
+        if options['bench'] and len(index):
+            started = time.perf_counter()
+            index = SimilarIndex.load(options['path'])
+            self.stdout.write(f'Snapshot loaded in {(time.perf_counter() - started) * 1000:.1f} ms')
+            pks = random.choices(list(index.positions), k=options['bench'])
+            timings = []
+            for pk in pks:
+                started = time.perf_counter()
+                index.neighbours([pk], options['k'])
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(f"Lookup: median {statistics.median(timings):.3f} ms, "
+                              f"p95 {timings[int(len(timings) * 0.95) - 1]:.3f} ms")
+            started = time.perf_counter()
+            index.neighbours(pks[:100], options['k'])
+            self.stdout.write(f'Batch of {len(pks[:100])}: {(time.perf_counter() - started) * 1000:.3f} ms')
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auto.jobs import claim_job, is_stale, run_job, start_crawl
+from auto.models import ParseJob
+
+
+class Command(BaseCommand):
+    help = 'Crawls Drom result pages of the given brands in this process, with resumable checkpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('brands', nargs='*', help='Drom brand slugs, e.g. lexus mercedes-benz')
+        parser.add_argument('--max-pages', type=int, default=0, help='Page limit per brand (0 - no limit)')
+        parser.add_argument('--sync', action='store_true', help='Also update changed known listings')
+        parser.add_argument('--resume', type=int, metavar='JOB_ID', help='Continue an interrupted crawl job')
+
+    def handle(self, *args, **options):
+        if options['resume']:
+            try:
+                job = ParseJob.objects.get(pk=options['resume'])
+            except ParseJob.DoesNotExist:
+                raise CommandError(f"Parse job #{options['resume']} not found")
+            if job.status == ParseJob.DONE:
+                raise CommandError(f'Parse job #{job.pk} is already done')
+            if job.status == ParseJob.RUNNING and not is_stale(job):
+                raise CommandError(f'Parse job #{job.pk} is running in another process')
+            if not claim_job(job):
+                raise CommandError(f'Parse job #{job.pk} was taken by another process')
+        else:
+            job = start_crawl(options['brands'], sync=options['sync'], max_pages=options['max_pages'])
+
+        job = run_job(job)
+        self.stdout.write(f'Parse job #{job.pk}: {job.status}, pages {job.pages_done}, listings {job.listings_seen}, '
+                          f'saved {job.result_count}, {job.pages_per_sec} pages/s, {job.listings_per_sec} listings/s')
+        if job.status == ParseJob.FAILED:
+            raise CommandError(job.error)
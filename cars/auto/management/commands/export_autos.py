@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auto.catalog_io import FORMATS, Throughput, detect_format, export_rows, open_stream, write_rows
+
+
+class Command(BaseCommand):
+    help = 'Streams the whole catalogue to a CSV or JSONL file (.gz compresses, "-" writes to stdout)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Default: by file extension')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at once')
+
+    def handle(self, *args, **options):
+        try:
+            fmt = detect_format(options['path'], options['format'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        # отчёт в stderr: в stdout могут идти сами данные
+        throughput = Throughput(lambda t: self.stderr.write(f'{t.rows} rows, {t.rate:.0f} rows/s'))
+        with open_stream(options['path'], 'w') as stream:
+            write_rows(export_rows(options['chunk_size']), stream, fmt, throughput)
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {throughput.rows} autos in {throughput.elapsed:.1f} s, {throughput.rate:.0f} rows/s'))
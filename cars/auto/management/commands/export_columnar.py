@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auto.catalog_io import Throughput
+from auto.columnar import available_formats, export_stream
+
+
+class Command(BaseCommand):
+    help = ('Writes the catalogue as compressed columnar batches for analytics: Arrow IPC stream '
+            '(needs pyarrow) or gzipped columnar NDJSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['arrow', 'ndjson'],
+                            help='Default: by extension (.arrow, .ndjson.gz), else the best available')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows per batch')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.ndjson.gz')) else
+                                    'arrow' if path.endswith('.arrow') else available_formats()[0])
+        if fmt not in available_formats():
+            raise CommandError(f"Format {fmt} is not available, install pyarrow or use --format ndjson")
+
+        throughput = Throughput(lambda t: self.stdout.write(f'{t.rows} rows, {t.rate:.0f} rows/s'))
+        size = 0
+        with open(path, 'wb') as f:
+            for data in export_stream(fmt, options['chunk_size'], on_batch=throughput.add):
+                f.write(data)
+                size += len(data)
+        self.stdout.write(self.style.SUCCESS(
+            f'Exported {throughput.rows} autos as {fmt} ({size / 1024:.0f} KB) in {throughput.elapsed:.1f} s, '
+            f'{throughput.rate:.0f} rows/s'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auto.catalog_io import FORMATS, CatalogImporter, Throughput, detect_format, open_stream, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Streams autos from a CSV or JSONL file produced by export_autos into the catalogue in batched '
+            'transactions; rows whose slug already exists are skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to read, .gz is decompressed, "-" reads stdin')
+        parser.add_argument('--format', choices=FORMATS, help='Default: by file extension')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk_create transaction')
+
+    def handle(self, *args, **options):
+        try:
+            fmt = detect_format(options['path'], options['format'])
+        except ValueError as e:
+            raise CommandError(e)
+
+        throughput = Throughput(lambda t: self.stdout.write(f'{t.rows} rows, {t.rate:.0f} rows/s'))
+        importer = CatalogImporter(options['batch_size'], throughput,
+                                   on_error=lambda line, e: self.stderr.write(f'Row {line}: {e}'))
+        with open_stream(options['path'], 'r') as stream:
+            importer.run(read_rows(stream, fmt))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.created} autos, skipped {importer.skipped} existing, rejected {importer.rejected} '
+            f'in {throughput.elapsed:.1f} s, {throughput.rate:.0f} rows/s'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from auto.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Runs queued Drom parse jobs in a separate process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait between polls of an empty queue')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when the queue is empty instead of waiting for new jobs')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Parse worker started')
+        run_worker(poll_interval=options['poll_interval'], once=options['once'])
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from auto.review_stats import rebuild_review_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes review_count, avg_score and max_score for every auto'
+
+    def handle(self, *args, **options):
+        updated = rebuild_review_stats()
+        self.stdout.write(self.style.SUCCESS(f'Updated review stats for {updated} autos'))
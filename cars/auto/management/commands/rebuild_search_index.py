@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from auto.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Recreates the full-text search index for all autos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index(options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} autos'))
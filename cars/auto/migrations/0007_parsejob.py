@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0006_auto_mileage_auto_price_auto_url_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParseJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('urls', models.JSONField(default=list, verbose_name='Drom URLs')),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], db_index=True, default='queued', max_length=20, verbose_name='Status')),
+                ('pages_total', models.IntegerField(default=0, verbose_name='Pages total')),
+                ('pages_done', models.IntegerField(default=0, verbose_name='Pages done')),
+                ('result_count', models.IntegerField(default=0, verbose_name='Autos created')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Error')),
+                ('time_create', models.DateTimeField(auto_now_add=True, verbose_name='Creation time')),
+                ('time_start', models.DateTimeField(blank=True, null=True, verbose_name='Start time')),
+                ('time_finish', models.DateTimeField(blank=True, null=True, verbose_name='Finish time')),
+            ],
+            options={
+                'verbose_name': 'Parse job',
+                'verbose_name_plural': 'Parse jobs',
+                'ordering': ['-time_create'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0007_parsejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlugCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base', models.SlugField(max_length=255, unique=True, verbose_name='Base slug')),
+                ('last', models.IntegerField(default=-1, verbose_name='Last suffix')),
+            ],
+            options={
+                'verbose_name': 'Slug counter',
+                'verbose_name_plural': 'Slug counters',
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:23
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Cast, Coalesce
+
+
+def fill_review_stats(apps, schema_editor):
+    Auto = apps.get_model('auto', 'Auto')
+    Review = apps.get_model('auto', 'Review')
+    reviews = Review.objects.filter(auto=OuterRef('pk')).order_by().values('auto')
+    Auto.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(c=Count('pk')).values('c')), 0),
+        score_sum=Coalesce(Subquery(reviews.annotate(s=Sum('score')).values('s')), 0),
+        avg_score=Coalesce(Subquery(reviews.annotate(a=Cast(Sum('score'), FloatField()) / Count('pk')).values('a')),
+                           0.0, output_field=FloatField()),
+        max_score=Coalesce(Subquery(reviews.annotate(m=Max('score')).values('m')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0008_slugcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auto',
+            name='avg_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Average score'),
+        ),
+        migrations.AddField(
+            model_name='auto',
+            name='max_score',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Max score'),
+        ),
+        migrations.AddField(
+            model_name='auto',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Review count'),
+        ),
+        migrations.AddField(
+            model_name='auto',
+            name='score_sum',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Score sum'),
+        ),
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['-max_score', '-time_create'], name='max_score_indx'),
+        ),
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['-avg_score', '-time_create'], name='avg_score_indx'),
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0009_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auto',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Image renditions'),
+        ),
+    ]
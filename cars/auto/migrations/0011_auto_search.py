@@ -0,0 +1,67 @@
+# Полнотекстовый индекс каталога: FTS5 на SQLite, tsvector + GIN на PostgreSQL.
+# Другие бэкенды ищут через icontains (см. auto/search.py).
+
+from django.db import migrations
+
+SQLITE_CREATE = ("CREATE VIRTUAL TABLE IF NOT EXISTS auto_search "
+                 "USING fts5(title, engine, transmission, category, tokenize='unicode61')")
+SQLITE_FILL = """
+INSERT INTO auto_search (rowid, title, engine, transmission, category)
+SELECT a.id, coalesce(a.title, ''), coalesce(e.title, ''), coalesce(t.title, ''), coalesce(c.title, '')
+FROM {auto} a
+LEFT JOIN {engine} e ON e.id = a.engine_id
+LEFT JOIN {transmission} t ON t.id = a.transmission_id
+LEFT JOIN {category} c ON c.id = a.category_id
+"""
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS auto_search ("
+    "auto_id bigint PRIMARY KEY REFERENCES {auto}(id) ON DELETE CASCADE, document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS auto_search_document_idx ON auto_search USING GIN (document)",
+]
+POSTGRES_FILL = """
+INSERT INTO auto_search (auto_id, document)
+SELECT a.id,
+       setweight(to_tsvector('simple', coalesce(a.title, '')), 'A') ||
+       setweight(to_tsvector('simple', coalesce(e.title, '')), 'B') ||
+       setweight(to_tsvector('simple', coalesce(t.title, '')), 'B') ||
+       setweight(to_tsvector('simple', coalesce(c.title, '')), 'C')
+FROM {auto} a
+LEFT JOIN {engine} e ON e.id = a.engine_id
+LEFT JOIN {transmission} t ON t.id = a.transmission_id
+LEFT JOIN {category} c ON c.id = a.category_id
+"""
+
+
+def table_names(apps):
+    return {name.lower(): apps.get_model('auto', name)._meta.db_table
+            for name in ('Auto', 'Engine', 'Transmission', 'Category')}
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    tables = table_names(apps)
+    if vendor == 'sqlite':
+        statements = [SQLITE_CREATE, SQLITE_FILL.format(**tables)]
+    elif vendor == 'postgresql':
+        statements = [sql.format(**tables) for sql in POSTGRES_CREATE] + [POSTGRES_FILL.format(**tables)]
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql, params=None)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute("DROP TABLE IF EXISTS auto_search", params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0010_auto_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
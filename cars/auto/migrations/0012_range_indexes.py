@@ -0,0 +1,37 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0011_auto_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['price', '-time_create'], name='price_indx'),
+        ),
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['mileage', 'production_year', 'price'], name='mileage_indx'),
+        ),
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['production_year', 'price'], name='year_price_indx'),
+        ),
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['engine', '-time_create'], name='engine_time_indx'),
+        ),
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['engine', 'price', '-time_create'], name='engine_price_indx'),
+        ),
+        migrations.AddIndex(
+            model_name='engine',
+            index=models.Index(fields=['power'], name='engine_power_indx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0012_range_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FetchState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500, unique=True, verbose_name='URL')),
+                ('etag', models.CharField(blank=True, default='', max_length=255, verbose_name='ETag')),
+                ('last_modified', models.CharField(blank=True, default='', max_length=64, verbose_name='Last-Modified')),
+                ('time_checked', models.DateTimeField(auto_now=True, verbose_name='Check time')),
+            ],
+            options={
+                'verbose_name': 'Fetch state',
+                'verbose_name_plural': 'Fetch states',
+            },
+        ),
+        migrations.AddField(
+            model_name='auto',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Content hash'),
+        ),
+        migrations.AddField(
+            model_name='auto',
+            name='image_url',
+            field=models.URLField(blank=True, editable=False, max_length=500, null=True, verbose_name='Drom image URL'),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='sync',
+            field=models.BooleanField(default=False, verbose_name='Update known listings'),
+        ),
+    ]
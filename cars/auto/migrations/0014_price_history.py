@@ -0,0 +1,66 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_price_runs(apps, schema_editor):
+    # Текущая цена каждого авто — первая серия истории
+    Auto = apps.get_model('auto', 'Auto')
+    PriceRun = apps.get_model('auto', 'PriceRun')
+    autos = Auto.objects.values_list('pk', 'price', 'mileage', 'time_create', 'time_update')
+    runs = []
+    for pk, price, mileage, time_create, time_update in autos.iterator(chunk_size=2000):
+        runs.append(PriceRun(auto_id=pk, price=price, mileage=mileage, since=time_create, last_seen=time_update))
+        if len(runs) >= 2000:
+            PriceRun.objects.bulk_create(runs)
+            runs = []
+    PriceRun.objects.bulk_create(runs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0013_listing_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'day'), ('week', 'week')], max_length=10, verbose_name='Period')),
+                ('kind', models.CharField(choices=[('category', 'category'), ('model', 'model')], max_length=10, verbose_name='Group kind')),
+                ('key', models.CharField(max_length=255, verbose_name='Category slug or model')),
+                ('start', models.DateField(verbose_name='Period start')),
+                ('median', models.IntegerField(verbose_name='Median price')),
+                ('count', models.IntegerField(verbose_name='Autos')),
+            ],
+            options={
+                'verbose_name': 'Price aggregate',
+                'verbose_name_plural': 'Price aggregates',
+                'ordering': ['start'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'kind', 'key', 'start'), name='price_aggregate_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.IntegerField(verbose_name='Price')),
+                ('mileage', models.IntegerField(verbose_name='Mileage')),
+                ('since', models.DateTimeField(verbose_name='Since')),
+                ('until', models.DateTimeField(blank=True, null=True, verbose_name='Until')),
+                ('last_seen', models.DateTimeField(verbose_name='Last seen')),
+                ('observations', models.IntegerField(default=1, verbose_name='Observations')),
+                ('auto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_runs', to='auto.auto', verbose_name='Auto')),
+            ],
+            options={
+                'verbose_name': 'Price run',
+                'verbose_name_plural': 'Price runs',
+                'ordering': ['since'],
+                'indexes': [models.Index(fields=['auto', 'since'], name='price_run_auto_indx'), models.Index(fields=['since', 'until'], name='price_run_period_indx')],
+            },
+        ),
+        migrations.RunPython(seed_price_runs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0014_price_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parsejob',
+            name='brands',
+            field=models.JSONField(blank=True, default=list, verbose_name='Drom brands'),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='checkpoint',
+            field=models.JSONField(blank=True, default=dict, verbose_name='Checkpoint'),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='listings_per_sec',
+            field=models.FloatField(default=0, verbose_name='Listings per second'),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='listings_seen',
+            field=models.IntegerField(default=0, verbose_name='Listings seen'),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='max_pages',
+            field=models.IntegerField(default=0, verbose_name='Max pages per brand (0 - no limit)'),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='pages_per_sec',
+            field=models.FloatField(default=0, verbose_name='Pages per second'),
+        ),
+        migrations.AddField(
+            model_name='parsejob',
+            name='time_heartbeat',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Heartbeat'),
+        ),
+        migrations.AlterField(
+            model_name='parsejob',
+            name='urls',
+            field=models.JSONField(blank=True, default=list, verbose_name='Drom URLs'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+from auto.sketch import QuantileSketch
+
+
+def seed_catalog_stats(apps, schema_editor):
+    # Первичная сводка одним проходом; дальше её ведут сигналы и reconcile_stats
+    Auto = apps.get_model('auto', 'Auto')
+    CatalogStat = apps.get_model('auto', 'CatalogStat')
+    stats = {}
+    fields = ('category_id', 'fuel_type', 'drive', 'production_year', 'price', 'mileage')
+    for values in Auto.objects.order_by().values(*fields).iterator(chunk_size=5000):
+        for dimension, value in (('all', ''), ('category', values['category_id']), ('fuel_type', values['fuel_type']),
+                                 ('drive', values['drive']), ('year', values['production_year'])):
+            key = '' if value is None else str(value)[:100]
+            entry = stats.setdefault((dimension, key), [0, QuantileSketch(), QuantileSketch()])
+            entry[0] += 1
+            if values['price'] and values['price'] > 0:
+                entry[1].add(values['price'])
+            entry[2].add(values['mileage'])
+    CatalogStat.objects.bulk_create([
+        CatalogStat(dimension=dimension, key=key, count=count,
+                    price_sketch=price.to_json(), mileage_sketch=mileage.to_json())
+        for (dimension, key), (count, price, mileage) in stats.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0015_crawl_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('all', 'all'), ('category', 'category'), ('fuel_type', 'fuel type'), ('drive', 'drive'), ('year', 'year')], max_length=20, verbose_name='Dimension')),
+                ('key', models.CharField(blank=True, max_length=100, verbose_name='Key')),
+                ('count', models.IntegerField(default=0, verbose_name='Autos')),
+                ('price_sketch', models.JSONField(default=dict, verbose_name='Price sketch')),
+                ('mileage_sketch', models.JSONField(default=dict, verbose_name='Mileage sketch')),
+                ('time_update', models.DateTimeField(auto_now=True, verbose_name='Update time')),
+            ],
+            options={
+                'verbose_name': 'Catalog stat',
+                'verbose_name_plural': 'Catalog stats',
+                'ordering': ['dimension', 'key'],
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='catalog_stat_unique')],
+            },
+        ),
+        migrations.RunPython(seed_catalog_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auto', '0016_catalog_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auto',
+            index=models.Index(fields=['time_update'], name='time_update_indx'),
+        ),
+    ]
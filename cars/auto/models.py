@@ -17,6 +17,7 @@ class Engine(models.Model):
     class Meta:
         verbose_name = 'Engine'
         verbose_name_plural = 'Engines'
+        indexes = [models.Index(fields=['power'], name='engine_power_indx')]
 
 
 class Transmission(models.Model):
@@ -125,6 +126,16 @@ class Auto(models.Model):
     price = models.IntegerField(default=0, verbose_name="Price")
     mileage = models.IntegerField(default=0, verbose_name="Mileage")
     url = models.URLField(max_length=500, null=True, blank=True, verbose_name="Drom URL")
+    # Для инкрементальной синхронизации с Drom (см. ingest.py): хэш полей объявления и адрес фото
+    content_hash = models.CharField(max_length=64, blank=True, default='', editable=False, verbose_name='Content hash')
+    image_url = models.URLField(max_length=500, null=True, blank=True, editable=False, verbose_name='Drom image URL')
+    # Агрегаты по отзывам, поддерживаются инкрементально (см. review_stats.py)
+    review_count = models.IntegerField(default=0, editable=False, verbose_name='Review count')
+    score_sum = models.IntegerField(default=0, editable=False, verbose_name='Score sum')
+    avg_score = models.FloatField(default=0, editable=False, verbose_name='Average score')
+    max_score = models.IntegerField(default=0, editable=False, verbose_name='Max score')
+    # Уменьшенные копии фото (см. renditions.py)
+    renditions = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Image renditions')
 
 
     def __str__(self):
@@ -135,12 +146,55 @@ class Auto(models.Model):
         verbose_name_plural = 'Autos'
         ordering = ['-time_create']
         indexes = [
-            models.Index(fields=['-time_create'], name='time_create_indx')
+            models.Index(fields=['-time_create'], name='time_create_indx'),
+            models.Index(fields=['-max_score', '-time_create'], name='max_score_indx'),
+            models.Index(fields=['-avg_score', '-time_create'], name='avg_score_indx'),
+            # Диапазоны цены/пробега/года и мощности (через engine_id) — см. filters.RANGES.
+            # Страница выбирается по id, поэтому индексы покрывают и фильтр, и сортировку
+            models.Index(fields=['price', '-time_create'], name='price_indx'),
+            models.Index(fields=['mileage', 'production_year', 'price'], name='mileage_indx'),
+            models.Index(fields=['production_year', 'price'], name='year_price_indx'),
+            models.Index(fields=['engine', '-time_create'], name='engine_time_indx'),
+            models.Index(fields=['engine', 'price', '-time_create'], name='engine_price_indx'),
+            # Догонка индекса похожих авто (similar.py): изменённые после прошлой сверки
+            models.Index(fields=['time_update'], name='time_update_indx'),
         ]
 
     def get_absolute_url(self):
         return reverse('main_page')
 
+    def has_renditions(self):
+        return bool(self.image) and self.renditions.get('source') == self.image.name
+
+    def srcset(self, fmt):
+        if not self.has_renditions():
+            return ''
+        entries = list(self.renditions.get(fmt, []))
+        if fmt == 'jpeg':
+            entries.append([self.renditions['width'], self.image.name])
+        return ', '.join(f'{self.image.storage.url(name)} {width}w' for width, name in entries)
+
+    @property
+    def jpeg_srcset(self):
+        return self.srcset('jpeg')
+
+    @property
+    def webp_srcset(self):
+        return self.srcset('webp')
+
+
+
+class SlugCounter(models.Model):
+    """Последний выданный числовой суффикс для базового слага (0 — слаг без суффикса)."""
+    base = models.SlugField(max_length=255, unique=True, verbose_name='Base slug')
+    last = models.IntegerField(default=-1, verbose_name='Last suffix')
+
+    def __str__(self):
+        return f'{self.base}: {self.last}'
+
+    class Meta:
+        verbose_name = 'Slug counter'
+        verbose_name_plural = 'Slug counters'
 
 
 class Truck(Auto):
@@ -180,3 +234,141 @@ class Comment(models.Model):
         verbose_name = 'Comment'
         verbose_name_plural = 'Comments'
 
+
+
+class ParseJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    status_choices = ((QUEUED, 'queued'),
+                      (RUNNING, 'running'),
+                      (DONE, 'done'),
+                      (FAILED, 'failed'))
+    urls = models.JSONField(default=list, blank=True, verbose_name='Drom URLs')
+    # Обход марок постранично (вместо списка urls) и его контрольные точки: {марка: {"page", "done"}}
+    brands = models.JSONField(default=list, blank=True, verbose_name='Drom brands')
+    checkpoint = models.JSONField(default=dict, blank=True, verbose_name='Checkpoint')
+    max_pages = models.IntegerField(default=0, verbose_name='Max pages per brand (0 - no limit)')
+    status = models.CharField(max_length=20, choices=status_choices, default=QUEUED, db_index=True,
+                              verbose_name='Status')
+    pages_total = models.IntegerField(default=0, verbose_name='Pages total')
+    pages_done = models.IntegerField(default=0, verbose_name='Pages done')
+    result_count = models.IntegerField(default=0, verbose_name='Autos created')
+    sync = models.BooleanField(default=False, verbose_name='Update known listings')
+    listings_seen = models.IntegerField(default=0, verbose_name='Listings seen')
+    pages_per_sec = models.FloatField(default=0, verbose_name='Pages per second')
+    listings_per_sec = models.FloatField(default=0, verbose_name='Listings per second')
+    error = models.TextField(blank=True, default='', verbose_name='Error')
+    time_create = models.DateTimeField(auto_now_add=True, verbose_name='Creation time')
+    time_start = models.DateTimeField(null=True, blank=True, verbose_name='Start time')
+    time_finish = models.DateTimeField(null=True, blank=True, verbose_name='Finish time')
+    # Воркер обновляет при каждой контрольной точке; застывшая задача снова попадает в очередь
+    time_heartbeat = models.DateTimeField(null=True, blank=True, verbose_name='Heartbeat')
+
+    def __str__(self):
+        return f'Parse job #{self.pk} ({self.status})'
+
+    class Meta:
+        verbose_name = 'Parse job'
+        verbose_name_plural = 'Parse jobs'
+        ordering = ['-time_create']
+
+
+class FetchState(models.Model):
+    """Валидаторы последнего ответа страницы выдачи для условных запросов (ETag / Last-Modified)."""
+    url = models.URLField(max_length=500, unique=True, verbose_name='URL')
+    etag = models.CharField(max_length=255, blank=True, default='', verbose_name='ETag')
+    last_modified = models.CharField(max_length=64, blank=True, default='', verbose_name='Last-Modified')
+    time_checked = models.DateTimeField(auto_now=True, verbose_name='Check time')
+
+    def __str__(self):
+        return self.url
+
+    class Meta:
+        verbose_name = 'Fetch state'
+        verbose_name_plural = 'Fetch states'
+
+
+class PriceRun(models.Model):
+    """
+    История цены и пробега одного авто, сжатая по сериям: новая строка появляется только при изменении,
+    повторные наблюдения того же значения лишь сдвигают last_seen и увеличивают observations.
+    """
+    auto = models.ForeignKey('Auto', on_delete=models.CASCADE, related_name='price_runs', verbose_name='Auto')
+    price = models.IntegerField(verbose_name='Price')
+    mileage = models.IntegerField(verbose_name='Mileage')
+    since = models.DateTimeField(verbose_name='Since')
+    # NULL — текущая серия
+    until = models.DateTimeField(null=True, blank=True, verbose_name='Until')
+    last_seen = models.DateTimeField(verbose_name='Last seen')
+    observations = models.IntegerField(default=1, verbose_name='Observations')
+
+    def __str__(self):
+        return f'{self.auto_id}: {self.price} since {self.since:%Y-%m-%d}'
+
+    class Meta:
+        verbose_name = 'Price run'
+        verbose_name_plural = 'Price runs'
+        ordering = ['since']
+        indexes = [
+            models.Index(fields=['auto', 'since'], name='price_run_auto_indx'),
+            models.Index(fields=['since', 'until'], name='price_run_period_indx'),
+        ]
+
+
+class PriceAggregate(models.Model):
+    """Медиана цены за день или неделю по категории или модели (названию авто); считается заранее."""
+    DAY = 'day'
+    WEEK = 'week'
+    period_choices = ((DAY, 'day'), (WEEK, 'week'))
+    CATEGORY = 'category'
+    MODEL = 'model'
+    kind_choices = ((CATEGORY, 'category'), (MODEL, 'model'))
+    period = models.CharField(max_length=10, choices=period_choices, verbose_name='Period')
+    kind = models.CharField(max_length=10, choices=kind_choices, verbose_name='Group kind')
+    key = models.CharField(max_length=255, verbose_name='Category slug or model')
+    start = models.DateField(verbose_name='Period start')
+    median = models.IntegerField(verbose_name='Median price')
+    count = models.IntegerField(verbose_name='Autos')
+
+    def __str__(self):
+        return f'{self.kind} {self.key} {self.period} {self.start}: {self.median}'
+
+    class Meta:
+        verbose_name = 'Price aggregate'
+        verbose_name_plural = 'Price aggregates'
+        ordering = ['start']
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'kind', 'key', 'start'], name='price_aggregate_unique'),
+        ]
+
+
+class CatalogStat(models.Model):
+    """
+    Сводка каталога по одному срезу (категория, топливо, привод, год выпуска или весь каталог):
+    число авто и скетчи цены и пробега для медиан. Поддерживается инкрементально, см. catalog_stats.py.
+    """
+    ALL = 'all'
+    CATEGORY = 'category'
+    FUEL = 'fuel_type'
+    DRIVE = 'drive'
+    YEAR = 'year'
+    dimension_choices = ((ALL, 'all'), (CATEGORY, 'category'), (FUEL, 'fuel type'), (DRIVE, 'drive'), (YEAR, 'year'))
+    dimension = models.CharField(max_length=20, choices=dimension_choices, verbose_name='Dimension')
+    key = models.CharField(max_length=100, blank=True, verbose_name='Key')
+    count = models.IntegerField(default=0, verbose_name='Autos')
+    price_sketch = models.JSONField(default=dict, verbose_name='Price sketch')
+    mileage_sketch = models.JSONField(default=dict, verbose_name='Mileage sketch')
+    time_update = models.DateTimeField(auto_now=True, verbose_name='Update time')
+
+    def __str__(self):
+        return f'{self.dimension} {self.key}: {self.count}'
+
+    class Meta:
+        verbose_name = 'Catalog stat'
+        verbose_name_plural = 'Catalog stats'
+        ordering = ['dimension', 'key']
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='catalog_stat_unique'),
+        ]
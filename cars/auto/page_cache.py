@@ -0,0 +1,41 @@
+import hashlib
+
+from django.core.cache import cache
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .fragments import bump_version, get_versions, version_key
+
+PAGE_TIMEOUT = 60 * 60
+CATALOG_VERSION = version_key('catalog', 'all')
+
+
+def bump_catalog():
+    """Новое поколение каталога: все закэшированные списки становятся недоступны по ключу."""
+    bump_version('catalog', 'all')
+
+
+class CatalogPageCacheMixin:
+    """
+    Кэширует содержимое страницы списка (без base.html) по поколению каталога и полному URL.
+    Шапка с логином и CSRF-токеном рендерится на каждый запрос, поэтому одно закэшированное
+    содержимое безопасно отдавать разным пользователям.
+    """
+    page_template_name = 'auto/cached_page.html'
+    page_cache_timeout = PAGE_TIMEOUT
+
+    def get_page_cache_key(self):
+        generation = get_versions([CATALOG_VERSION])[CATALOG_VERSION]
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        return f'page:{generation}:{type(self).__name__}:{path}'
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_page_cache_key()
+        content = cache.get(key)
+        if content is None:
+            self.object_list = self.get_queryset()
+            context = self.get_context_data()
+            content = render_to_string(self.get_template_names(), context, request)
+            cache.set(key, content, self.page_cache_timeout)
+        return render(request, self.page_template_name, {'page_content': mark_safe(content)})
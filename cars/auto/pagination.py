@@ -0,0 +1,57 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+
+
+def encode_cursor(row):
+    time_create, pk = (row['time_create'], row['pk']) if isinstance(row, dict) else (row.time_create, row.pk)
+    raw = f'{time_create.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        time_create, pk = raw.rsplit('|', 1)
+        return datetime.fromisoformat(time_create), int(pk)
+    except (ValueError, UnicodeError):
+        raise ParseError('Invalid cursor')
+
+
+def fetch_by_ids(queryset, ids):
+    """
+    Строки в порядке ids; фильтры и select_related исходного queryset сохраняются.
+    Годится и для .values(), если среди колонок есть pk.
+    """
+    objects = {}
+    for row in queryset.filter(pk__in=ids).order_by():
+        objects[row['pk'] if isinstance(row, dict) else row.pk] = row
+    return [objects[pk] for pk in ids if pk in objects]
+
+
+class IdFirstPaginationMixin:
+    """
+    Для ListView: сначала id страницы — без JOIN'ов select_related, так что планировщик берёт
+    покрывающий индекс фильтра и сортировки, — затем сами строки страницы по первичному ключу.
+    """
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, ids, is_paginated = super().paginate_queryset(
+            queryset.values_list('pk', flat=True), page_size)
+        page.object_list = fetch_by_ids(queryset, list(ids))
+        return paginator, page, page.object_list, is_paginated
+
+
+def keyset_page(queryset, cursor=None, limit=50):
+    """Страница по ключу (time_create, id) по убыванию — без OFFSET и без COUNT."""
+    queryset = queryset.order_by('-time_create', '-pk')
+    if cursor:
+        time_create, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(time_create__lt=time_create) | Q(time_create=time_create, pk__lt=pk))
+
+    # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+    rows = fetch_by_ids(queryset, list(queryset.values_list('pk', flat=True)[:limit + 1]))
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -1,126 +1,208 @@
-import requests
-from bs4 import BeautifulSoup
+import hashlib
+import json
+
+from django.db import transaction
+from django.utils import timezone
 from django.utils.text import slugify
 from django.core.files.base import ContentFile
 from .models import Auto, Engine, Transmission  # замените на своё приложение
+from .catalog_stats import StatsDelta, stat_values
+from .extract import extract_listings
+from .fragments import bump_version
+from .page_cache import bump_catalog
+from .price_history import record_observations
+from .renditions import make_renditions, delete_renditions
+from .search import index_autos
+from .similar import autos_changed
+from .slugs import allocate_slugs
+
+def unique_slugs(titles_years):
+    """Уникальные слаги для пачки объявлений через счётчики SlugCounter."""
+    return allocate_slugs([slugify(f"{title}-{year}") or "auto" for title, year in titles_years])
+
+def listing_hash(record):
+    """Хэш содержимого объявления: по нему синхронизация понимает, что объявление изменилось."""
+    payload = {key: value for key, value in record.as_dict().items() if key != "url"}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def parse_listings(html, backend=None):
+    """Все объявления со страницы выдачи Drom (см. extract)."""
+    return extract_listings(html, backend)
+
+def bulk_get_or_create(model, field, defaults):
+    """get_or_create для многих ключей сразу: {значение поля: defaults} → {значение поля: объект}."""
+    objects = {}
+    # при дублях в БД берём запись с меньшим pk
+    for obj in model.objects.filter(**{f"{field}__in": list(defaults)}).order_by("-pk"):
+        objects[getattr(obj, field)] = obj
+
+    missing = [model(**{field: key}, **values) for key, values in defaults.items() if key not in objects]
+    if missing:
+        created = model.objects.bulk_create(missing)
+        if any(obj.pk is None for obj in created):
+            created = model.objects.filter(**{f"{field}__in": [getattr(obj, field) for obj in missing]})
+        for obj in created:
+            objects.setdefault(getattr(obj, field), obj)
+    return objects
+
+def save_autos(batch):
+    """
+    Сохраняет пачку объявлений [(record, image_content), ...] за постоянное число запросов:
+    дедупликация одним url__in, Engine/Transmission пачкой, авто одним bulk_create.
+    """
+    known = set(Auto.objects.filter(url__in=[record.url for record, _ in batch]).values_list("url", flat=True))
+    fresh = []
+    for record, image_content in batch:
+        # одно объявление может встретиться на нескольких страницах
+        if record.url not in known:
+            known.add(record.url)
+            fresh.append((record, image_content))
+    if not fresh:
+        return []
 
-# Маппинг значений Дром → Django
-transmission_map = {"АКПП": "0", "механика": "1"}
-drive_map = {"передний": "0", "задний": "1", "полный": "2"}
-fuel_map = {"бензин": "бензин", "дизель": "дизель", "электро": "электро"}
-
-def unique_slug(title, year):
-    base_slug = slugify(f"{title}-{year}")
-    slug = base_slug
-    counter = 1
-    while Auto.objects.filter(slug=slug).exists():
-        slug = f"{base_slug}-{counter}"
-        counter += 1
-    return slug
-
-def safe_int(value):
-    value = ''.join(filter(str.isdigit, value))
-    return int(value) if value else 0
-
-def parse_ford_page(url):
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, "html.parser")
     autos = []
+    try:
+        with transaction.atomic():
+            engines = bulk_get_or_create(Engine, "title", {
+                record.engine_title: {"power": record.engine_power} for record, _ in fresh
+            })
+            transmissions = bulk_get_or_create(Transmission, "transmission_type", {
+                record.transmission_type: {"title": record.transmission_title} for record, _ in fresh
+            })
+            slugs = unique_slugs([(record.title, record.year) for record, _ in fresh])
+
+            safety_rating_default = Auto.safety_ratings[0][0]
+            for (record, image_content), slug in zip(fresh, slugs):
+                auto = Auto(
+                    title=record.title,
+                    slug=slug,
+                    category=None,
+                    engine=engines[record.engine_title],
+                    transmission=transmissions[record.transmission_type],
+                    drive=record.drive,
+                    fuel_type=record.fuel_type,
+                    production_year=record.year,
+                    trunk_capacity=300,
+                    wheel_size=15,
+                    numbers_of_seats=5,
+                    fuel_tank_capacity=50,
+                    color="#000000",
+                    weight=1000,
+                    safety_rating=safety_rating_default,
+                    price=record.price,
+                    mileage=record.mileage,
+                    url=record.url,
+                    content_hash=listing_hash(record),
+                    image_url=record.img_url,
+                )
+                # Файл пишем в хранилище до вставки, без отдельного UPDATE на каждую строку
+                auto.image.save(f"{slug}.jpg", ContentFile(image_content), save=False)
+                autos.append(auto)
+                try:
+                    auto.renditions = make_renditions(auto.image.name, image_content, storage=auto.image.storage)
+                except OSError:
+                    pass  # битое фото: оставляем только оригинал
+
+            Auto.objects.bulk_create(autos)
+            # bulk_create не шлёт post_save — сбрасываем кэш списков и обновляем поиск сами
+            bump_catalog()
+            index_autos([auto.pk for auto in autos])
+            record_observations(autos, created=True)
+            StatsDelta().add_autos(autos).apply()
+            autos_changed()
+    except Exception:
+        for auto in autos:
+            delete_renditions(auto)
+            auto.image.delete(save=False)
+        raise
+    return autos
 
-    for item in soup.find_all("div", {"data-ftid": "bulls-list_bull"}):
-        link_tag = item.find("a", {"data-ftid": "bull_title"})
-        if not link_tag:
-            continue
-        auto_url = link_tag['href']
-
-        if Auto.objects.filter(url=auto_url).exists():
-            continue
-
-        title_text = link_tag.text.strip()
-        if ',' in title_text:
-            title_name, year = title_text.rsplit(',', 1)
-            year = safe_int(year)
-        else:
-            title_name = title_text
-            year = 2000
-
-        slug = unique_slug(title_name, year)
-
-        # Фото
-        img_tag = item.find("img")
-        img_url = img_tag['src'] if img_tag else None
-
-        # Характеристики
-        specs = [span.text.strip() for span in item.find_all("span", {"data-ftid": "bull_description-item"})]
-        engine_title = specs[0].split('(')[0].strip() if len(specs) > 0 else "Unknown"
-        engine_power = 0
-        if len(specs) > 0 and '(' in specs[0]:
-            try:
-                power_str = specs[0].split('(')[1].split('л.с.)')[0]
-                engine_power = safe_int(power_str)
-            except Exception:
-                engine_power = 0
-
-        fuel_type = fuel_map.get(specs[1], "бензин") if len(specs) > 1 else "бензин"
-        transmission_type = transmission_map.get(specs[2], "0") if len(specs) > 2 else "0"
-        raw_drive = specs[3].lower() if len(specs) > 3 else ""
-        if "передн" in raw_drive:
-            drive = "0"
-        elif "задн" in raw_drive:
-            drive = "1"
-        elif "полн" in raw_drive or "4wd" in raw_drive or "awd" in raw_drive:
-            drive = "2"
-        else:
-            drive = "0"  # дефолт
-        #drive = drive_map.get(specs[3], "0") if len(specs) > 3 else "0"
-        mileage = safe_int(specs[4]) if len(specs) > 4 else 0
-
-        # Цена
-        price_tag = item.find("span", {"data-ftid": "bull_price"})
-        price = safe_int(price_tag.text) if price_tag else 0
-
-        # Engine и Transmission
-        engine, _ = Engine.objects.get_or_create(title=engine_title, defaults={"power": engine_power})
-        transmission, _ = Transmission.objects.get_or_create(
-            transmission_type=transmission_type,
-            defaults={"title": specs[2] if len(specs) > 2 else "Unknown"}
-        )
-
-        # Создание авто без картинки сначала
-        safety_rating_default = Auto.safety_ratings[0][0]
-        auto = Auto(
-            title=title_name,
-            slug=slug,
-            category=None,
-            engine=engine,
-            transmission=transmission,
-            drive=drive,
-            fuel_type=fuel_type,
-            production_year=year,
-            trunk_capacity=300,
-            wheel_size=15,
-            numbers_of_seats=5,
-            fuel_tank_capacity=50,
-            color="#000000",
-            weight=1000,
-            safety_rating=safety_rating_default,
-            price=price,
-            mileage=mileage,
-            url=auto_url
-        )
-
-        # Скачиваем и сохраняем изображение
-        if img_url:
-            try:
-                response = requests.get(img_url, timeout=10)
-                if response.status_code == 200:
-                    auto.save()
-                    auto.image.save(f"{slug}.jpg", ContentFile(response.content), save=True)
-                    autos.append(auto)
-            except Exception as e:
-                print(f"Не удалось скачать изображение: {img_url}, ошибка: {e}")
+# Поля авто, которые синхронизация берёт из объявления: поле модели → поле Listing
+SYNC_FIELDS = {
+    "title": "title",
+    "production_year": "year",
+    "price": "price",
+    "mileage": "mileage",
+    "drive": "drive",
+    "fuel_type": "fuel_type",
+}
+
+def update_autos(batch):
+    """
+    Обновляет уже известные объявления [(record, image_content или None), ...]:
+    меняются только отличающиеся поля, все авто пачки — одним bulk_update.
+    Фото заменяется, только если передано новое содержимое (сменился адрес фото).
+    """
+    records = {record.url: (record, image_content) for record, image_content in batch}
+    replaced, written, changed = [], [], []
+    try:
+        with transaction.atomic():
+            autos = list(Auto.objects.select_for_update().filter(url__in=list(records)))
+            engines = bulk_get_or_create(Engine, "title", {
+                record.engine_title: {"power": record.engine_power} for record, _ in batch
+            })
+            transmissions = bulk_get_or_create(Transmission, "transmission_type", {
+                record.transmission_type: {"title": record.transmission_title} for record, _ in batch
+            })
+
+            fields = set()
+            stats = StatsDelta()
+            for auto in autos:
+                record, image_content = records[auto.url]
+                values = {field: getattr(record, key) for field, key in SYNC_FIELDS.items()}
+                values.update(engine_id=engines[record.engine_title].pk,
+                              transmission_id=transmissions[record.transmission_type].pk,
+                              content_hash=listing_hash(record), image_url=record.img_url)
+                diff = {field: value for field, value in values.items() if getattr(auto, field) != value}
+                if image_content is not None:
+                    replaced.append((auto.image.name, dict(auto.renditions)))
+                    auto.image.save(f"{auto.slug}.jpg", ContentFile(image_content), save=False)
+                    written.append(auto)
+                    try:
+                        auto.renditions = make_renditions(auto.image.name, image_content, storage=auto.image.storage)
+                    except OSError:
+                        auto.renditions = {}
+                    diff.update(image=auto.image.name, renditions=auto.renditions)
+                if diff:
+                    stats.remove(stat_values(auto))
+                    for field, value in diff.items():
+                        setattr(auto, field, value)
+                    fields.update(diff)
+                    changed.append(auto)
+                    stats.add(stat_values(auto))
+
+            if changed:
+                # bulk_update не трогает auto_now, а по time_update индекс похожих авто находит изменённые
+                now = timezone.now()
+                for auto in changed:
+                    auto.time_update = now
+                Auto.objects.bulk_update(changed, sorted(fields | {"time_update"}))
+                # bulk_update не шлёт post_save — версии карточек, кэш списков и поиск обновляем сами
+                for auto in changed:
+                    bump_version("auto", auto.pk)
+                bump_catalog()
+                index_autos([auto.pk for auto in changed])
+                record_observations(changed)
+                stats.apply()
+                autos_changed()
+    except Exception:
+        for auto in written:
+            delete_renditions(auto)
+            auto.image.delete(save=False)
+        raise
+
+    def delete_old_images():
+        for name, renditions in replaced:
+            old = Auto(image=name, renditions=renditions)
+            delete_renditions(old)
+            if name:
+                old.image.delete(save=False)
+    transaction.on_commit(delete_old_images)
+    return changed
 
-    return autos
+def parse_ford_page(url):
+    from .ingest import DromIngester
+    return DromIngester().run([url])
 
 # Пример использования
 # url = "https://auto.drom.ru/ford/"
@@ -0,0 +1,114 @@
+import statistics
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import PriceAggregate, PriceRun
+
+PERIOD_DAYS = {PriceAggregate.DAY: 1, PriceAggregate.WEEK: 7}
+
+
+def record_observations(autos, when=None, created=False, only_changes=False):
+    """
+    Записывает текущие цену и пробег авто в историю за постоянное число запросов:
+    совпало с текущей серией — серия продлевается, иначе закрывается и начинается новая.
+    created=True — авто только что вставлены, текущих серий у них заведомо нет.
+    only_changes=True — совпавшие серии не трогаем: правка в форме не наблюдение объявления.
+    """
+    autos = [auto for auto in autos if auto.pk is not None]
+    if not autos:
+        return
+    when = when or timezone.now()
+    current = {}
+    if not created:
+        runs = PriceRun.objects.filter(auto_id__in=[auto.pk for auto in autos], until__isnull=True).order_by()
+        current = {run.auto_id: run for run in runs}
+    extended, closed, started = [], [], []
+    for auto in autos:
+        run = current.get(auto.pk)
+        if run is not None and (run.price, run.mileage) == (auto.price, auto.mileage):
+            if not only_changes:
+                extended.append(run.pk)
+            continue
+        if run is not None:
+            closed.append(run.pk)
+        started.append(PriceRun(auto_id=auto.pk, price=auto.price, mileage=auto.mileage,
+                                since=when, last_seen=when))
+    if extended:
+        PriceRun.objects.filter(pk__in=extended).update(last_seen=when, observations=F('observations') + 1)
+    if closed:
+        PriceRun.objects.filter(pk__in=closed).update(until=when)
+    if started:
+        PriceRun.objects.bulk_create(started)
+
+
+def mark_seen(auto_ids, when=None):
+    """Объявление встретилось снова без изменений — одним UPDATE продлеваем текущие серии."""
+    if auto_ids:
+        PriceRun.objects.filter(auto_id__in=list(auto_ids), until__isnull=True).update(
+            last_seen=when or timezone.now(), observations=F('observations') + 1)
+
+
+def price_history(auto, start=None, end=None):
+    """Серии одного авто за промежуток; индекс (auto, since) — чтение не зависит от истории других авто."""
+    runs = PriceRun.objects.filter(auto=auto)
+    if start is not None:
+        runs = runs.filter(Q(until__isnull=True) | Q(until__gt=start))
+    if end is not None:
+        runs = runs.filter(since__lt=end)
+    return runs.order_by('since')
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def period_start(day, period):
+    return day - timedelta(days=day.weekday()) if period == PriceAggregate.WEEK else day
+
+
+def aggregate_prices(period, start):
+    """Пересчитывает медианы за один день или неделю по всем категориям и моделям."""
+    start = period_start(start, period)
+    begin = local_midnight(start)
+    end = begin + timedelta(days=PERIOD_DAYS[period])
+
+    # серии, действовавшие хотя бы часть периода [begin, end); у авто берётся одна цена —
+    # серии, действовавшей на конец периода, иначе смена цены посчитала бы авто дважды
+    runs = (PriceRun.objects.filter(Q(until__isnull=True) | Q(until__gt=begin), since__lt=end)
+            .order_by('auto_id', 'since').values_list('auto_id', 'price', 'auto__title', 'auto__category__slug'))
+    latest = {}
+    for auto_id, *run in runs.iterator(chunk_size=5000):
+        latest[auto_id] = run
+
+    groups = defaultdict(list)
+    for price, title, category in latest.values():
+        if price <= 0:
+            continue
+        groups[(PriceAggregate.MODEL, title)].append(price)
+        if category:
+            groups[(PriceAggregate.CATEGORY, category)].append(price)
+
+    with transaction.atomic():
+        PriceAggregate.objects.filter(period=period, start=start).delete()
+        PriceAggregate.objects.bulk_create([
+            PriceAggregate(period=period, start=start, kind=kind, key=key[:255],
+                           median=int(statistics.median(prices)), count=len(prices))
+            for (kind, key), prices in groups.items()
+        ])
+    return len(groups)
+
+
+def refresh_price_aggregates(today=None, days=1):
+    """Пересчитывает последние days дней и недели, в которые они попадают."""
+    today = today or timezone.localdate()
+    weeks = set()
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        aggregate_prices(PriceAggregate.DAY, day)
+        weeks.add(period_start(day, PriceAggregate.WEEK))
+    for week in sorted(weeks):
+        aggregate_prices(PriceAggregate.WEEK, week)
@@ -0,0 +1,65 @@
+import io
+import os
+
+from PIL import Image, features
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+# Ширины уменьшенных копий; больше оригинала не растягиваем
+RENDITION_WIDTHS = (320, 640, 960)
+JPEG_QUALITY = 82
+WEBP_QUALITY = 78
+
+
+def rendition_name(name, width, ext):
+    """photos/2025/09/13/ford-focus-2012.jpg → photos/2025/09/13/ford-focus-2012_w320.webp"""
+    base, _ = os.path.splitext(name)
+    return f'{base}_w{width}.{ext}'
+
+
+def encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, quality=quality)
+    return buffer.getvalue()
+
+
+def write(storage, name, data):
+    # имена детерминированные — перезаписываем, чтобы storage не добавлял случайный суффикс
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(data))
+
+
+def make_renditions(name, content=None, storage=default_storage):
+    """
+    Создаёт рядом с оригиналом уменьшенные JPEG и WebP копии.
+    Возвращает описание для Auto.renditions: {"source", "width", "jpeg": [[w, name]], "webp": [[w, name]]}.
+    """
+    if content is None:
+        with storage.open(name, 'rb') as f:
+            content = f.read()
+    with Image.open(io.BytesIO(content)) as original:
+        original = original.convert('RGB')
+        width, height = original.size
+
+        result = {'source': name, 'width': width, 'jpeg': [], 'webp': []}
+        webp = features.check('webp')
+        for target in RENDITION_WIDTHS:
+            if target >= width:
+                break
+            resized = original.resize((target, max(1, round(height * target / width))), Image.LANCZOS)
+            result['jpeg'].append([target, write(storage, rendition_name(name, target, 'jpg'),
+                                                 encode(resized, 'JPEG', JPEG_QUALITY))])
+            if webp:
+                result['webp'].append([target, write(storage, rendition_name(name, target, 'webp'),
+                                                     encode(resized, 'WEBP', WEBP_QUALITY))])
+        if webp:
+            result['webp'].append([width, write(storage, rendition_name(name, width, 'webp'),
+                                                encode(original, 'WEBP', WEBP_QUALITY))])
+    return result
+
+
+def delete_renditions(auto):
+    for fmt in ('jpeg', 'webp'):
+        for _, name in auto.renditions.get(fmt, []):
+            auto.image.storage.delete(name)
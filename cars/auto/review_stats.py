@@ -0,0 +1,55 @@
+from django.db.models import Count, F, FloatField, IntegerField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, NullIf
+
+from .models import Auto, Review
+
+
+def reviews_of(auto_ref):
+    return Review.objects.filter(auto=auto_ref).order_by().values('auto')
+
+
+def max_score_subquery():
+    return Coalesce(Subquery(reviews_of(OuterRef('pk')).annotate(m=Max('score')).values('m')), 0,
+                    output_field=IntegerField())
+
+
+def apply_delta(auto_id, count_delta, sum_delta, max_score):
+    """Одно атомарное UPDATE агрегатов по отзывам; вызывать в той же транзакции, что и изменение отзыва."""
+    new_count = F('review_count') + count_delta
+    new_sum = F('score_sum') + sum_delta
+    Auto.objects.filter(pk=auto_id).update(
+        review_count=new_count,
+        score_sum=new_sum,
+        avg_score=Coalesce(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 0.0, output_field=FloatField()),
+        max_score=max_score,
+    )
+
+
+def review_added(review):
+    apply_delta(review.auto_id, 1, review.score, Greatest(F('max_score'), Value(review.score)))
+
+
+def review_changed(review, old_score):
+    if review.score >= old_score:
+        max_score = Greatest(F('max_score'), Value(review.score))
+    else:
+        # максимум мог уменьшиться — пересчитываем по отзывам этого авто
+        max_score = max_score_subquery()
+    apply_delta(review.auto_id, 0, review.score - old_score, max_score)
+
+
+def review_deleted(review):
+    apply_delta(review.auto_id, -1, -review.score, max_score_subquery())
+
+
+def rebuild_review_stats(queryset=None):
+    """Полный пересчёт агрегатов одним UPDATE с подзапросами."""
+    queryset = Auto.objects.all() if queryset is None else queryset
+    reviews = reviews_of(OuterRef('pk'))
+    return queryset.update(
+        review_count=Coalesce(Subquery(reviews.annotate(c=Count('pk')).values('c')), 0),
+        score_sum=Coalesce(Subquery(reviews.annotate(s=Sum('score')).values('s')), 0),
+        avg_score=Coalesce(Subquery(reviews.annotate(a=Cast(Sum('score'), FloatField()) / Count('pk')).values('a')),
+                           0.0, output_field=FloatField()),
+        max_score=max_score_subquery(),
+    )
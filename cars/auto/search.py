@@ -0,0 +1,194 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Auto
+from .pagination import fetch_by_ids
+
+SEARCH_TABLE = 'auto_search'
+# Вес колонок: название авто важнее двигателя, коробки и категории
+WEIGHTS = {'title': 10.0, 'engine': 2.0, 'transmission': 2.0, 'category': 1.0}
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_terms(query):
+    return WORD_RE.findall(query.lower())[:10]
+
+
+def documents(ids):
+    autos = (Auto.objects.filter(pk__in=ids).order_by()
+             .values_list('pk', 'title', 'engine__title', 'transmission__title', 'category__title'))
+    return [(pk, title or '', engine or '', transmission or '', category or '')
+            for pk, title, engine, transmission, category in autos]
+
+
+class SqliteSearchBackend:
+    """Виртуальная таблица FTS5: rowid = id авто, ранжирование bm25."""
+
+    def create_table(self, cursor):
+        cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+                       f"USING fts5(title, engine, transmission, category, tokenize='unicode61')")
+
+    def drop_table(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def remove(self, cursor, ids):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(ids))})", ids)
+
+    def upsert(self, cursor, rows):
+        self.remove(cursor, [row[0] for row in rows])
+        cursor.executemany(f"INSERT INTO {SEARCH_TABLE} (rowid, title, engine, transmission, category) "
+                           f"VALUES (%s, %s, %s, %s, %s)", rows)
+
+    def match(self, terms):
+        # каждое слово — префиксный поиск в кавычках, чтобы пользовательский ввод не ломал синтаксис FTS5
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, cursor, terms, limit, offset):
+        weights = ', '.join(str(weight) for weight in WEIGHTS.values())
+        cursor.execute(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                       f"ORDER BY bm25({SEARCH_TABLE}, {weights}) LIMIT %s OFFSET %s",
+                       [self.match(terms), limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+    def count(self, cursor, terms):
+        cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [self.match(terms)])
+        return cursor.fetchone()[0]
+
+
+class PostgresSearchBackend:
+    """Таблица с tsvector и GIN-индексом, ранжирование ts_rank."""
+
+    def create_table(self, cursor):
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ("
+                       f"auto_id bigint PRIMARY KEY REFERENCES {Auto._meta.db_table}(id) ON DELETE CASCADE, "
+                       f"document tsvector NOT NULL)")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING GIN (document)")
+
+    def drop_table(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+    def remove(self, cursor, ids):
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE auto_id = ANY(%s)", [list(ids)])
+
+    def upsert(self, cursor, rows):
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (auto_id, document) VALUES (%s, "
+            f"setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+            f"setweight(to_tsvector('simple', %s), 'B') || setweight(to_tsvector('simple', %s), 'C')) "
+            f"ON CONFLICT (auto_id) DO UPDATE SET document = EXCLUDED.document", rows)
+
+    def tsquery(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def search(self, cursor, terms, limit, offset):
+        cursor.execute(f"SELECT auto_id FROM {SEARCH_TABLE}, to_tsquery('simple', %s) query "
+                       f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC, auto_id DESC "
+                       f"LIMIT %s OFFSET %s", [self.tsquery(terms), limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+    def count(self, cursor, terms):
+        cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)",
+                       [self.tsquery(terms)])
+        return cursor.fetchone()[0]
+
+
+BACKENDS = {'sqlite': SqliteSearchBackend, 'postgresql': PostgresSearchBackend}
+
+
+def get_backend(conn=connection):
+    backend = BACKENDS.get(conn.vendor)
+    return backend() if backend else None
+
+
+def index_autos(ids):
+    """
+    Обновляет поисковый индекс для указанных авто (удалённые из БД — убирает).
+    Индекс лежит в той же БД, поэтому вызывается внутри транзакции изменения и откатывается вместе с ней.
+    """
+    backend = get_backend()
+    ids = list(ids)
+    if backend is None or not ids:
+        return
+    rows = documents(ids)
+    found = {row[0] for row in rows}
+    with connection.cursor() as cursor:
+        if rows:
+            backend.upsert(cursor, rows)
+        gone = [pk for pk in ids if pk not in found]
+        if gone:
+            backend.remove(cursor, gone)
+
+
+def remove_autos(ids):
+    backend = get_backend()
+    if backend is not None and ids:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, list(ids))
+
+
+def rebuild_index(chunk_size=2000):
+    backend = get_backend()
+    if backend is None:
+        return 0
+    with connection.cursor() as cursor:
+        backend.drop_table(cursor)
+        backend.create_table(cursor)
+    total = 0
+    ids = Auto.objects.order_by('pk').values_list('pk', flat=True)
+    chunk = []
+    for pk in ids.iterator(chunk_size=chunk_size):
+        chunk.append(pk)
+        if len(chunk) >= chunk_size:
+            index_autos(chunk)
+            total += len(chunk)
+            chunk = []
+    index_autos(chunk)
+    return total + len(chunk)
+
+
+class SearchResults:
+    """Ленивая выдача поиска для Paginator: count() и срезы идут в полнотекстовый индекс."""
+    model = Auto
+
+    def __init__(self, query, queryset=None):
+        self.terms = search_terms(query)
+        self.queryset = queryset if queryset is not None else Auto.objects.select_related('engine', 'transmission')
+        self.backend = get_backend()
+        self._count = None
+
+    def fallback(self):
+        # бэкенд БД без полнотекстового поиска
+        condition = Q()
+        for term in self.terms:
+            condition &= (Q(title__icontains=term) | Q(engine__title__icontains=term) |
+                          Q(transmission__title__icontains=term) | Q(category__title__icontains=term))
+        return self.queryset.filter(condition)
+
+    def count(self):
+        if self._count is None:
+            if not self.terms:
+                self._count = 0
+            elif self.backend is None:
+                self._count = self.fallback().count()
+            else:
+                with connection.cursor() as cursor:
+                    self._count = self.backend.count(cursor, self.terms)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item:item + 1][0]
+        offset = item.start or 0
+        limit = (item.stop if item.stop is not None else offset + 100) - offset
+        if not self.terms or limit <= 0:
+            return []
+        if self.backend is None:
+            return list(self.fallback()[offset:offset + limit])
+        with connection.cursor() as cursor:
+            ids = self.backend.search(cursor, self.terms, limit, offset)
+        return fetch_by_ids(self.queryset, ids)
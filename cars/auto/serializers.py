@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+
 from .models import Auto
 
 
@@ -7,4 +9,54 @@ class AutoSerializer(serializers.ModelSerializer):
         model = Auto
         fields = ['title', 'slug', 'mileage', 'price', 'category', 'engine', 'transmission', 'color', 'weight',
               'drive', 'trunk_capacity', 'wheel_size', 'numbers_of_seats',
-              'safety_rating', 'fuel_tank_capacity', 'fuel_type', 'production_year']
\ No newline at end of file
+              'safety_rating', 'fuel_tank_capacity', 'fuel_type', 'production_year']
+
+
+# Что отдаёт связь при ?expand=
+EXPANSIONS = {
+    'category': ['id', 'title', 'slug'],
+    'engine': ['id', 'title', 'power'],
+    'transmission': ['id', 'title', 'transmission_type'],
+}
+
+
+def param_list(params, name, allowed):
+    values = [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+    unknown = [value for value in values if value not in allowed]
+    if unknown:
+        raise ParseError(f"Unknown {name}: {', '.join(unknown)}")
+    return list(dict.fromkeys(values))
+
+
+class AutoFieldset:
+    """
+    Быстрый путь API вместо AutoSerializer: ?fields=title,price,slug и ?expand=engine,transmission
+    превращаются в .values() только нужных колонок (развёрнутые связи — JOIN'ом),
+    строка → dict без DRF-полей. Без параметров вывод совпадает с AutoSerializer.
+    """
+
+    def __init__(self, params):
+        self.fields = param_list(params, 'fields', AutoSerializer.Meta.fields) or list(AutoSerializer.Meta.fields)
+        self.expand = param_list(params, 'expand', EXPANSIONS)
+        self.fields += [relation for relation in self.expand if relation not in self.fields]
+        # (ключ ответа, колонка values() или список колонок развёрнутой связи)
+        self.columns = [(name, [f'{name}__{attr}' for attr in EXPANSIONS[name]] if name in self.expand else name)
+                        for name in self.fields]
+
+    def project(self, queryset):
+        """pk и time_create нужны выборке по id и курсору, в ответ они не попадают."""
+        lookups = ['pk', 'time_create']
+        for _, source in self.columns:
+            lookups.extend(source if isinstance(source, list) else [source])
+        return queryset.values(*lookups)
+
+    def to_dict(self, row):
+        data = {}
+        for name, source in self.columns:
+            if isinstance(source, list):
+                # LEFT JOIN по пустой связи даёт одни NULL
+                data[name] = (dict(zip(EXPANSIONS[name], [row[column] for column in source]))
+                              if row[source[0]] is not None else None)
+            else:
+                data[name] = row[source]
+        return data
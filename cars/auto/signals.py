@@ -0,0 +1,160 @@
+import logging
+
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .catalog_stats import StatsDelta, category_removed, current_values, stat_values
+from .fragments import bump_version
+from .models import Auto, Truck, Engine, Transmission, Review, Category, Comment
+from .page_cache import bump_catalog
+from .price_history import record_observations
+from .renditions import make_renditions
+from .search import index_autos, remove_autos
+from .similar import autos_changed, autos_removed
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Auto)
+@receiver(post_save, sender=Truck)
+def build_renditions(sender, instance, **kwargs):
+    """Новое фото (форма, админка) — сразу делаем уменьшенные копии."""
+    if instance.image and not instance.has_renditions():
+        try:
+            instance.renditions = make_renditions(instance.image.name, storage=instance.image.storage)
+        except OSError as e:
+            logger.warning("Не удалось сделать копии фото %s: %s", instance.image.name, e)
+            return
+        Auto.objects.filter(pk=instance.pk).update(renditions=instance.renditions)
+
+
+@receiver(post_save, sender=Auto)
+@receiver(post_delete, sender=Auto)
+@receiver(post_save, sender=Truck)
+@receiver(post_delete, sender=Truck)
+def auto_changed(sender, instance, **kwargs):
+    bump_version('auto', instance.pk)
+    bump_catalog()
+
+
+@receiver(post_save, sender=Auto)
+@receiver(post_save, sender=Truck)
+def auto_indexed(sender, instance, **kwargs):
+    index_autos([instance.pk])
+
+
+@receiver(post_save, sender=Auto)
+@receiver(post_save, sender=Truck)
+def price_observed(sender, instance, created, raw=False, **kwargs):
+    """
+    Цена или пробег поменялись в форме/админке — новая серия в истории цен. Прочие правки
+    (название, фото) наблюдением не считаются; повторно увиденные объявления отмечает выгрузка.
+    """
+    if not raw:
+        record_observations([instance], created=created, only_changes=True)
+
+
+@receiver(post_delete, sender=Auto)
+def auto_unindexed(sender, instance, **kwargs):
+    remove_autos([instance.pk])
+
+
+@receiver(post_save, sender=Auto)
+@receiver(post_save, sender=Truck)
+def similar_changed(sender, instance, **kwargs):
+    autos_changed()
+
+
+@receiver(post_delete, sender=Auto)
+def similar_removed(sender, instance, **kwargs):
+    autos_removed([instance.pk])
+
+
+@receiver(pre_save, sender=Auto)
+@receiver(pre_save, sender=Truck)
+def stats_before_save(sender, instance, raw=False, **kwargs):
+    # старые значения: прежний вклад авто вычитается из сводки
+    if not raw and not instance._state.adding:
+        instance._stat_values = current_values(instance.pk)
+
+
+@receiver(post_save, sender=Auto)
+@receiver(post_save, sender=Truck)
+def stats_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old = getattr(instance, '_stat_values', None)
+    new = stat_values(instance)
+    if old == new:
+        return
+    delta = StatsDelta()
+    if old is not None:
+        delta.remove(old)
+    delta.add(new)
+    delta.apply()
+
+
+@receiver(post_delete, sender=Auto)
+def stats_deleted(sender, instance, **kwargs):
+    # грузовик удаляется вместе с родительской строкой Auto — считаем один раз
+    delta = StatsDelta()
+    delta.remove(stat_values(instance))
+    delta.apply()
+
+
+@receiver(post_save, sender=Engine)
+@receiver(post_save, sender=Transmission)
+@receiver(post_save, sender=Category)
+def related_indexed(sender, instance, created, **kwargs):
+    """Название двигателя, коробки или категории входит в поисковый документ авто."""
+    if not created:
+        index_autos(instance.autos.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Category)
+def category_deleting(sender, instance, **kwargs):
+    # после удаления category_id у авто уже NULL — запоминаем их заранее
+    instance._search_ids = list(instance.autos.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def category_unindexed(sender, instance, **kwargs):
+    index_autos(getattr(instance, '_search_ids', []))
+    category_removed(instance.pk)
+
+
+@receiver(post_save, sender=Engine)
+@receiver(post_delete, sender=Engine)
+def engine_changed(sender, instance, **kwargs):
+    bump_version('engine', instance.pk)
+    bump_catalog()
+
+
+@receiver(post_save, sender=Transmission)
+@receiver(post_delete, sender=Transmission)
+def transmission_changed(sender, instance, **kwargs):
+    bump_version('transmission', instance.pk)
+    bump_catalog()
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, instance, **kwargs):
+    bump_version('auto', instance.auto_id)
+    bump_catalog()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    bump_version('category', instance.pk)
+    bump_catalog()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # комментарии видны на странице авто — её ETag должен смениться
+    auto_id = Review.objects.filter(pk=instance.review_id).values_list('auto_id', flat=True).first()
+    if auto_id is not None:
+        bump_version('auto', auto_id)
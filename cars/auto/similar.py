@@ -0,0 +1,317 @@
+"""
+Индекс «похожих авто»: матрица нормированных признаков в памяти процесса и kNN по евклидову расстоянию.
+
+Признаки — цена и пробег (в логарифме), год, мощность, вес, колёса, багажник, безопасность
+(z-оценки по каталогу) и one-hot привода, топлива и коробки. Снимок индекса пишет команда
+build_similar_index в SIMILAR_INDEX_PATH; процессы открывают его через mmap, так что старт
+не читает каталог, а пока снимка нет, соседей нет вовсе — запрос каталог не перебирает. Между снимками индекс догоняется сам: сигналы Auto сдвигают версию
+SIMILAR_VERSION, и при следующем обращении процесс дочитывает авто с pk больше известного
+или с time_update после прошлой сверки. Удаления в других процессах и правки двигателя
+или коробки попадают в индекс со следующим снимком; удалённые авто отсеивает выборка по id.
+"""
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .fragments import bump_version, get_versions, version_key
+from .models import Auto, Transmission
+from .pagination import fetch_by_ids
+
+try:
+    import numpy as np
+except ImportError:  # необязательная зависимость
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SIMILAR_VERSION = version_key('similar', 'all')
+# (признак, колонка values_list, брать логарифм)
+NUMERIC = [
+    ('price', 'price', True),
+    ('mileage', 'mileage', True),
+    ('production_year', 'production_year', False),
+    ('engine_power', 'engine__power', False),
+    ('weight', 'weight', False),
+    ('wheel_size', 'wheel_size', False),
+    ('trunk_capacity', 'trunk_capacity', False),
+    ('safety_rating', 'safety_rating', False),
+]
+# (признак, колонка values_list, значения one-hot)
+CATEGORICAL = [
+    ('drive', 'drive', [value for value, _ in Auto.drive_choices]),
+    ('fuel_type', 'fuel_type', [value for value, _ in Auto.fuel_types]),
+    ('transmission_type', 'transmission__transmission_type', [value for value, _ in Transmission.transmission_choices]),
+]
+# Вес признака в расстоянии, по умолчанию 1; несовпадение категории стоит столько же, сколько 1σ числового
+WEIGHTS = {'price': 2.0, 'production_year': 1.5}
+LOOKUPS = ['pk'] + [lookup for _, lookup, _ in NUMERIC] + [lookup for _, lookup, _ in CATEGORICAL]
+# time_update пишется до коммита — дочитываем с запасом, чтобы не потерять медленную транзакцию
+CATCH_UP_OVERLAP = timedelta(minutes=1)
+# Сколько авто догоняется за одно обращение: остальное подхватит следующий снимок
+CATCH_UP_LIMIT = 2000
+
+
+def feature_names():
+    names = [name for name, _, _ in NUMERIC]
+    for name, _, values in CATEGORICAL:
+        names += [f'{name}={value}' for value in values]
+    return names
+
+
+def numeric_matrix(rows):
+    """Числовые признаки строк values_list(*LOOKUPS) как float64; пропуски — NaN."""
+    raw = np.array([[np.nan if value is None else value for value in row[1:len(NUMERIC) + 1]] for row in rows],
+                   dtype=np.float64).reshape(len(rows), len(NUMERIC))
+    for column, (_, _, log) in enumerate(NUMERIC):
+        if log:
+            raw[:, column] = np.log1p(np.clip(raw[:, column], 0, None))
+    return raw
+
+
+def encode(rows, mean, scale):
+    """Строки values_list(*LOOKUPS) → матрица float32 (строк × признаков)."""
+    numeric = np.nan_to_num((numeric_matrix(rows) - mean) / scale)  # пропуск = среднее
+    numeric *= [WEIGHTS.get(name, 1.0) for name, _, _ in NUMERIC]
+    groups = [numeric]
+    offset = len(NUMERIC) + 1
+    for position, (name, _, values) in enumerate(CATEGORICAL):
+        onehot = np.zeros((len(rows), len(values)))
+        index = {value: column for column, value in enumerate(values)}
+        for row_number, row in enumerate(rows):
+            column = index.get(row[offset + position])
+            if column is not None:
+                onehot[row_number, column] = WEIGHTS.get(name, 1.0) / np.sqrt(2)
+        groups.append(onehot)
+    return np.hstack(groups).astype(np.float32)
+
+
+class SimilarIndex:
+    """
+    Матрица хранится по столбцам — признаки × авто, ids — pk по столбцам (из снимка — mmap только
+    для чтения: правки пишутся в копии). Так kNN для одного авто — одно умножение вектора на
+    непрерывную матрицу. Удалённое авто не вырезается: его |b|² в norms становится бесконечным.
+    """
+
+    def __init__(self, ids, columns, mean, scale, synced_at, stamp=None):
+        self.ids = ids
+        self.columns = columns
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.norms = np.einsum('ij,ij->j', columns, columns)
+        self.positions = {pk: column for column, pk in enumerate(ids.tolist())}
+        self.max_pk = int(ids.max()) if len(ids) else 0
+        self.synced_at = synced_at
+        self.stamp = stamp
+        self.version = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return int(np.isfinite(self.norms).sum())
+
+    @classmethod
+    def build(cls, chunk_size=10000):
+        """Полный проход по каталогу: нормировка считается заново."""
+        synced_at = timezone.now()
+        rows = list(Auto.objects.order_by('pk').values_list(*LOOKUPS).iterator(chunk_size=chunk_size))
+        raw = numeric_matrix(rows)
+        # среднее и σ по заполненным значениям; пустая колонка — 0 и 1
+        filled = np.isfinite(raw)
+        counts = np.maximum(filled.sum(axis=0), 1)
+        mean = np.where(filled, raw, 0).sum(axis=0) / counts
+        scale = np.sqrt(np.where(filled, (raw - mean) ** 2, 0).sum(axis=0) / counts)
+        scale[scale == 0] = 1.0
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        return cls(ids, np.ascontiguousarray(encode(rows, mean, scale).T), mean, scale, synced_at)
+
+    def save(self, path):
+        """Массивы — в новые файлы, meta.json подменяется последним: читатель не увидит половину снимка."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        token = uuid.uuid4().hex
+        alive = np.isfinite(self.norms)
+        np.save(path / f'{token}.ids.npy', np.asarray(self.ids)[alive])
+        np.save(path / f'{token}.columns.npy', np.ascontiguousarray(np.asarray(self.columns)[:, alive]))
+        meta = {'token': token, 'features': feature_names(), 'mean': self.mean.tolist(),
+                'scale': self.scale.tolist(), 'synced_at': self.synced_at.isoformat()}
+        (path / 'meta.json.tmp').write_text(json.dumps(meta))
+        os.replace(path / 'meta.json.tmp', path / 'meta.json')
+        # у других процессов старые файлы остаются открыты через mmap до перезагрузки
+        for old in path.glob('*.npy'):
+            if not old.name.startswith(token):
+                old.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path):
+        """Снимок через mmap; None, если его нет или он собран для другого набора признаков."""
+        stamp = snapshot_stamp(path)
+        if stamp is None:
+            return None
+        path = Path(path)
+        meta = json.loads((path / 'meta.json').read_text())
+        if meta['features'] != feature_names():
+            return None
+        ids = np.load(path / f"{meta['token']}.ids.npy", mmap_mode='r')
+        columns = np.load(path / f"{meta['token']}.columns.npy", mmap_mode='r')
+        return cls(ids, columns, meta['mean'], meta['scale'], datetime.fromisoformat(meta['synced_at']), stamp)
+
+    def upsert(self, rows):
+        if not rows:
+            return
+        vectors = encode(rows, self.mean, self.scale)
+        changed, fresh = [], []
+        with self.lock:
+            for row, vector in zip(rows, vectors):
+                position = self.positions.get(row[0])
+                if position is None:
+                    fresh.append((row[0], vector))
+                else:
+                    changed.append((position, vector))
+            # правки и новые авто — в копии массивов, затем подмена ссылок: neighbours считает
+            # по ссылкам, взятым под замком, и не увидит столбец наполовину старым
+            columns, norms = self.columns, self.norms
+            if changed:
+                positions = np.array([position for position, _ in changed])
+                updated = np.array([vector for _, vector in changed], dtype=np.float32).T
+                columns, norms = np.array(columns), np.array(norms)
+                columns[:, positions] = updated
+                norms[positions] = np.einsum('ij,ij->j', updated, updated)
+            if fresh:
+                added = np.array([vector for _, vector in fresh], dtype=np.float32).T
+                start = len(self.ids)
+                self.ids = np.concatenate([self.ids, [pk for pk, _ in fresh]]).astype(np.int64)
+                columns = np.hstack([columns, added])
+                norms = np.concatenate([norms, np.einsum('ij,ij->j', added, added)])
+                self.positions.update((pk, start + offset) for offset, (pk, _) in enumerate(fresh))
+                self.max_pk = max(self.max_pk, max(pk for pk, _ in fresh))
+            self.columns, self.norms = columns, norms
+
+    def remove(self, pks):
+        with self.lock:
+            positions = [self.positions[pk] for pk in pks if pk in self.positions]
+            if positions:
+                norms = self.norms.copy()
+                norms[positions] = np.inf
+                self.norms = norms
+
+    def catch_up(self, limit=None):
+        """
+        Дочитывает новые и изменённые с прошлой сверки авто (индексы pk и time_update), но не больше
+        limit самых свежих: сверка идёт в запросе, а массовые изменения — дело build_similar_index.
+        """
+        limit = limit or CATCH_UP_LIMIT
+        started = timezone.now()
+        changed = Q(pk__gt=self.max_pk) | Q(time_update__gte=self.synced_at - CATCH_UP_OVERLAP)
+        rows = list(Auto.objects.filter(changed).order_by('-time_update').values_list(*LOOKUPS)[:limit + 1])
+        if len(rows) > limit:
+            logger.warning("Индекс похожих авто отстал больше чем на %s авто, запустите build_similar_index", limit)
+        self.upsert(rows[:limit])
+        self.synced_at = started
+
+    def neighbours(self, pks, k):
+        """Пакетный kNN: {pk: [(pk соседа, расстояние), ...]} по возрастанию расстояния, без самого авто."""
+        with self.lock:
+            ids, columns, norms = self.ids, self.columns, self.norms
+            rows = {pk: self.positions.get(pk) for pk in pks}
+        known = [(pk, row) for pk, row in rows.items() if row is not None and np.isfinite(norms[row])]
+        result = {pk: [] for pk in pks}
+        k = min(k, len(ids) - 1)
+        if not known or k < 1:
+            return result
+        positions = np.array([row for _, row in known])
+        # |a-b|² = |a|² - 2ab + |b|²: одно умножение на всю пачку запросов; |a|² на порядок не влияет
+        distances = columns[:, positions].T @ columns
+        distances *= -2
+        distances += norms
+        distances[np.arange(len(positions)), positions] = np.inf
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        for (pk, _), candidates, row, position in zip(known, nearest, distances, positions):
+            candidates = candidates[np.argsort(row[candidates], kind='stable')]
+            result[pk] = [(int(ids[column]), float(np.sqrt(max(row[column] + norms[position], 0))))
+                          for column in candidates if np.isfinite(row[column])]
+        return result
+
+
+def snapshot_stamp(path):
+    try:
+        return os.stat(Path(path) / 'meta.json').st_mtime_ns if path else None
+    except FileNotFoundError:
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    Индекс процесса: снимок с диска, догнанный до текущей версии. Новый снимок подхватывается
+    по mtime meta.json. Без numpy или без снимка (его пишет build_similar_index) — None:
+    весь каталог в запросе не читаем.
+    """
+    global _index
+    if np is None:
+        return None
+    path = getattr(settings, 'SIMILAR_INDEX_PATH', None)
+    version = get_versions([SIMILAR_VERSION])[SIMILAR_VERSION]
+    with _index_lock:
+        stamp = snapshot_stamp(path)
+        if _index is None or _index.stamp != stamp:
+            # снимок собран для другого набора признаков — тоже None до следующей сборки
+            _index = SimilarIndex.load(path) if stamp is not None else None
+        if _index is None:
+            return None
+        if _index.version != version:
+            _index.catch_up()
+            _index.version = version
+        return _index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def autos_changed():
+    """Авто добавлены или изменены: процессы дочитают их при следующем обращении к индексу."""
+    bump_version('similar', 'all')
+
+
+def autos_removed(pks):
+    pks = list(pks)
+
+    def remove():
+        if _index is not None:
+            _index.remove(pks)
+    transaction.on_commit(remove)
+    bump_version('similar', 'all')
+
+
+def similar_autos(auto, k, queryset=None):
+    """Ближайшие соседи авто объектами queryset (по умолчанию с двигателем и коробкой для карточек)."""
+    return similar_to([auto.pk], k, queryset)[auto.pk]
+
+
+def similar_to(pks, k, queryset=None):
+    """{pk: [соседи]} для пачки авто — один kNN и одна выборка по id на всех."""
+    index = get_index()
+    if index is None:
+        return {pk: [] for pk in pks}
+    if queryset is None:
+        queryset = Auto.objects.select_related('engine', 'transmission')
+    # с запасом: сосед мог быть удалён в другом процессе и ещё числиться в индексе
+    neighbours = index.neighbours(pks, k + 2)
+    ids = list({pk for found in neighbours.values() for pk, _ in found})
+    if not ids:
+        return {pk: [] for pk in pks}
+    objects = {(row['pk'] if isinstance(row, dict) else row.pk): row for row in fetch_by_ids(queryset, ids)}
+    return {pk: [objects[other] for other, _ in found if other in objects][:k] for pk, found in neighbours.items()}
@@ -0,0 +1,67 @@
+import math
+
+# Относительная погрешность квантилей: 1% от значения
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+
+
+class QuantileSketch:
+    """
+    Логарифмическая гистограмма в духе DDSketch: значение v > 0 попадает в корзину ceil(log_gamma(v)),
+    нули считаются отдельно. Корзины — просто счётчики, поэтому скетчи складываются и вычитаются
+    точно (merge с sign=-1), а квантиль не дальше RELATIVE_ACCURACY от настоящего значения.
+    """
+
+    def __init__(self, buckets=None, zeros=0):
+        self.buckets = dict(buckets or {})
+        self.zeros = zeros
+
+    @classmethod
+    def from_json(cls, data):
+        data = data or {}
+        return cls({int(index): count for index, count in data.get('b', {}).items()}, data.get('z', 0))
+
+    def to_json(self):
+        return {'z': self.zeros, 'b': {str(index): count for index, count in sorted(self.buckets.items())}}
+
+    @property
+    def count(self):
+        return self.zeros + sum(self.buckets.values())
+
+    def add(self, value, weight=1):
+        if value is None:
+            return
+        if value <= 0:
+            self.zeros += weight
+            return
+        index = math.ceil(math.log(value) / LOG_GAMMA)
+        count = self.buckets.get(index, 0) + weight
+        if count:
+            self.buckets[index] = count
+        else:
+            del self.buckets[index]
+
+    def merge(self, other, sign=1):
+        self.zeros += sign * other.zeros
+        for index, count in other.buckets.items():
+            total = self.buckets.get(index, 0) + sign * count
+            if total:
+                self.buckets[index] = total
+            else:
+                self.buckets.pop(index, None)
+
+    def quantile(self, q):
+        total = self.count
+        if total <= 0:
+            return None
+        rank = q * (total - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if rank < seen:
+                # середина корзины (gamma^(i-1), gamma^i] в относительной мере
+                return round(2 * GAMMA ** index / (GAMMA + 1))
+        return round(2 * GAMMA ** max(self.buckets) / (GAMMA + 1))
@@ -0,0 +1,61 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+
+from .models import Auto, SlugCounter
+
+
+def seed_counters(bases):
+    """Начальные значения счётчиков по уже существующим слагам — один запрос на все базы."""
+    prefixes = Q()
+    for base in bases:
+        prefixes |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+    seeds = dict.fromkeys(bases, -1)
+    for slug in Auto.objects.filter(prefixes).values_list('slug', flat=True):
+        if slug in seeds:
+            seeds[slug] = max(seeds[slug], 0)
+            continue
+        base, _, suffix = slug.rpartition('-')
+        if base in seeds and suffix.isdigit():
+            seeds[base] = max(seeds[base], int(suffix))
+    return seeds
+
+
+def reserve(bases):
+    """Атомарно сдвигает счётчики на нужное число слагов и возвращает выданные слаги по порядку."""
+    counts = Counter(bases)
+    with transaction.atomic():
+        existing = set(SlugCounter.objects.filter(base__in=counts).values_list('base', flat=True))
+        new = [base for base in counts if base not in existing]
+        if new:
+            seeds = seed_counters(new)
+            # параллельный процесс мог создать счётчик раньше нас — тогда берём его значение
+            SlugCounter.objects.bulk_create([SlugCounter(base=base, last=seeds[base]) for base in new],
+                                            ignore_conflicts=True)
+        SlugCounter.objects.filter(base__in=counts).update(
+            last=F('last') + Case(*[When(base=base, then=Value(n)) for base, n in counts.items()]))
+        lasts = dict(SlugCounter.objects.filter(base__in=counts).values_list('base', 'last'))
+
+    next_number = {base: lasts[base] - n + 1 for base, n in counts.items()}
+    slugs = []
+    for base in bases:
+        number = next_number[base]
+        next_number[base] += 1
+        slugs.append(base if number == 0 else f'{base}-{number}')
+    return slugs
+
+
+def allocate_slugs(bases):
+    """
+    Уникальные слаги для списка базовых слагов за постоянное число запросов.
+    Слаги, занятые вручную (например, через форму), перевыдаются следующим номером.
+    """
+    slugs = reserve(bases)
+    while True:
+        taken = set(Auto.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+        clashes = [i for i, slug in enumerate(slugs) if slug in taken]
+        if not clashes:
+            return slugs
+        for i, slug in zip(clashes, reserve([bases[i] for i in clashes])):
+            slugs[i] = slug
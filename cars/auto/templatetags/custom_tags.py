@@ -1,8 +1,29 @@
 from django import template
 
+from ..fragments import render_auto_cards
+
 register = template.Library()
 
 @register.filter
 def get_item(dictionary, key):
     """Возвращает элемент словаря по ключу."""
-    return dictionary.get(key)
\ No newline at end of file
+    return dictionary.get(key)
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    """Текущий query string с заменёнными параметрами (пустое значение удаляет параметр)."""
+    query = context['request'].GET.copy()
+    query.pop('page', None)
+    for key, value in kwargs.items():
+        if value in (None, ''):
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return '?' + query.urlencode() if query else '?'
+
+
+
+@register.simple_tag(takes_context=True)
+def auto_cards(context, autos):
+    """Карточки авто из кэша фрагментов (ключ — id авто и версии авто/двигателя/коробки)."""
+    return render_auto_cards(autos, context['request'])
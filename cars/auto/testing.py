@@ -0,0 +1,29 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+# Бэкенд тот же, что в проде; вместо Redis — LocMemCache, так что тесты от Redis не зависят
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'auto.cache_backend.TwoTierCache',
+        'OPTIONS': {
+            'REMOTE': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests'},
+            'LOCAL_MAX_ENTRIES': 5000,
+            'LOCAL_TIMEOUT': 5,
+            'FAILURE_THRESHOLD': 3,
+            'RECOVERY_TIMEOUT': 30,
+        },
+    }
+}
+
+
+class CarsTestRunner(DiscoverRunner):
+    """DiscoverRunner с кэшем TEST_CACHES на всё время прогона."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.caches_override = override_settings(CACHES=TEST_CACHES)
+        self.caches_override.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.caches_override.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,1430 @@
-from django.test import TestCase
+import base64
+import gzip
+import hashlib
+import io
+import json
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import replace
+from unittest import mock, skipUnless
+from datetime import timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlsplit
 
-      # Create your tests here.
+import requests
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.db.models.signals import pre_save
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache_backend import TwoTierCache
+from .columnar import pa
+from .fragments import get_versions, render_auto_cards, version_key
+from .filters import SORT_KEYS, AutoFilter
+from .extract import Listing, available_extractors, extract_listings
+from .http_client import HttpClient
+from .ingest import DromIngester, HostLimiter
+from .jobs import STALE_AFTER, claim_next_job, enqueue_crawl, enqueue_parse, run_worker
+from .catalog_stats import reconcile_stats
+from .models import (Auto, CatalogStat, Category, Comment, Engine, FetchState, ParseJob, PriceAggregate, PriceRun,
+                     Review, Transmission, Truck)
+from .page_cache import CATALOG_VERSION
+from .parse_from_drom import parse_listings, save_autos
+from .price_history import aggregate_prices, price_history, record_observations
+from .review_stats import rebuild_review_stats
+from .search import SearchResults, rebuild_index
+from .serializers import AutoSerializer
+from .sketch import RELATIVE_ACCURACY, QuantileSketch
+from .signals import stats_before_save
+from .similar import LOOKUPS, SimilarIndex, get_index, np, reset_index
+from .slugs import allocate_slugs
+
+TESTDATA = Path(__file__).resolve().parent / 'testdata'
+
+
+def make_jpeg():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), 'gray').save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def create_auto(slug, **fields):
+    engine = Engine.objects.get_or_create(title='V6', defaults={'power': 200})[0]
+    transmission = Transmission.objects.get_or_create(transmission_type='0')[0]
+    values = dict(title=slug, slug=slug, engine=engine, transmission=transmission,
+                  drive='0', safety_rating=1, fuel_type='бензин')
+    values.update(fields)
+    return Auto.objects.create(**values)
+
+
+class StubDromServer:
+    """Локальный HTTP-сервер, который отдаёт сохранённые страницы Drom и фото."""
+
+    def __init__(self, pages, failures=None):
+        self.pages = pages
+        # путь -> сколько раз подряд ответить 503
+        self.failures = dict(failures or {})
+        self.image = make_jpeg()
+        self.requests = []
+        self.connections = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                stub.requests.append(self.path)
+                stub.connections.add(self.client_address)
+                headers = {}
+                if stub.failures.get(self.path):
+                    stub.failures[self.path] -= 1
+                    # не send_error: тот закрывает соединение, а проверяем и повтор по keep-alive
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                if self.path in stub.pages:
+                    html = (TESTDATA / stub.pages[self.path]).read_text(encoding='utf-8')
+                    body = html.replace('https://s.auto.drom.ru', stub.base_url).encode('utf-8')
+                    content_type = 'text/html; charset=utf-8'
+                    headers['ETag'] = '"{}"'.format(hashlib.md5(body).hexdigest())
+                    if self.headers.get('If-None-Match') == headers['ETag']:
+                        self.send_response(304)
+                        self.send_header('Content-Length', '0')
+                        self.end_headers()
+                        return
+                elif self.path.endswith('.jpg'):
+                    body, content_type = stub.image, 'image/jpeg'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class HttpClientTests(TestCase):
+    def test_retries_server_errors_and_reuses_connections(self):
+        client = HttpClient(BACKOFF=0.01, RETRIES=3)
+        with StubDromServer({'/lexus/': 'drom_lexus.html'}, failures={'/lexus/': 2}) as stub:
+            response = client.get(f'{stub.base_url}/lexus/')
+            for _ in range(3):
+                client.get(f'{stub.base_url}/photo.jpg')
+        client.close()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stub.requests.count('/lexus/'), 3)
+        # keep-alive: все шесть запросов ушли по одному соединению
+        self.assertEqual(len(stub.connections), 1)
+        stats = client.stats()[urlsplit(stub.base_url).netloc]
+        self.assertEqual(stats['requests'], 6)
+        self.assertEqual(stats['retries'], 2)
+        self.assertEqual(stats['errors'], {503: 2})
+
+    def test_gives_up_after_retries(self):
+        client = HttpClient(BACKOFF=0.01, RETRIES=1)
+        with StubDromServer({}, failures={'/lexus/': 5}) as stub:
+            response = client.get(f'{stub.base_url}/lexus/')
+        client.close()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(stub.requests, ['/lexus/', '/lexus/'])
+
+
+class MediaRootMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+
+class DromIngesterTests(MediaRootMixin, TestCase):
+    def test_ingest_page_from_stub_server(self):
+        with StubDromServer({'/lexus/': 'drom_lexus.html'}) as stub:
+            autos = DromIngester(concurrency=4, host_delay=0, batch_size=2).run([stub.base_url + '/lexus/'])
+
+        # У последнего объявления нет фото — его пропускаем, как и раньше
+        self.assertEqual(len(autos), 3)
+        self.assertEqual(Auto.objects.count(), 3)
+        rx = Auto.objects.get(url='https://moscow.drom.ru/lexus/rx300/51234567.html')
+        self.assertEqual((rx.title, rx.production_year, rx.price, rx.mileage), ('Lexus RX300', 2001, 950000, 250000))
+        self.assertEqual(rx.drive, '2')
+        self.assertEqual(rx.engine.power, 201)
+        self.assertTrue(rx.image.name.endswith('.jpg'))
+        self.assertEqual(sum(path.endswith('.jpg') for path in stub.requests), 3)
+
+    def test_known_listings_are_not_downloaded_again(self):
+        with StubDromServer({'/lexus/': 'drom_lexus.html'}) as stub:
+            DromIngester(host_delay=0).run([stub.base_url + '/lexus/'])
+            stub.requests.clear()
+            autos = DromIngester(host_delay=0).run([stub.base_url + '/lexus/'])
+
+        self.assertEqual(autos, [])
+        self.assertEqual(stub.requests, ['/lexus/'])
+        self.assertEqual(Auto.objects.count(), 3)
+
+    def test_same_page_twice_is_saved_once(self):
+        with StubDromServer({'/lexus/': 'drom_lexus.html', '/lexus/page2/': 'drom_lexus.html'}) as stub:
+            DromIngester(host_delay=0).run([stub.base_url + '/lexus/', stub.base_url + '/lexus/page2/'])
+
+        self.assertEqual(Auto.objects.count(), 3)
+
+
+class BrandCrawlTests(MediaRootMixin, TestCase):
+    pages = {'/lexus/': 'drom_lexus.html', '/lexus/page2/': 'drom_lexus_page2.html',
+             '/lexus/page3/': 'drom_lexus.html', '/lexus/page4/': 'drom_lexus_page2.html'}
+
+    def run_crawl(self, stub, job):
+        with mock.patch('auto.ingest.DROM_BASE_URL', stub.base_url), mock.patch('auto.ingest.HostLimiter') as limiter:
+            limiter.side_effect = lambda per_host, delay: HostLimiter(per_host, 0)
+            run_worker(once=True)
+        job.refresh_from_db()
+        return job
+
+    def test_crawl_stops_at_known_listings(self):
+        with StubDromServer(self.pages) as stub:
+            job = self.run_crawl(stub, enqueue_crawl(['lexus']))
+
+        # третья страница целиком из известных объявлений — дальше не идём
+        pages = [path for path in stub.requests if not path.endswith('.jpg')]
+        self.assertEqual(pages, ['/lexus/', '/lexus/page2/', '/lexus/page3/'])
+        self.assertEqual(job.status, ParseJob.DONE)
+        self.assertEqual(job.checkpoint, {'lexus': {'page': 4, 'done': True}})
+        self.assertEqual((job.pages_done, job.listings_seen, job.result_count), (3, 12, 6))
+        self.assertGreater(job.pages_per_sec, 0)
+        self.assertEqual(Auto.objects.count(), 6)
+
+    def test_interrupted_crawl_resumes_from_checkpoint(self):
+        job = enqueue_crawl(['lexus'])
+        ParseJob.objects.filter(pk=job.pk).update(
+            status=ParseJob.RUNNING, checkpoint={'lexus': {'page': 2, 'done': False}},
+            time_heartbeat=timezone.now() - STALE_AFTER - timedelta(minutes=1))
+        with StubDromServer(self.pages) as stub:
+            job = self.run_crawl(stub, job)
+
+        # первая страница не запрашивается; её объявления впервые встречаются на третьей,
+        # а четвёртая повторяет уже сохранённую вторую — там обход и заканчивается
+        pages = [path for path in stub.requests if not path.endswith('.jpg')]
+        self.assertEqual(pages, ['/lexus/page2/', '/lexus/page3/', '/lexus/page4/'])
+        self.assertEqual(job.status, ParseJob.DONE)
+        self.assertEqual(job.checkpoint, {'lexus': {'page': 5, 'done': True}})
+        self.assertEqual(Auto.objects.count(), 6)
+
+    def test_network_failure_leaves_job_resumable(self):
+        get = HttpClient.get
+
+        def unreachable_page2(client, url, **kwargs):
+            if url.endswith('/lexus/page2/'):
+                raise requests.ConnectionError('connection reset')
+            return get(client, url, **kwargs)
+
+        with StubDromServer(self.pages) as stub, mock.patch.object(HttpClient, 'get', unreachable_page2):
+            job = self.run_crawl(stub, enqueue_crawl(['lexus']))
+        self.assertEqual(job.status, ParseJob.FAILED)
+        self.assertEqual(job.checkpoint, {'lexus': {'page': 2, 'done': False}})
+        self.assertEqual((job.pages_done, Auto.objects.count()), (1, 3))
+
+        with StubDromServer(self.pages) as stub, mock.patch('auto.ingest.DROM_BASE_URL', stub.base_url):
+            call_command('crawl_drom', '--resume', str(job.pk), stdout=io.StringIO())
+        job.refresh_from_db()
+        pages = [path for path in stub.requests if not path.endswith('.jpg')]
+        self.assertEqual(pages, ['/lexus/page2/', '/lexus/page3/'])
+        self.assertEqual((job.status, job.error), (ParseJob.DONE, ''))
+        self.assertEqual(job.checkpoint, {'lexus': {'page': 4, 'done': True}})
+        self.assertEqual((job.pages_done, Auto.objects.count()), (3, 6))
+
+    def test_command_job_is_never_claimed_by_workers(self):
+        seen = {}
+
+        def fake_run_job(job):
+            seen['status'] = ParseJob.objects.get(pk=job.pk).status
+            seen['claimed'] = claim_next_job()
+            ParseJob.objects.filter(pk=job.pk).update(status=ParseJob.DONE)
+            job.refresh_from_db()
+            return job
+
+        with mock.patch('auto.management.commands.crawl_drom.run_job', fake_run_job):
+            call_command('crawl_drom', 'lexus', stdout=io.StringIO())
+        self.assertEqual(seen, {'status': ParseJob.RUNNING, 'claimed': None})
+
+    def test_resume_refuses_live_job(self):
+        job = enqueue_crawl(['lexus'])
+        ParseJob.objects.filter(pk=job.pk).update(status=ParseJob.RUNNING, time_heartbeat=timezone.now())
+        with mock.patch('auto.management.commands.crawl_drom.run_job') as run:
+            with self.assertRaisesMessage(CommandError, 'is running in another process'):
+                call_command('crawl_drom', '--resume', str(job.pk), stdout=io.StringIO())
+            # воркер успел забрать задачу между чтением и захватом
+            with mock.patch('auto.management.commands.crawl_drom.claim_job', return_value=False):
+                ParseJob.objects.filter(pk=job.pk).update(status=ParseJob.FAILED)
+                with self.assertRaisesMessage(CommandError, 'was taken by another process'):
+                    call_command('crawl_drom', '--resume', str(job.pk), stdout=io.StringIO())
+        run.assert_not_called()
+
+    def test_writer_failure_fails_job(self):
+        with StubDromServer(self.pages) as stub, self.assertLogs('auto.jobs', 'ERROR'), \
+                mock.patch('auto.ingest.save_autos', side_effect=RuntimeError('disk full')):
+            job = self.run_crawl(stub, enqueue_crawl(['lexus', 'mercedes-benz']))
+        self.assertEqual((job.status, job.error), (ParseJob.FAILED, 'disk full'))
+        # пустая выдача второй марки записалась, страница lexus — нет: --resume начнёт её заново
+        self.assertNotIn('lexus', job.checkpoint)
+        self.assertEqual(Auto.objects.count(), 0)
+
+
+class DromSyncTests(MediaRootMixin, TestCase):
+    def test_sync_updates_only_changed_listings(self):
+        with StubDromServer({'/lexus/': 'drom_lexus.html'}) as stub:
+            url = stub.base_url + '/lexus/'
+            self.assertEqual(len(DromIngester(host_delay=0, sync=True).run([url])), 3)
+            self.assertTrue(FetchState.objects.get(url=url).etag)
+            is250 = Auto.objects.get(title='Lexus IS250')
+
+            # страница не менялась — сервер отвечает 304, больше ничего не качаем
+            stub.requests.clear()
+            self.assertEqual(DromIngester(host_delay=0, sync=True).run([url]), [])
+            self.assertEqual(stub.requests, ['/lexus/'])
+
+            # у RX300 упала цена, у IS250 сменилось фото
+            stub.pages['/lexus/'] = 'drom_lexus_updated.html'
+            stub.requests.clear()
+            updated = DromIngester(host_delay=0, sync=True).run([url])
+
+        self.assertEqual(sorted(auto.title for auto in updated), ['Lexus IS250', 'Lexus RX300'])
+        self.assertEqual(stub.requests, ['/lexus/', '/i24/c/photos/fullsize/lexus/is250/lexus_is250_2.jpg'])
+        self.assertEqual(Auto.objects.get(title='Lexus RX300').price, 899000)
+        is250_after = Auto.objects.get(title='Lexus IS250')
+        self.assertTrue(is250_after.image_url.endswith('lexus_is250_2.jpg'))
+        self.assertNotEqual(is250_after.image.name, is250.image.name)
+        self.assertEqual(Auto.objects.count(), 3)
+        # в истории цен у RX300 две серии, у NX200 — одна, продлённая повторным наблюдением (304 не считается)
+        rx_runs = list(PriceRun.objects.filter(auto__title='Lexus RX300').values_list('price', flat=True))
+        self.assertEqual(rx_runs, [950000, 899000])
+        self.assertEqual(PriceRun.objects.get(auto__title='Lexus NX200').observations, 2)
+
+    def test_plain_run_does_not_touch_known_listings(self):
+        with StubDromServer({'/lexus/': 'drom_lexus.html'}) as stub:
+            DromIngester(host_delay=0).run([stub.base_url + '/lexus/'])
+            stub.pages['/lexus/'] = 'drom_lexus_updated.html'
+            self.assertEqual(DromIngester(host_delay=0).run([stub.base_url + '/lexus/']), [])
+
+        self.assertEqual(Auto.objects.get(title='Lexus RX300').price, 950000)
+        self.assertFalse(FetchState.objects.exists())
+
+
+class PriceHistoryTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(title='Кроссоверы', slug='crossovers')
+        self.auto = create_auto('lexus-rx300-2001', title='Lexus RX300', price=1000, mileage=10,
+                                category=self.category)
+
+    def test_only_changes_are_stored(self):
+        self.auto.title = 'Lexus RX300 AWD'
+        self.auto.save()
+        self.auto.price = 900
+        self.auto.save()
+        self.auto.save()
+        record_observations([self.auto])  # выгрузка снова увидела объявление
+
+        runs = list(price_history(self.auto))
+        self.assertEqual([(run.price, run.observations) for run in runs], [(1000, 1), (900, 2)])
+        self.assertEqual(runs[0].until, runs[1].since)
+        self.assertIsNone(runs[1].until)
+
+    def test_form_saves_do_not_depend_on_stats_snapshot(self):
+        pre_save.disconnect(stats_before_save, sender=Auto)
+        self.addCleanup(pre_save.connect, stats_before_save, sender=Auto)
+        self.auto.title = 'Lexus RX300 AWD'
+        self.auto.save()
+        self.auto.mileage = 20
+        self.auto.save()
+        self.assertEqual([(run.mileage, run.observations) for run in price_history(self.auto)], [(10, 1), (20, 1)])
+
+    def test_raw_saves_are_not_observations(self):
+        self.auto.price = 800
+        self.auto.save_base(raw=True)
+        self.assertEqual([run.price for run in price_history(self.auto)], [1000])
+
+    def test_range_query_for_one_car(self):
+        day = timezone.now() - timedelta(days=30)
+        PriceRun.objects.filter(auto=self.auto).update(since=day)
+        for offset, price in ((10, 950), (20, 900)):
+            self.auto.price = price
+            record_observations([self.auto], when=day + timedelta(days=offset))
+
+        window = price_history(self.auto, day + timedelta(days=12), day + timedelta(days=15))
+        self.assertEqual([run.price for run in window], [950])
+        self.assertEqual([run.price for run in price_history(self.auto, start=day + timedelta(days=15))], [950, 900])
+
+    def test_daily_and_weekly_medians(self):
+        for i, price in enumerate((2000, 3000)):
+            create_auto(f'lexus-rx300-{i}', title='Lexus RX300', price=price, category=self.category)
+        today = timezone.localdate()
+        aggregate_prices(PriceAggregate.DAY, today)
+        aggregate_prices(PriceAggregate.WEEK, today)
+
+        self.client.force_login(User.objects.create_user('driver'))
+        day = self.client.get(reverse('price_aggregates'), {'model': 'Lexus RX300'}).json()
+        self.assertEqual(day['results'], [{'start': today.isoformat(), 'median': 2000, 'count': 3}])
+        week = self.client.get(reverse('price_aggregates'), {'category': 'crossovers', 'period': 'week'}).json()
+        self.assertEqual([(row['median'], row['count']) for row in week['results']], [(2000, 3)])
+
+        prices = self.client.get(reverse('car_prices', kwargs={'auto_slug': 'lexus-rx300-2001'})).json()
+        self.assertEqual([run['price'] for run in prices['runs']], [1000])
+
+    def test_price_change_within_period_counts_once(self):
+        create_auto('lexus-rx300-2', title='Lexus RX300', price=3000, category=self.category)
+        self.auto.price = 5000
+        self.auto.save()
+        aggregate_prices(PriceAggregate.DAY, timezone.localdate())
+
+        # у авто две серии за день, в медиану идёт цена на конец дня
+        aggregate = PriceAggregate.objects.get(kind=PriceAggregate.MODEL, key='Lexus RX300')
+        self.assertEqual((aggregate.median, aggregate.count), (4000, 2))
+
+
+class ExtractTests(TestCase):
+    def test_full_page_keeps_only_cards(self):
+        listings = extract_listings((TESTDATA / 'drom_lexus_full.html').read_text(encoding='utf-8'), 'bs4')
+
+        # рекламная вставка, меню и скрипты страницы — не объявления
+        self.assertEqual(len(listings), 20)
+        first = listings[0]
+        self.assertIsInstance(first, Listing)
+        self.assertEqual((first.title, first.engine_title, first.engine_power, first.transmission_type),
+                         ('Lexus RX350', '3.5 л', 249, '0'))
+        self.assertEqual(first.drive, '0')
+        self.assertEqual(listings[7].engine_power, 0)
+        self.assertIsNone(listings[12].img_url)
+
+    def test_backends_agree(self):
+        for fixture in sorted(TESTDATA.glob('drom_*.html')):
+            html = fixture.read_text(encoding='utf-8')
+            expected = extract_listings(html, 'bs4')
+            for backend in available_extractors():
+                with self.subTest(fixture=fixture.name, backend=backend):
+                    self.assertEqual(extract_listings(html, backend), expected)
+
+    def test_unavailable_backend(self):
+        with self.assertRaises(ValueError):
+            extract_listings('<html></html>', 'html5lib')
+
+
+class SaveAutosTests(MediaRootMixin, TestCase):
+    def make_batch(self, count):
+        record = parse_listings((TESTDATA / 'drom_lexus.html').read_text(encoding='utf-8'))[0]
+        image = make_jpeg()
+        return [(replace(record, url=f'{record.url}?copy={i}'), image) for i in range(count)]
+
+    def test_query_count_does_not_grow_with_batch(self):
+        save_autos(self.make_batch(1))
+        # Engine/Transmission, счётчик слага и срезы статистики уже есть — число запросов не зависит от размера пачки
+        with self.assertNumQueries(18):
+            save_autos(self.make_batch(5)[1:])
+        with self.assertNumQueries(18):
+            save_autos(self.make_batch(30)[5:])
+
+        slugs = list(Auto.objects.values_list('slug', flat=True))
+        self.assertEqual(len(slugs), 30)
+        self.assertEqual(len(set(slugs)), 30)
+
+    def test_known_urls_are_skipped(self):
+        batch = self.make_batch(3)
+        self.assertEqual(len(save_autos(batch)), 3)
+        self.assertEqual(save_autos(batch), [])
+        self.assertEqual(Auto.objects.count(), 3)
+
+
+class AllocateSlugsTests(TestCase):
+    def test_continues_after_existing_suffixes(self):
+        for slug in ['ford-focus-2012', 'ford-focus-2012-1', 'ford-focus-2012-5', 'ford-focus-2012-sport']:
+            create_auto(slug)
+        self.assertEqual(allocate_slugs(['ford-focus-2012', 'ford-mondeo-2015', 'ford-focus-2012']),
+                         ['ford-focus-2012-6', 'ford-mondeo-2015', 'ford-focus-2012-7'])
+        self.assertEqual(allocate_slugs(['ford-focus-2012']), ['ford-focus-2012-8'])
+
+    def test_query_count_is_constant(self):
+        allocate_slugs(['lexus-is250-2008'])
+        with self.assertNumQueries(6):
+            allocate_slugs(['lexus-is250-2008'] * 50)
+
+    def test_skips_slugs_taken_manually(self):
+        allocate_slugs(['lexus-is250-2008'])
+        create_auto('lexus-is250-2008-1')
+        self.assertEqual(allocate_slugs(['lexus-is250-2008']), ['lexus-is250-2008-2'])
+
+
+class ParseJobTests(MediaRootMixin, TestCase):
+    def test_worker_runs_queued_job(self):
+        with StubDromServer({'/lexus/': 'drom_lexus.html'}) as stub:
+            job = enqueue_parse([stub.base_url + '/lexus/'])
+            self.assertEqual(job.status, ParseJob.QUEUED)
+            run_worker(once=True)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ParseJob.DONE)
+        self.assertEqual((job.pages_done, job.pages_total, job.result_count), (1, 1, 3))
+        self.assertEqual(Auto.objects.count(), 3)
+
+    def test_view_enqueues_without_parsing(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.post(reverse('parse_from_drom'), {'brand': 'lexus', 'max_pages': 2},
+                                    HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 202)
+        job = ParseJob.objects.get(pk=response.json()['job_id'])
+        self.assertEqual((job.status, job.brands, job.max_pages), (ParseJob.QUEUED, ['lexus'], 2))
+
+        status = self.client.get(response.json()['status_url'], HTTP_ACCEPT='application/json').json()
+        self.assertEqual((status['status'], status['result_count']), ('queued', 0))
+
+    def test_browser_gets_status_page(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertContains(self.client.get(reverse('main_page')), 'Выгрузить с Drom')
+        response = self.client.post(reverse('parse_from_drom'), follow=True)
+        job = ParseJob.objects.get()
+        self.assertRedirects(response, reverse('parse_job', kwargs={'pk': job.pk}))
+        self.assertContains(response, f'Выгрузка с Drom #{job.pk}')
+        self.assertContains(response, 'queued')
+
+    def test_only_staff_can_enqueue_with_post(self):
+        self.assertEqual(self.client.post(reverse('parse_from_drom')).status_code, 302)
+        self.client.force_login(User.objects.create_user('driver'))
+        self.assertNotContains(self.client.get(reverse('main_page')), 'Выгрузить с Drom')
+        self.assertEqual(self.client.post(reverse('parse_from_drom')).status_code, 302)
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        self.assertEqual(self.client.get(reverse('parse_from_drom')).status_code, 405)
+        self.assertFalse(ParseJob.objects.exists())
+
+
+class ReviewStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('driver', password='secret')
+        self.client.force_login(self.user)
+        self.auto = create_auto('lexus-rx300-2001')
+
+    def stats(self):
+        self.auto.refresh_from_db()
+        return self.auto.review_count, self.auto.avg_score, self.auto.max_score
+
+    def test_stats_follow_review_views(self):
+        url = reverse('create_review', kwargs={'auto_slug': self.auto.slug})
+        self.client.post(url, {'text': 'ok', 'score': 6})
+        self.client.post(url, {'text': 'great', 'score': 9})
+        self.assertEqual(self.stats(), (2, 7.5, 9))
+
+        best = Review.objects.get(score=9)
+        self.client.post(reverse('update_review', kwargs={'pk': best.pk}), {'text': 'meh', 'score': 4})
+        self.assertEqual(self.stats(), (2, 5.0, 6))
+
+        self.client.post(reverse('delete_review', kwargs={'pk': best.pk}))
+        self.assertEqual(self.stats(), (1, 6.0, 6))
+        self.client.post(reverse('delete_review', kwargs={'pk': Review.objects.get().pk}))
+        self.assertEqual(self.stats(), (0, 0.0, 0))
+
+    def test_rebuild_matches_reviews(self):
+        Review.objects.create(auto=self.auto, user=self.user, text='a', score=3)
+        Review.objects.create(auto=self.auto, user=self.user, text='b', score=8)
+        create_auto('lexus-is250-2008')
+        self.assertEqual(rebuild_review_stats(), 2)
+        self.assertEqual(self.stats(), (2, 5.5, 8))
+
+
+@override_settings(SIMILAR_INDEX_PATH=None)
+class DetailAutoQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('driver', password='secret')
+        self.client.force_login(self.user)
+        self.auto = create_auto('lexus-rx300-2001')
+        # без снимка индекса панель похожих пуста и каталог не читает
+        reset_index()
+
+    def add_reviews(self, count, comments=3):
+        for i in range(count):
+            author = User.objects.create_user(f'reviewer-{Review.objects.count()}')
+            review = Review.objects.create(auto=self.auto, user=author, text='text', score=i % 10)
+            for j in range(comments):
+                commenter = User.objects.create_user(f'commenter-{Comment.objects.count()}')
+                Comment.objects.create(review=review, user=commenter, text='comment')
+
+    def get_detail(self, **params):
+        return self.client.get(reverse('detail_auto', kwargs={'auto_slug': self.auto.slug}), params)
+
+    def test_query_count_does_not_depend_on_reviews(self):
+        # сессия, пользователь, ключи авто для ETag, авто, COUNT отзывов, отзывы с авторами, комментарии с авторами
+        self.add_reviews(2)
+        with self.assertNumQueries(7):
+            self.get_detail()
+        self.add_reviews(18, comments=5)
+        with self.assertNumQueries(7):
+            response = self.get_detail()
+        self.assertContains(response, 'commenter-')
+
+    def test_reviews_are_paginated(self):
+        self.add_reviews(25, comments=0)
+        self.assertEqual(len(self.get_detail().context['reviews']), 20)
+        self.assertEqual(len(self.get_detail(reviews_page=2).context['reviews']), 5)
+
+
+class RenditionTests(MediaRootMixin, TestCase):
+    def test_ingested_autos_get_renditions(self):
+        record = parse_listings((TESTDATA / 'drom_lexus.html').read_text(encoding='utf-8'))[0]
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), 'gray').save(buffer, 'JPEG')
+        auto = save_autos([(record, buffer.getvalue())])[0]
+
+        self.assertEqual([width for width, _ in auto.renditions['jpeg']], [320, 640])
+        self.assertEqual([width for width, _ in auto.renditions['webp']], [320, 640, 800])
+        self.assertIn('_w320.webp 320w', auto.webp_srcset)
+        self.assertTrue(auto.jpeg_srcset.endswith(f'{auto.image.url} 800w'))
+        for _, name in auto.renditions['webp']:
+            self.assertTrue(auto.image.storage.exists(name))
+
+    def test_uploaded_image_gets_renditions(self):
+        auto = create_auto('lexus-rx300-2001')
+        auto.image.save('upload.jpg', ContentFile(make_jpeg()))
+        auto.refresh_from_db()
+        self.assertTrue(auto.has_renditions())
+        self.assertEqual(auto.renditions['width'], 64)
+
+    def test_command_resets_cached_cards(self):
+        auto = create_auto('lexus-rx300-2001')
+        auto.image.save('upload.jpg', ContentFile(make_jpeg()), save=False)
+        Auto.objects.filter(pk=auto.pk).update(image=auto.image.name)  # фото без копий, как до миграции
+        keys = [version_key('auto', auto.pk), CATALOG_VERSION]
+        before = get_versions(keys)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('build_renditions', '--workers', '1', stdout=io.StringIO())
+
+        auto.refresh_from_db()
+        self.assertTrue(auto.has_renditions())
+        after = get_versions(keys)
+        self.assertTrue(all(after[key] != before[key] for key in keys))
+
+
+class AutoCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/')
+        self.request.user = User.objects.create_user('driver')
+        self.autos = [create_auto(f'lexus-rx300-{i}', price=100 * i) for i in range(10)]
+
+    def render(self):
+        return render_auto_cards(Auto.objects.select_related('engine', 'transmission'), self.request)
+
+    def test_second_render_comes_from_cache(self):
+        first = self.render()
+        with self.assertTemplateNotUsed('auto/auto_card.html'):
+            self.assertEqual(self.render(), first)
+
+    def test_edits_invalidate_cards(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            auto = Auto.objects.get(pk=self.autos[0].pk)
+            auto.price = 123456
+            auto.save()
+        self.assertIn('Цена: 123456', self.render())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            engine = Engine.objects.get()
+            engine.power = 999
+            engine.save()
+        self.assertEqual(self.render().count('Мощность: 999'), 10)
+
+
+class CatalogImportExportTests(TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        category = Category.objects.create(title='Sedan', slug='sedan')
+        create_auto('lexus-is250-2008', title='Lexus IS250', price=1350000, mileage=180000, category=category)
+        create_auto('lexus-lx570-2012', title='Lexus LX570', price=4100000,
+                    engine=Engine.objects.create(title='5.7 л', power=367))
+
+    def export(self, name):
+        call_command('export_autos', str(self.tmp / name), stderr=io.StringIO())
+        return self.tmp / name
+
+    def test_round_trip(self):
+        for name in ('autos.csv', 'autos.jsonl.gz'):
+            with self.subTest(name=name):
+                dump = self.export(name)
+                rows = {auto.slug: auto for auto in Auto.objects.select_related('engine', 'category')}
+                Auto.objects.all().delete()
+
+                call_command('import_autos', str(dump), '--batch-size', '1', stdout=io.StringIO())
+                for slug, auto in rows.items():
+                    imported = Auto.objects.select_related('engine', 'category').get(slug=slug)
+                    self.assertEqual((imported.title, imported.price, imported.mileage, imported.engine_id,
+                                      imported.category_id), (auto.title, auto.price, auto.mileage, auto.engine_id,
+                                                              auto.category_id))
+                # импорт идёт мимо post_save — поиск и история цен обновляются им самим
+                self.assertEqual(SearchResults('LX570').count(), 1)
+                self.assertEqual(PriceRun.objects.filter(auto__slug='lexus-is250-2008').count(), 1)
+
+    def test_existing_and_bad_rows(self):
+        dump = self.tmp / 'autos.csv'
+        dump.write_text(self.export('all.csv').read_text(encoding='utf-8') +
+                        ',Lexus ES250,,,,,,,,,,не число,,,,,,,,\n'
+                        ',Lexus ES250,suv,2.5 л,200,,,,,2019,2500000,,,,,,,,,\n', encoding='utf-8')
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_autos', str(dump), stdout=stdout, stderr=stderr)
+
+        self.assertIn('Imported 1 autos, skipped 2 existing, rejected 1', stdout.getvalue())
+        self.assertIn('Row 3', stderr.getvalue())
+        es = Auto.objects.get(title='Lexus ES250')
+        self.assertEqual((es.slug, es.category.slug, es.engine.power), ('lexus-es250-2019', 'suv', 200))
+
+    def test_stdout_stays_open(self):
+        buffer = io.BytesIO()
+        stdout = io.TextIOWrapper(buffer, encoding='utf-8')
+        with mock.patch('sys.stdout', stdout):
+            call_command('export_autos', '-', '--format', 'jsonl', stderr=io.StringIO())
+        self.assertFalse(stdout.closed)
+        stdout.write('after export\n')
+        stdout.flush()
+        lines = buffer.getvalue().decode().splitlines()
+        self.assertEqual(sorted(json.loads(line)['slug'] for line in lines[:-1]),
+                         ['lexus-is250-2008', 'lexus-lx570-2012'])
+        self.assertEqual(lines[-1], 'after export')
+
+
+class ColumnarExportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('analyst'))
+        create_auto('lexus-is250-2008', price=1350000, mileage=180000, drive='1',
+                    category=Category.objects.create(title='Sedan', slug='sedan'))
+        create_auto('lexus-lx570-2012', price=4100000, fuel_type='дизель')
+
+    def decode(self, data):
+        lines = [json.loads(line) for line in gzip.decompress(data).decode().splitlines()]
+        names = [column['name'] for column in lines[0]['schema']]
+        dictionaries = {}
+        rows = []
+        for batch in lines[1:]:
+            for name, values in batch['dictionaries'].items():
+                dictionaries.setdefault(name, []).extend(values)
+            for i in range(batch['rows']):
+                row = {name: batch['columns'][name][i] for name in names}
+                for name, values in dictionaries.items():
+                    row[name] = values[row[name]] if row[name] is not None else None
+                rows.append(row)
+        return rows
+
+    def test_ndjson_endpoint(self):
+        response = self.client.get(reverse('car_export'), {'type': 'ndjson'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = self.decode(b''.join(response.streaming_content))
+        self.assertEqual([(row['slug'], row['price'], row['drive'], row['fuel_type'], row['category']) for row in rows],
+                         [('lexus-is250-2008', 1350000, '1', 'бензин', 'sedan'),
+                          ('lexus-lx570-2012', 4100000, '0', 'дизель', None)])
+
+    def test_command_sends_dictionary_deltas(self):
+        path = Path(tempfile.mkdtemp()) / 'autos.ndjson.gz'
+        self.addCleanup(shutil.rmtree, path.parent)
+        call_command('export_columnar', str(path), '--chunk-size', '1', stdout=io.StringIO())
+        batches = [json.loads(line) for line in gzip.decompress(path.read_bytes()).decode().splitlines()[1:]]
+        # категория и двигатель впервые встречаются в первом батче, во втором словари не повторяются
+        self.assertEqual(batches[0]['dictionaries']['category'], ['sedan'])
+        self.assertNotIn('category', batches[1]['dictionaries'])
+        self.assertEqual([row['slug'] for row in self.decode(path.read_bytes())],
+                         ['lexus-is250-2008', 'lexus-lx570-2012'])
+
+    @skipUnless(pa, 'pyarrow is not installed')
+    def test_arrow_endpoint(self):
+        response = self.client.get(reverse('car_export'), {'type': 'arrow'})
+        table = pa.ipc.open_stream(b''.join(response.streaming_content)).read_all()
+        self.assertEqual(table.column('price').to_pylist(), [1350000, 4100000])
+        self.assertEqual(table.column('fuel_type').to_pylist(), ['бензин', 'дизель'])
+
+    def test_unknown_type(self):
+        self.assertEqual(self.client.get(reverse('car_export'), {'type': 'xlsx'}).status_code, 400)
+
+
+class CatalogStatsTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('driver'))
+        self.sedan = Category.objects.create(title='Sedan', slug='sedan')
+        create_auto('lexus-is250-2008', price=1350000, mileage=180000, production_year=2008, category=self.sedan)
+        create_auto('lexus-gs300-2008', price=1100000, mileage=210000, production_year=2008, category=self.sedan)
+        create_auto('lexus-lx570-2012', price=4100000, mileage=90000, production_year=2012, fuel_type='дизель')
+
+    def snapshot(self):
+        return list(CatalogStat.objects.values_list('dimension', 'key', 'count', 'price_sketch', 'mileage_sketch'))
+
+    def test_sketch_accuracy_and_subtraction(self):
+        values = list(range(1000, 2001000, 1000))
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        for q in (0.25, 0.5, 0.75):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), exact * RELATIVE_ACCURACY)
+
+        half = QuantileSketch()
+        for value in values[1000:]:
+            half.add(value)
+        sketch.merge(half, -1)
+        expected = QuantileSketch()
+        for value in values[:1000]:
+            expected.add(value)
+        self.assertEqual(sketch.to_json(), expected.to_json())
+
+    def test_incremental_updates_match_full_rebuild(self):
+        auto = Auto.objects.get(slug='lexus-gs300-2008')
+        auto.price, auto.production_year = 1250000, 2009
+        auto.save()
+        Truck.objects.create(title='Hino', slug='hino-500-2015', engine=auto.engine, transmission=auto.transmission,
+                             safety_rating=1, price=3000000, production_year=2015, load_capacity=8000)
+        Auto.objects.get(slug='lexus-lx570-2012').delete()
+        save_autos([(parse_listings((TESTDATA / 'drom_lexus.html').read_text(encoding='utf-8'))[0], make_jpeg())])
+        self.sedan.delete()
+
+        incremental = self.snapshot()
+        self.assertEqual(reconcile_stats(), (len(incremental), 0))
+        self.assertEqual(self.snapshot(), incremental)
+        self.assertEqual(CatalogStat.objects.get(dimension=CatalogStat.ALL).count, 4)
+        self.assertFalse(CatalogStat.objects.filter(dimension=CatalogStat.FUEL, key='дизель').exists())
+
+    def test_api_reads_summaries(self):
+        with self.assertNumQueries(4):  # сессия, пользователь, CatalogStat, названия категорий
+            data = self.client.get(reverse('catalog_stats'), {'dimension': 'category'}).json()
+        self.assertEqual(list(data), ['category'])
+        self.assertEqual([(row['label'], row['count']) for row in data['category']], [('Без категории', 1), ('Sedan', 2)])
+        row = data['category'][1]
+        self.assertLessEqual(abs(row['median_price'] - 1100000), 1100000 * RELATIVE_ACCURACY)
+
+        years = self.client.get(reverse('catalog_stats'), {'dimension': 'year'}).json()['year']
+        self.assertEqual([(row['key'], row['count']) for row in years], [('2012', 1), ('2008', 2)])
+        self.assertEqual(self.client.get(reverse('catalog_stats'), {'dimension': 'color'}).status_code, 400)
+        self.assertContains(self.client.get(reverse('catalog_stats_page')), 'Sedan')
+
+
+@skipUnless(np, 'numpy is not installed')
+@override_settings(SIMILAR_INDEX_PATH=None)
+class SimilarAutosTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('driver'))
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.addCleanup(reset_index)
+        reset_index()
+        self.is250 = create_auto('lexus-is250-2008', price=1000000, mileage=180000, production_year=2008)
+        self.gs300 = create_auto('lexus-gs300-2009', price=1100000, mileage=170000, production_year=2009)
+        self.es350 = create_auto('lexus-es350-2011', price=1500000, mileage=120000, production_year=2011)
+        self.lx570 = create_auto('lexus-lx570-2020', price=9000000, mileage=10000, production_year=2020,
+                                 fuel_type='дизель', drive='2', weight=2700)
+
+    def test_neighbours_and_snapshot(self):
+        index = SimilarIndex.build()
+        expected = {self.is250.pk: [self.gs300.pk, self.es350.pk], self.lx570.pk: [self.es350.pk, self.gs300.pk]}
+        found = index.neighbours([self.is250.pk, self.lx570.pk], 2)
+        self.assertEqual({pk: [other for other, _ in found[pk]] for pk in found}, expected)
+
+        index.save(self.tmp)
+        loaded = SimilarIndex.load(self.tmp)
+        self.assertIsInstance(loaded.columns, np.memmap)
+        self.assertEqual(loaded.neighbours([self.is250.pk, self.lx570.pk], 2), found)
+
+    def test_changes_do_not_touch_arrays_in_use(self):
+        SimilarIndex.build().save(self.tmp)
+        index = SimilarIndex.load(self.tmp)
+        columns, norms = index.columns, index.norms
+        before = (np.array(columns), np.array(norms))
+        self.es350.price = 5000000
+        self.es350.save()
+        index.upsert(list(Auto.objects.filter(pk=self.es350.pk).values_list(*LOOKUPS)))
+        index.remove([self.gs300.pk])
+        # запрос, взявший ссылки до правки, досчитает по прежним массивам
+        self.assertTrue(np.array_equal(columns, before[0]))
+        self.assertTrue(np.array_equal(norms, before[1]))
+        self.assertFalse(np.array_equal(index.columns, before[0]))
+        self.assertEqual(len(index), 3)
+
+    def test_index_follows_changes(self):
+        SimilarIndex.build().save(self.tmp)
+        with self.settings(SIMILAR_INDEX_PATH=self.tmp):
+            self.assertEqual(len(get_index()), 4)
+            with self.captureOnCommitCallbacks(execute=True):
+                g63 = create_auto('mercedes-g63-2021', price=8500000, mileage=5000, production_year=2021,
+                                  fuel_type='дизель', drive='2', weight=2500)
+            self.assertEqual(get_index().neighbours([self.lx570.pk], 1)[self.lx570.pk][0][0], g63.pk)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                g63.delete()
+                self.es350.price, self.es350.mileage, self.es350.production_year = 1000000, 180000, 2008
+                self.es350.save()
+            index = get_index()
+            self.assertEqual(len(index), 4)
+            self.assertEqual([pk for pk, _ in index.neighbours([self.is250.pk], 2)[self.is250.pk]],
+                             [self.es350.pk, self.gs300.pk])
+            self.assertNotIn(g63.pk, [pk for pk, _ in index.neighbours([self.lx570.pk], 4)[self.lx570.pk]])
+
+    def test_no_neighbours_until_snapshot_is_built(self):
+        with self.settings(SIMILAR_INDEX_PATH=self.tmp), mock.patch.object(SimilarIndex, 'build') as build:
+            self.assertIsNone(get_index())
+            response = self.client.get(reverse('detail_auto', kwargs={'auto_slug': self.is250.slug}))
+            self.assertEqual(response.context['similar'], [])
+            data = self.client.get(reverse('car_similar'), {'slug': self.is250.slug}).json()
+            self.assertEqual(data['results'], {self.is250.slug: []})
+        build.assert_not_called()
+
+    def test_catch_up_is_bounded(self):
+        Auto.objects.update(time_update=timezone.now() - timedelta(days=1))
+        SimilarIndex.build().save(self.tmp)
+        with self.settings(SIMILAR_INDEX_PATH=self.tmp), mock.patch('auto.similar.CATCH_UP_LIMIT', 1):
+            get_index()
+            with self.captureOnCommitCallbacks(execute=True):
+                create_auto('mercedes-g63-2021', price=8500000, production_year=2021)
+                create_auto('mercedes-e200-2015', price=2000000, production_year=2015)
+            # из двух новых авто догоняется одно, самое свежее
+            with self.assertLogs('auto.similar', 'WARNING'):
+                index = get_index()
+            self.assertEqual(len(index), 5)
+            self.assertIn(Auto.objects.get(slug='mercedes-e200-2015').pk, index.positions)
+
+    def test_panel_and_batched_api(self):
+        SimilarIndex.build().save(self.tmp)
+        with self.settings(SIMILAR_INDEX_PATH=self.tmp):
+            self.check_panel_and_batched_api()
+
+    def check_panel_and_batched_api(self):
+        response = self.client.get(reverse('detail_auto', kwargs={'auto_slug': self.is250.slug}))
+        self.assertEqual([auto.slug for auto in response.context['similar']][:2], [self.gs300.slug, self.es350.slug])
+        self.assertContains(response, 'Похожие авто')
+
+        data = self.client.get(reverse('car_similar'), {'slug': [self.is250.slug, 'unknown'], 'k': 1,
+                                                        'fields': 'slug,price'}).json()
+        self.assertEqual(data['results'], {self.is250.slug: [{'slug': self.gs300.slug, 'price': 1100000}],
+                                           'unknown': None})
+        self.assertEqual(self.client.get(reverse('car_similar'), {'slug': self.is250.slug, 'k': 0}).status_code, 400)
+        with mock.patch('auto.views.similar_available', None):
+            self.assertEqual(self.client.get(reverse('car_similar'), {'slug': self.is250.slug}).status_code, 503)
+
+
+class ApiPaginationTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('driver'))
+        for i in range(7):
+            create_auto(f'lexus-{i}', price=1000 + i, title=f'Lexus "{i}" — седан')
+        # часть авто с одинаковым временем создания: порядок внутри — по id
+        Auto.objects.filter(slug__in=['lexus-2', 'lexus-3', 'lexus-4']).update(time_create=timezone.now())
+        self.expected = list(Auto.objects.order_by('-time_create', '-pk').values_list('slug', flat=True))
+
+    def page(self, **params):
+        response = self.client.get(reverse('car_list'), {'fields': 'slug', **params})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['slug'] for row in data['results']], data['next_cursor']
+
+    def test_cursor_walks_whole_catalog(self):
+        slugs, cursor, pages = [], None, 0
+        while True:
+            page, cursor = self.page(limit=3, **({'cursor': cursor} if cursor else {}))
+            slugs += page
+            pages += 1
+            if cursor is None:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(slugs, self.expected)
+
+    def test_next_cursor_is_null_at_the_end(self):
+        self.assertIsNone(self.page(limit=7)[1])
+        self.assertIsNotNone(self.page(limit=6)[1])
+        _, cursor = self.page(limit=6)
+        self.assertEqual(self.page(limit=6, cursor=cursor), ([self.expected[-1]], None))
+
+    def test_invalid_cursor_and_limit(self):
+        bad_cursors = ['not a cursor', base64.urlsafe_b64encode(b'no-separator').decode(),
+                       base64.urlsafe_b64encode(b'yesterday|1').decode()]
+        for cursor in bad_cursors:
+            self.assertEqual(self.client.get(reverse('car_list'), {'cursor': cursor}).status_code, 400, cursor)
+        for limit in ('ten', '0', '-3'):
+            self.assertEqual(self.client.get(reverse('car_list'), {'limit': limit}).status_code, 400, limit)
+
+    def test_streamed_catalog_is_valid_json(self):
+        with mock.patch('auto.views.API_STREAM_CHUNK', 2):
+            response = self.client.get(reverse('car_list'))
+            body = b''.join(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        rows = json.loads(body)
+        self.assertEqual([row['slug'] for row in rows], self.expected)
+        self.assertEqual(rows[0]['title'], Auto.objects.get(slug=self.expected[0]).title)
+
+        Auto.objects.all().delete()
+        self.assertEqual(json.loads(b''.join(self.client.get(reverse('car_list')).streaming_content)), [])
+
+
+class ApiFieldsetTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('driver'))
+        category = Category.objects.create(title='Sedan', slug='sedan')
+        create_auto('lexus-is250-2008', price=1350000, category=category)
+        create_auto('lexus-lx570-2012', price=4100000)
+
+    def test_default_output_matches_serializer(self):
+        expected = AutoSerializer(Auto.objects.order_by('-time_create', '-pk'), many=True).data
+        page = self.client.get(reverse('car_list'), {'limit': 10}).json()['results']
+        streamed = b''.join(self.client.get(reverse('car_list')).streaming_content)
+        self.assertEqual(page, [dict(row) for row in expected])
+        self.assertEqual(json.loads(streamed), page)
+
+    def test_only_requested_columns_are_selected(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse('car_list'), {'limit': 1, 'fields': 'title,price,slug'}).json()
+        self.assertEqual(data['results'], [{'title': 'lexus-lx570-2012', 'price': 4100000, 'slug': 'lexus-lx570-2012'}])
+        self.assertFalse(any('"color"' in query['sql'] for query in queries))
+        # курсор работает и на проекции
+        data = self.client.get(reverse('car_list'), {'limit': 1, 'fields': 'slug', 'cursor': data['next_cursor']}).json()
+        self.assertEqual(data['results'], [{'slug': 'lexus-is250-2008'}])
+
+    def test_expand_relations(self):
+        rows = self.client.get(reverse('car_list'), {'limit': 10, 'fields': 'slug', 'expand': 'engine,category'}).json()
+        self.assertEqual(rows['results'][0]['category'], None)
+        self.assertEqual(rows['results'][1]['category']['slug'], 'sedan')
+        self.assertEqual(rows['results'][1]['engine'], {'id': Engine.objects.get().pk, 'title': 'V6', 'power': 200})
+
+        found = self.client.get(reverse('car_search'), {'q': 'lx570', 'fields': 'slug', 'expand': 'engine'}).json()
+        self.assertEqual(found['results'], [{'slug': 'lexus-lx570-2012', 'engine': rows['results'][0]['engine']}])
+
+    def test_unknown_field(self):
+        response = self.client.get(reverse('car_list'), {'limit': 10, 'fields': 'title,owner'})
+        self.assertEqual(response.status_code, 400)
+
+
+class AutoFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('driver'))
+        self.sedan = Category.objects.create(title='Седан', slug='sedan')
+        self.suv = Category.objects.create(title='Внедорожник', slug='suv-cars')
+        create_auto('camry-2018', price=200, category=self.sedan)
+        create_auto('rav4-2019', price=300, drive='2', category=self.suv)
+        create_auto('land-cruiser-2020', price=500, drive='2', fuel_type='дизель', category=self.suv)
+
+    def slugs(self, params, queryset=None):
+        auto_filter = AutoFilter(params)
+        return list(auto_filter.sorted(auto_filter.apply(queryset or Auto.objects.all())).values_list('slug', flat=True))
+
+    def test_facets_follow_active_filter(self):
+        facets = self.client.get(reverse('main_page'), {'drive': '2'}).context['facets']
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['drive'], {'0': 0, '1': 0, '2': 2})
+        self.assertEqual(facets['fuel']['дизель'], 1)
+        self.assertEqual(facets['category'], {'sedan': 0, 'suv-cars': 2})
+
+        facets = self.client.get(reverse('main_page'), {'drive': '2', 'fuel': 'бензин'}).context['facets']
+        self.assertEqual((facets['total'], facets['category']['suv-cars']), (1, 1))
+
+    def test_range_edges_are_inclusive(self):
+        self.assertEqual(self.slugs({'price_min': '300'}), ['land-cruiser-2020', 'rav4-2019'])
+        self.assertEqual(self.slugs({'price_max': '300'}), ['rav4-2019', 'camry-2018'])
+        self.assertEqual(self.slugs({'price_min': '300', 'price_max': '300'}), ['rav4-2019'])
+        self.assertEqual(self.slugs({'price_min': '600'}), [])
+
+    def test_sorting_is_stable_on_ties(self):
+        # одинаковые цена и время создания — порядок решает id
+        Auto.objects.update(price=100, mileage=0, time_create=timezone.now())
+        by_pk = list(Auto.objects.order_by('-pk').values_list('slug', flat=True))
+        for sort in SORT_KEYS:
+            self.assertEqual(self.slugs({'sort': sort}), by_pk, sort)
+        self.assertEqual(self.slugs({'sort': 'unknown'}), by_pk)
+
+    def test_sort_keys(self):
+        self.assertEqual(self.slugs({'sort': 'cheap'}), ['camry-2018', 'rav4-2019', 'land-cruiser-2020'])
+        self.assertEqual(self.slugs({'sort': 'expensive', 'drive': '2'}), ['land-cruiser-2020', 'rav4-2019'])
+
+    def test_pagination_links_keep_query_string(self):
+        for i in range(25):
+            create_auto(f'filler-car-{i}', price=1000 + i, drive='2')
+        response = self.client.get(reverse('main_page'), {'drive': '2', 'sort': 'cheap', 'page': 2})
+        self.assertContains(response, 'href="?drive=2&amp;sort=cheap&amp;page=1"')
+        self.assertContains(response, 'href="?drive=2&amp;sort=cheap&amp;page=3"')
+        # смена сортировки сохраняет фильтры и возвращает на первую страницу
+        self.assertContains(response, 'href="?drive=2&amp;sort=year"')
+
+
+class RangeFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('driver'))
+        strong = Engine.objects.create(title='V8', power=400)
+        create_auto('cheap-old-car', price=300000, mileage=200000, production_year=2005)
+        create_auto('fresh-middle-car', price=900000, mileage=30000, production_year=2020)
+        create_auto('strong-expensive-car', price=3000000, mileage=10000, production_year=2022, engine=strong)
+
+    def slugs(self, **params):
+        autos = self.client.get(reverse('main_page'), params).context['page_content']
+        return [slug for slug in ('cheap-old-car', 'fresh-middle-car', 'strong-expensive-car') if slug in autos]
+
+    def test_ranges_combine(self):
+        self.assertEqual(self.slugs(price_min=500000, price_max=1000000), ['fresh-middle-car'])
+        self.assertEqual(self.slugs(mileage_max=50000, year_min=2021), ['strong-expensive-car'])
+        self.assertEqual(self.slugs(power_min=300), ['strong-expensive-car'])
+        # мусор в параметрах игнорируется, как и у остальных фильтров
+        self.assertEqual(len(self.slugs(price_min='дёшево')), 3)
+
+    def test_api_uses_same_filters(self):
+        data = self.client.get(reverse('car_list'), {'limit': 10, 'power_max': 300}).json()
+        self.assertEqual([row['slug'] for row in data['results']], ['fresh-middle-car', 'cheap-old-car'])
+
+    def test_page_rows_are_loaded_by_id(self):
+        for i in range(15):
+            create_auto(f'filler-car-{i}', price=100000 + i)
+        response = self.client.get(reverse('main_page'), {'sort': 'cheap', 'page': 2})
+        self.assertEqual(response.status_code, 200)
+        page_content = response.context['page_content']
+        self.assertIn('/filler-car-10/', page_content)
+        self.assertNotIn('/filler-car-9/', page_content)
+        self.assertIn('/strong-expensive-car/', page_content)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('driver')
+        self.client.force_login(self.user)
+        self.auto = create_auto('lexus-rx300-2001', price=100)
+        # первый ответ ставит CSRF-cookie, а она входит в ETag страниц
+        self.client.get(reverse('main_page'))
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_api_answers_304_without_main_query(self):
+        url = reverse('car_list')
+        first = self.client.get(url, {'limit': 10})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.revalidate(url, first, limit=10).status_code, 304)
+        self.assertFalse(any('auto_auto' in query['sql'] for query in queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auto.price = 200
+            self.auto.save()
+        response = self.revalidate(url, first, limit=10)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['price'], 200)
+
+    def test_list_etag_depends_on_user(self):
+        url = reverse('main_page')
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        self.client.force_login(User.objects.create_user('passenger'))
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_detail_changes_with_comments(self):
+        url = reverse('detail_auto', kwargs={'auto_slug': self.auto.slug})
+        first = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        # новое авто может попасть в панель похожих — страница меняется
+        with self.captureOnCommitCallbacks(execute=True):
+            create_auto('lexus-is250-2008')
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+        review = Review.objects.create(auto=self.auto, user=self.user, text='ok', score=8)
+        second = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(review=review, user=self.user, text='+1')
+        self.assertEqual(self.revalidate(url, second).status_code, 200)
+
+
+class CatalogPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('driver')
+        self.client.force_login(self.user)
+        self.auto = create_auto('lexus-rx300-2001', price=100)
+
+    def test_main_page_is_cached_until_catalog_changes(self):
+        self.client.get(reverse('main_page'))
+        # только сессия и пользователь — списки берутся из кэша
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get(reverse('main_page')), 'Цена: 100 ')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.auto.price = 200
+            self.auto.save()
+        self.assertContains(self.client.get(reverse('main_page')), 'Цена: 200 ')
+
+    def test_header_is_rendered_per_user(self):
+        self.client.get(reverse('main_page'))
+        other = User.objects.create_user('passenger')
+        self.client.force_login(other)
+        response = self.client.get(reverse('main_page'))
+        self.assertContains(response, 'Привет, passenger!')
+        self.assertNotContains(response, 'Привет, driver!')
+
+    def test_query_string_is_part_of_key(self):
+        create_auto('lexus-is250-2008', drive='2')
+        self.assertEqual(len(self.client.get(reverse('main_page')).context['page_content'].split('card-title')), 3)
+        self.assertEqual(len(self.client.get(reverse('main_page'), {'drive': '2'})
+                             .context['page_content'].split('card-title')), 2)
+
+
+class SearchTests(MediaRootMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.rx = create_auto('lexus-rx300-2001', title='Lexus RX300')
+        self.is250 = create_auto('lexus-is250-2008', title='Lexus IS250',
+                                 engine=Engine.objects.create(title='2GR-FSE', power=208))
+
+    def titles(self, query):
+        return [auto.title for auto in SearchResults(query)[:10]]
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.titles('lex rx'), ['Lexus RX300'])
+        self.assertEqual(self.titles('2gr'), ['Lexus IS250'])
+        self.assertEqual(SearchResults('lexus').count(), 2)
+        # кавычки и операторы FTS во вводе не ломают запрос
+        self.assertEqual(self.titles('"rx300" OR *'), [])
+
+    def test_index_follows_changes(self):
+        self.rx.title = 'Toyota Harrier'
+        self.rx.save()
+        self.assertEqual(self.titles('harrier'), ['Toyota Harrier'])
+        self.assertEqual(self.titles('rx300'), [])
+
+        self.is250.engine.title = '4GR-FSE'
+        self.is250.engine.save()
+        self.assertEqual(self.titles('4gr'), ['Lexus IS250'])
+
+        self.is250.delete()
+        self.assertEqual(SearchResults('lexus').count(), 0)
+        self.assertEqual(rebuild_index(), 1)
+        self.assertEqual(self.titles('harrier'), ['Toyota Harrier'])
+
+    def test_ingested_autos_are_searchable(self):
+        record = parse_listings((TESTDATA / 'drom_lexus.html').read_text(encoding='utf-8'))[0]
+        save_autos([(replace(record, url=record.url + '?new'), make_jpeg())])
+        self.assertIn(record.title, self.titles(record.title))
+
+    def test_view_and_api(self):
+        self.client.force_login(User.objects.create_user('driver'))
+        response = self.client.get(reverse('search'), {'q': 'rx300'})
+        self.assertContains(response, 'Lexus RX300')
+        self.assertNotContains(response, 'Lexus IS250')
+
+        data = self.client.get(reverse('car_search'), {'q': 'lexus', 'limit': 1}).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(len(data['results']), 1)
+
+
+class FakeRedis:
+    """Минимальный Redis для pub/sub: publish и pubsub().listen()."""
+
+    def __init__(self):
+        self.subscribers = []
+
+    def publish(self, channel, message):
+        for subscribed, messages in list(self.subscribers):
+            if subscribed == channel:
+                messages.put({'type': 'message', 'data': message.encode()})
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+
+
+class FakePubSub:
+    def __init__(self, redis):
+        self.redis = redis
+        self.messages = queue.Queue()
+
+    def subscribe(self, channel):
+        self.redis.subscribers.append((channel, self.messages))
+
+    def listen(self):
+        while True:
+            yield self.messages.get()
+
+
+class FakeRedisCache(LocMemCache):
+    """Удалённый уровень для тестов: LocMemCache с pub/sub, который можно «уронить»."""
+    down = False
+    redis = None
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self.client = type('Client', (), {'get_client': staticmethod(lambda write=True: FakeRedisCache.redis)})
+
+    def check(self):
+        if FakeRedisCache.down:
+            raise ConnectionError('redis is down')
+
+    def get(self, *args, **kwargs):
+        self.check()
+        return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self.check()
+        return super().set(*args, **kwargs)
+
+    def add(self, *args, **kwargs):
+        self.check()
+        return super().add(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        self.check()
+        return super().incr(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.check()
+        return super().delete(*args, **kwargs)
+
+    def clear(self):
+        self.check()
+        return super().clear()
+
+
+class TwoTierCacheTests(TestCase):
+    def setUp(self):
+        FakeRedisCache.down = False
+        FakeRedisCache.redis = FakeRedis()
+        self.remote_location = uuid.uuid4().hex
+
+    def make_cache(self, **options):
+        params = {'OPTIONS': {
+            'REMOTE': {'BACKEND': 'auto.tests.FakeRedisCache', 'LOCATION': self.remote_location},
+            'LOCAL_TIMEOUT': 60,
+            'FAILURE_THRESHOLD': 2,
+            'RECOVERY_TIMEOUT': 0.05,
+            'CHANNEL': self.remote_location,
+            **options,
+        }}
+        # у каждого «процесса» свой LOCATION — значит, свой локальный уровень
+        return TwoTierCache(uuid.uuid4().hex, params)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 2
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_hot_keys_are_served_locally(self):
+        worker = self.make_cache()
+        worker.set('categories', ['sedan', 'suv'])
+        remote_calls = worker.stats()['remote_calls']
+        for _ in range(5):
+            self.assertEqual(worker.get('categories'), ['sedan', 'suv'])
+        stats = worker.stats()
+        self.assertEqual(stats['remote_calls'], remote_calls)
+        self.assertEqual(stats['local_hits'], 5)
+
+    def test_local_tier_is_bounded(self):
+        worker = self.make_cache(LOCAL_MAX_ENTRIES=3)
+        for i in range(10):
+            worker.set(f'key-{i}', i)
+        self.assertEqual(worker.stats()['local_entries'], 3)
+        self.assertEqual(worker.get('key-0'), 0)  # вытеснен локально, но остался в Redis
+
+    def test_bus_starts_on_first_remote_call(self):
+        worker = self.make_cache()
+        self.assertEqual(FakeRedisCache.redis.subscribers, [])
+        worker.get('anything')
+        self.wait_for(lambda: len(FakeRedisCache.redis.subscribers) == 1)
+
+    def test_writes_invalidate_other_workers(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set('price', 100)
+        self.assertEqual(second.get('price'), 100)
+        self.wait_for(lambda: len(FakeRedisCache.redis.subscribers) == 2)
+        first.set('price', 200)
+        self.wait_for(lambda: second.get('price') == 200)
+        first.incr('price')
+        self.wait_for(lambda: second.get('price') == 201)
+        first.delete('price')
+        self.wait_for(lambda: second.get('price') is None)
+
+    def test_falls_back_to_local_tier_when_redis_is_down(self):
+        worker = self.make_cache()
+        worker.set('version', 'before outage')
+        FakeRedisCache.down = True
+
+        worker.set('version', 'during outage')
+        worker.set('other', 1)
+        self.assertTrue(worker.stats()['circuit_open'])
+        errors = worker.stats()['remote_errors']
+        self.assertEqual(worker.get('version'), 'during outage')
+        worker.set('third', 3)
+        self.assertEqual(worker.stats()['remote_errors'], errors)
+        self.assertGreater(worker.stats()['short_circuited'], 0)
+        with self.assertRaises(ValueError):
+            worker.incr('missing')
+
+        # после восстановления ключи, записанные без Redis, удаляются там — старое значение не вернётся
+        FakeRedisCache.down = False
+        time.sleep(0.06)
+        worker.get('anything')
+        self.assertFalse(worker.stats()['circuit_open'])
+        self.assertIsNone(worker.remote.get('version'))
+
+
+class ConfiguredCacheTests(TestCase):
+    """Страницы через настроенный TwoTierCache, когда удалённый уровень отказывает."""
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('driver'))
+        self.auto = create_auto('lexus-rx300-2001', price=100)
+        self.backend = caches['default']
+        self.addCleanup(self.backend.shared.breaker.success)
+
+    def test_pages_survive_remote_outage(self):
+        self.assertIsInstance(self.backend, TwoTierCache)
+        self.assertContains(self.client.get(reverse('main_page')), 'Цена: 100 ')
+
+        def unavailable(*args, **kwargs):
+            raise ConnectionError('redis is down')
+
+        remote = mock.Mock(**{f'{name}.side_effect': unavailable for name in
+                              ('get', 'get_many', 'set', 'set_many', 'add', 'incr', 'delete', 'delete_many', 'clear')})
+        with mock.patch.object(self.backend, 'remote', remote), self.assertLogs('auto.cache_backend', 'WARNING'):
+            self.assertContains(self.client.get(reverse('main_page')), 'Цена: 100 ')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.auto.price = 200
+                self.auto.save()
+            # версии сдвигаются в локальном уровне — список и карточка не устаревают
+            self.assertContains(self.client.get(reverse('main_page')), 'Цена: 200 ')
+            stats = self.backend.stats()
+            self.assertTrue(stats['circuit_open'])
+            self.assertGreater(stats['short_circuited'], 0)
+
+        # Redis вернулся: ключи, записанные без него, удаляются там при первом удачном обращении
+        self.backend.shared.breaker.opened_at -= self.backend.shared.breaker.recovery_timeout
+        self.backend.get('probe')
+        self.assertFalse(self.backend.stats()['circuit_open'])
+        self.assertEqual(self.backend.shared.dirty, set())
@@ -18,9 +18,18 @@ urlpatterns = [
     path('review/<int:review_pk>/comment/', views.CreateComment.as_view(), name='create_comment'),
     path('comment/<int:pk>/update/', views.UpdateComment.as_view(), name='update_comment'),
     path('comment/<int:pk>/delete/', views.DeleteComment.as_view(), name='delete_comment'),
+    path('search/', views.SearchView.as_view(), name='search'),
     path('about', views.about, name='about_site'),
+    path('stats/', views.CatalogStatsView.as_view(), name='catalog_stats_page'),
     path('parse_auto', views.parse_from_drom, name="parse_from_drom"),
+    path('parse_auto/<int:pk>/', views.parse_job_status, name='parse_job'),
     path('api/cars/', views.car_list, name='car_list'),
+    path('api/cars/export/', views.car_export, name='car_export'),
+    path('api/search/', views.car_search, name='car_search'),
+    path('api/similar/', views.car_similar, name='car_similar'),
+    path('api/cars/<slug:auto_slug>/prices/', views.car_prices, name='car_prices'),
+    path('api/prices/', views.price_aggregates, name='price_aggregates'),
+    path('api/stats/', views.catalog_stats, name='catalog_stats'),
 ]
 
 
@@ -1,21 +1,38 @@
 import json
-from xml.etree.ElementTree import indent
+from datetime import timedelta
 
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse
+from django.db import transaction
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_date
 from django.shortcuts import render, get_object_or_404, redirect
-from django.urls import reverse_lazy
-from django.db.models import Q, Value, Max
-from django.views.generic import CreateView, ListView, UpdateView, DeleteView, DetailView
+from django.urls import reverse_lazy, reverse
+from django.views.generic import CreateView, ListView, UpdateView, DeleteView, DetailView, TemplateView
 from django.views.generic.base import View
+from django.contrib.admin.views.decorators import staff_member_required
+from django.views.decorators.http import condition, require_POST
 from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
+from rest_framework.exceptions import ParseError
 
-from .serializers import AutoSerializer
-from .models import Auto, Category, Review, Comment
+from .serializers import AutoFieldset
+from .catalog_stats import DIMENSIONS as STAT_DIMENSIONS, stats_table
+from .conditional import api_catalog_etag, auto_etag, catalog_etag
+from .columnar import FORMATS as EXPORT_FORMATS, available_formats, export_stream
+from .models import Auto, Category, Review, Comment, ParseJob, PriceAggregate, CatalogStat
 from .forms import ReviewForm, CommentForm
-from .parse_from_drom import parse_ford_page
+from .filters import AutoFilter
+from .pagination import IdFirstPaginationMixin, keyset_page
+from .jobs import enqueue_crawl
+from .loaders import load_auto, load_reviews
+from .page_cache import CatalogPageCacheMixin
+from .review_stats import review_added, review_changed, review_deleted
+from .price_history import local_midnight, price_history
+from .search import SearchResults
+from .similar import np as similar_available, similar_autos, similar_to
 
 
 # Create your views here.
@@ -49,25 +66,31 @@ class DeleteAuto(LoginRequiredMixin, DeleteView):
     slug_url_kwarg = 'auto_slug'
 
 
+SIMILAR_PANEL_SIZE = 6
+SIMILAR_MAX = 50
+SIMILAR_MAX_SLUGS = 20
+
+
+# Условный GET: 304 по ETag из версий в кэше, до основного запроса и рендеринга (см. conditional.py)
+@method_decorator(condition(etag_func=auto_etag), name='get')
 class DetailAuto(LoginRequiredMixin, DetailView):
     template_name = 'auto/detail_auto.html'
     slug_url_kwarg = 'auto_slug'
     context_object_name = 'auto'
 
     def get_object(self, queryset=None):
-        return get_object_or_404(Auto, slug=self.kwargs[self.slug_url_kwarg])
+        return load_auto(self.kwargs[self.slug_url_kwarg])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['form'] = ReviewForm()
+        context['reviews'] = load_reviews(self.object, self.request.GET.get('reviews_page'))
+        context['similar'] = similar_autos(self.object, SIMILAR_PANEL_SIZE)
         return context
 
 
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
-
-#@method_decorator(cache_page(60*5), name='dispatch')
-class MainPage(LoginRequiredMixin, ListView):
+@method_decorator(condition(etag_func=catalog_etag), name='get')
+class MainPage(LoginRequiredMixin, CatalogPageCacheMixin, IdFirstPaginationMixin, ListView):
     model = Auto
     template_name = 'auto/main_page.html'
     context_object_name = 'autos'
@@ -75,42 +98,52 @@ class MainPage(LoginRequiredMixin, ListView):
     paginate_by = 10
 
     def get_queryset(self):
-        return Auto.objects.all().select_related('transmission', 'engine')
+        self.auto_filter = AutoFilter(self.request.GET)
+        autos = self.auto_filter.apply(Auto.objects.select_related('transmission', 'engine'))
+        self.filtered_autos = autos
+        return self.auto_filter.sorted(autos)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        categories = Category.objects.all()
-        autos = Auto.objects.select_related('transmission', 'engine')
+        categories = list(Category.objects.all())
         context['categories'] = categories
-
-        category_autos = {}
-        for cat in categories:
-            category_autos[cat.slug] = autos.filter(category=cat)
-        context['category_autos'] = category_autos
-        context['filtered_by_tank'] = autos.order_by('-trunk_capacity')
-        context['safe'] = autos.filter(Q(wheel_size__gte=18) | Q(safety_rating__gte=5)).annotate(
-            descr=Value('Safe as fuck'))
-        context['4WD'] = autos.filter(Q(drive='2'))
-        context['automatic_transmission'] = autos.filter(transmission__transmission_type='0')
-        context['manual_transmission'] = autos.filter(transmission__transmission_type='1')
-        context['production_year'] = autos.all().order_by('-production_year')
-        context['score'] = autos.annotate(max_score=Max('reviews__score')).order_by('-max_score')
+        context['auto_filter'] = self.auto_filter
+        context['range_params'] = self.auto_filter.range_params()
+        context['facets'] = self.auto_filter.facets(self.filtered_autos, categories)
         return context
 
 
-
-class CategoryAuto(LoginRequiredMixin, ListView):
+@method_decorator(condition(etag_func=catalog_etag), name='get')
+class CategoryAuto(LoginRequiredMixin, CatalogPageCacheMixin, IdFirstPaginationMixin, ListView):
     model = Auto
     template_name = 'auto/category.html'
     context_object_name = 'autos'
     paginate_by = 5
 
     def get_queryset(self):
-        return Auto.objects.filter(category__slug=self.kwargs['cat_slug'])
+        auto_filter = AutoFilter(self.request.GET)
+        autos = Auto.objects.select_related('engine', 'transmission').filter(category__slug=self.kwargs['cat_slug'])
+        return auto_filter.sorted(auto_filter.apply(autos))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['category'] = Category.objects.get(slug=self.kwargs['cat_slug'])
+        context['category'] = get_object_or_404(Category, slug=self.kwargs['cat_slug'])
+        return context
+
+
+@method_decorator(condition(etag_func=catalog_etag), name='get')
+class SearchView(LoginRequiredMixin, CatalogPageCacheMixin, ListView):
+    template_name = 'auto/search.html'
+    context_object_name = 'autos'
+    paginate_by = 12
+
+    def get_queryset(self):
+        self.query = self.request.GET.get('q', '').strip()
+        return SearchResults(self.query)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
         return context
 
 
@@ -125,7 +158,10 @@ class CreateAutoReview(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.auto = self.auto
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            review_added(self.object)
+        return response
 
     def get_success_url(self):
         return reverse_lazy('detail_auto', kwargs={'auto_slug': self.auto.slug})
@@ -133,6 +169,7 @@ class CreateAutoReview(LoginRequiredMixin, CreateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['auto'] = self.auto
+        context['reviews'] = load_reviews(self.auto, self.request.GET.get('reviews_page'))
         return context
 
 
@@ -141,6 +178,17 @@ class UpdateReview(LoginRequiredMixin, UpdateView):
     form_class = ReviewForm
     template_name = 'auto/update_review.html'
 
+    def get_object(self, queryset=None):
+        review = super().get_object(queryset)
+        self.old_score = review.score
+        return review
+
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            review_changed(self.object, self.old_score)
+        return response
+
     def get_success_url(self):
         return reverse_lazy('detail_auto', kwargs={'auto_slug': self.object.auto.slug})
 
@@ -156,6 +204,12 @@ class DeleteReview(LoginRequiredMixin, DeleteView):
     model = Review
     template_name = 'auto/delete_review.html'
 
+    def form_valid(self, form):
+        with transaction.atomic():
+            response = super().form_valid(form)
+            review_deleted(self.object)
+        return response
+
     def get_success_url(self):
         return reverse_lazy('detail_auto', kwargs={'auto_slug': self.object.auto.slug})
 
@@ -197,21 +251,231 @@ class DeleteComment(LoginRequiredMixin, DeleteView):
         return reverse_lazy('detail_auto', kwargs={'auto_slug': self.object.review.auto.slug})
 
 
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+API_STREAM_CHUNK = 500
+
+
+def stream_autos(autos, fieldset):
+    """JSON-массив построчно: в памяти одновременно только один чанк iterator()."""
+    yield '[\n'
+    first = True
+    for auto in fieldset.project(autos).iterator(chunk_size=API_STREAM_CHUNK):
+        row = json.dumps(fieldset.to_dict(auto), ensure_ascii=False)
+        yield row if first else ',\n' + row
+        first = False
+    yield '\n]\n'
+
+
 @api_view(['GET'])
 @renderer_classes([JSONRenderer])
+@condition(etag_func=api_catalog_etag)
 def car_list(request):
-    autos = Auto.objects.select_related('engine', 'transmission')
-    serializer = AutoSerializer(autos, many=True)
-    json_data = json.dumps(serializer.data, indent=4, ensure_ascii=False)
-    # Возвращаем как чистый JSON (без интерфейса DRF)
-    return HttpResponse(json_data, content_type='application/json')
+    # Те же фильтры, что и у списков (?price_min=...&year_min=...); порядок фиксирован курсором.
+    # ?fields=/?expand= — только нужные колонки и связи (см. AutoFieldset)
+    fieldset = AutoFieldset(request.GET)
+    autos = AutoFilter(request.GET).apply(Auto.objects.all())
+    autos = autos.order_by('-time_create', '-pk')
+
+    # Постраничный режим по курсору: ?limit=...&cursor=...
+    if 'cursor' in request.GET or 'limit' in request.GET:
+        try:
+            limit = min(int(request.GET.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        except ValueError:
+            raise ParseError('Invalid limit')
+        if limit < 1:
+            raise ParseError('Invalid limit')
+        rows, next_cursor = keyset_page(fieldset.project(autos), request.GET.get('cursor'), limit)
+        data = {'results': [fieldset.to_dict(row) for row in rows], 'next_cursor': next_cursor}
+        return HttpResponse(json.dumps(data, ensure_ascii=False), content_type='application/json')
+
+    # Весь каталог — потоком, без сборки списка в памяти
+    return StreamingHttpResponse(stream_autos(autos, fieldset), content_type='application/json')
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+@condition(etag_func=api_catalog_etag)
+def car_export(request):
+    """Весь каталог колонками для аналитики: ?type=arrow (если есть pyarrow) или ?type=ndjson (gzip)."""
+    formats = available_formats()
+    fmt = request.GET.get('type', formats[0])
+    if fmt not in formats:
+        raise ParseError(f"Unsupported type, available: {', '.join(formats)}")
+    response = StreamingHttpResponse(export_stream(fmt), content_type=EXPORT_FORMATS[fmt])
+    if fmt == 'ndjson':
+        response['Content-Encoding'] = 'gzip'
+    response['Content-Disposition'] = f'attachment; filename="autos.{fmt}"'
+    return response
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+@condition(etag_func=api_catalog_etag)
+def car_search(request):
+    try:
+        limit = min(int(request.GET.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        raise ParseError('Invalid limit or offset')
+    if limit < 1 or offset < 0:
+        raise ParseError('Invalid limit or offset')
+    fieldset = AutoFieldset(request.GET)
+    results = SearchResults(request.GET.get('q', ''), fieldset.project(Auto.objects.all()))
+    rows = results[offset:offset + limit]
+    return Response({'count': results.count(), 'results': [fieldset.to_dict(row) for row in rows]})
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+@condition(etag_func=api_catalog_etag)
+def car_similar(request):
+    """Похожие авто для одного или нескольких: ?slug=a&slug=b&k=6, поля — как в ?fields=/?expand= списка."""
+    if similar_available is None:
+        return Response({'detail': 'Similar cars need numpy'}, status=503)
+    slugs = request.GET.getlist('slug')
+    if not slugs or len(slugs) > SIMILAR_MAX_SLUGS:
+        raise ParseError(f'Pass from 1 to {SIMILAR_MAX_SLUGS} slug parameters')
+    try:
+        k = int(request.GET.get('k', SIMILAR_PANEL_SIZE))
+    except ValueError:
+        raise ParseError('Invalid k')
+    if not 1 <= k <= SIMILAR_MAX:
+        raise ParseError('Invalid k')
+    fieldset = AutoFieldset(request.GET)
+    pks = dict(Auto.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+    found = similar_to(list(pks.values()), k, fieldset.project(Auto.objects.all()))
+    return Response({'results': {slug: [fieldset.to_dict(row) for row in found[pks[slug]]] if slug in pks else None
+                                 for slug in slugs}})
+
+
+PRICE_DEFAULT_PERIODS = 90
+PRICE_MAX_PERIODS = 366
+
+
+def date_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ParseError(f'Invalid {name}, expected YYYY-MM-DD')
+    return day
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def car_prices(request, auto_slug):
+    """История цены одного авто: серии с изменением цены относительно предыдущей."""
+    auto = get_object_or_404(Auto, slug=auto_slug)
+    start, end = date_param(request.GET, 'start'), date_param(request.GET, 'end')
+    runs = price_history(auto, start and local_midnight(start), end and local_midnight(end + timedelta(days=1)))
+    results, previous = [], None
+    for run in runs:
+        results.append({
+            'since': run.since, 'until': run.until, 'last_seen': run.last_seen,
+            'price': run.price, 'mileage': run.mileage, 'observations': run.observations,
+            'price_change': run.price - previous if previous is not None else 0,
+        })
+        previous = run.price
+    return Response({'slug': auto.slug, 'runs': results})
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def price_aggregates(request):
+    """Заранее посчитанные медианы: ?category=<slug> или ?model=<название>, period=day|week."""
+    period = request.GET.get('period', PriceAggregate.DAY)
+    if period not in dict(PriceAggregate.period_choices):
+        raise ParseError('Invalid period')
+    if request.GET.get('category'):
+        kind, key = PriceAggregate.CATEGORY, request.GET['category']
+    elif request.GET.get('model'):
+        kind, key = PriceAggregate.MODEL, request.GET['model']
+    else:
+        raise ParseError('category or model is required')
+
+    end = date_param(request.GET, 'end') or timezone.localdate()
+    start = date_param(request.GET, 'start') or end - timedelta(
+        days=PRICE_DEFAULT_PERIODS * (7 if period == PriceAggregate.WEEK else 1))
+    # Индекс (period, kind, key, start): чтение не зависит от длины истории
+    rows = (PriceAggregate.objects.filter(period=period, kind=kind, key=key, start__gte=start, start__lte=end)
+            .order_by('start').values('start', 'median', 'count')[:PRICE_MAX_PERIODS])
+    return Response({'period': period, kind: key, 'results': list(rows)})
+
+
+class CatalogStatsView(LoginRequiredMixin, TemplateView):
+    """Сводка каталога: читает только готовые строки CatalogStat, без прохода по авто."""
+    template_name = 'auto/stats.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        table = stats_table()
+        context['total'] = table[CatalogStat.ALL][0] if table[CatalogStat.ALL] else None
+        context['sections'] = [
+            ('По категориям', table[CatalogStat.CATEGORY]),
+            ('По топливу', table[CatalogStat.FUEL]),
+            ('По приводу', table[CatalogStat.DRIVE]),
+            ('По году выпуска', table[CatalogStat.YEAR]),
+        ]
+        return context
+
+
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def catalog_stats(request):
+    """Число авто и медианы цены/пробега по срезам; ?dimension=category|fuel_type|drive|year|all."""
+    dimensions = request.GET.getlist('dimension')
+    unknown = set(dimensions) - set(STAT_DIMENSIONS)
+    if unknown:
+        raise ParseError(f'Unknown dimension: {", ".join(sorted(unknown))}')
+    return Response(stats_table(dimensions))
+
+
+def wants_json(request):
+    """Клиент API просит JSON явно; браузер получает страницу."""
+    return 'application/json' in request.headers.get('Accept', '')
 
 
+@staff_member_required
+@require_POST
 def parse_from_drom(request):
-    url = "https://auto.drom.ru/lexus/"
-    # url2 = "https://auto.drom.ru/mercedes-benz/"
-    parse_ford_page(url)
-    return redirect('main_page')
+    # Сама выгрузка идёт в отдельном процессе: python manage.py parse_worker
+    # brand=lexus&brand=bmw — марки (по умолчанию DROM_BRANDS), max_pages=N — предел страниц на марку,
+    # sync=1 — инкрементальная синхронизация уже выгруженных объявлений
+    try:
+        max_pages = max(int(request.POST.get('max_pages', 0)), 0)
+    except ValueError:
+        max_pages = 0
+    job = enqueue_crawl(request.POST.getlist('brand'), sync=request.POST.get('sync') == '1', max_pages=max_pages)
+    status_url = reverse('parse_job', kwargs={'pk': job.pk})
+    if wants_json(request):
+        return JsonResponse({'job_id': job.pk, 'status_url': status_url}, status=202)
+    return redirect(status_url)
+
+
+@staff_member_required
+def parse_job_status(request, pk):
+    job = get_object_or_404(ParseJob, pk=pk)
+    if not wants_json(request):
+        return render(request, 'auto/parse_job.html', {'job': job})
+    return JsonResponse({
+        'job_id': job.pk,
+        'status': job.status,
+        'pages_total': job.pages_total,
+        'pages_done': job.pages_done,
+        'result_count': job.result_count,
+        'sync': job.sync,
+        'brands': job.brands,
+        'checkpoint': job.checkpoint,
+        'listings_seen': job.listings_seen,
+        'pages_per_sec': job.pages_per_sec,
+        'listings_per_sec': job.listings_per_sec,
+        'error': job.error,
+    })
 
 
 def about(request):
@@ -80,14 +80,41 @@ TEMPLATES = [
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": "redis://127.0.0.1:6379/1",  # 1 — номер базы Redis
+        # Локальный LRU в процессе + Redis; если Redis недоступен — работаем только с локальным уровнем
+        "BACKEND": "auto.cache_backend.TwoTierCache",
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "REMOTE": {
+                "BACKEND": "django_redis.cache.RedisCache",
+                "LOCATION": "redis://127.0.0.1:6379/1",  # 1 — номер базы Redis
+                "OPTIONS": {
+                    "CLIENT_CLASS": "django_redis.client.DefaultClient",
+                    "SOCKET_CONNECT_TIMEOUT": 0.2,
+                    "SOCKET_TIMEOUT": 0.2,
+                }
+            },
+            "LOCAL_MAX_ENTRIES": 5000,
+            "LOCAL_TIMEOUT": 5,
+            "FAILURE_THRESHOLD": 3,
+            "RECOVERY_TIMEOUT": 30,
         }
     }
 }
 
+# Исходящие запросы выгрузки (auto.http_client); не указанное берётся из auto.http_client.DEFAULTS
+DROM_HTTP = {
+    "PER_HOST": 8,
+    "RATE": 20.0,
+    "RETRIES": 4,
+    "BACKOFF": 0.5,
+}
+# Разбор выдачи Drom (auto.extract): "auto" — selectolax или lxml, если установлены, иначе "bs4"
+DROM_HTML_PARSER = "auto"
+# Снимок индекса похожих авто (auto.similar, нужен numpy): пишет manage.py build_similar_index
+SIMILAR_INDEX_PATH = BASE_DIR / 'similar_index'
+
+# manage.py test: тот же TwoTierCache, но удалённый уровень в памяти процесса (auto.testing)
+TEST_RUNNER = 'auto.testing.CarsTestRunner'
+
 WSGI_APPLICATION = 'cars.wsgi.application'
 
 